@@ -0,0 +1,3 @@
+"""
+Benchmarks for the bot's hot paths, run with ``python -m benchmarks``.
+"""
@@ -0,0 +1,246 @@
+"""
+Times the bot's hot paths against synthetic workloads of different sizes,
+writing the results as JSON so that runs can be compared.
+
+    python -m benchmarks --sizes 1000,100000,1000000 --output results.json
+
+The database is replaced with an in-process stand-in so that the numbers
+measure the bot's own work rather than Postgres.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+from datetime import timedelta
+import json
+import pathlib
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Awaitable, Callable
+
+from cogs import utils
+from cogs.information_commands import InformationCommands
+from cogs.utils.models.clock_in_batch import to_micros
+
+from .standin import StandInDatabase
+from .workload import Workload, generate_workload
+
+
+DISCORD_FILESIZE_LIMIT = 8 * 1024 * 1024
+
+
+def _time(function: Callable[[], Any], repeats: int) -> list[float]:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _time_async(function: Callable[[], Awaitable[Any]], repeats: int) -> list[float]:
+    async def run() -> list[float]:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            await function()
+            timings.append(time.perf_counter() - start)
+        return timings
+    return asyncio.run(run())
+
+
+def bench_from_row(workload: Workload, repeats: int) -> list[float]:
+    rows = workload.rows
+    return _time(lambda: [utils.ClockIn.from_row(row) for row in rows], repeats)
+
+
+def bench_format_timedelta(workload: Workload, repeats: int) -> list[float]:
+    durations = [
+        (row['clock_out'] or workload.end) - row['clock_in']
+        for row in workload.rows
+    ]
+    return _time(lambda: [utils.format_timedelta(i) for i in durations], repeats)
+
+
+def bench_export_aggregation(workload: Workload, repeats: int) -> list[float]:
+    rows = workload.micros_rows()
+
+    def run():
+        batch = utils.ClockInBatch(now=to_micros(workload.end))
+        batch.extend_rows(rows)
+        return utils.split_by_day(batch)
+    return _time(run, repeats)
+
+
+def bench_export_csv(workload: Workload, repeats: int) -> list[float]:
+    now = to_micros(workload.end)
+    closed = utils.ClockInBatch(now=now)
+    closed.extend_rows(i for i in workload.micros_rows() if i['clock_out'] is not None)
+    rollup = sorted(
+        (
+            {
+                'day': day,
+                'user_id': user_id,
+                'mask': mask,
+                'total_seconds': total.total_seconds(),
+            }
+            for (day, user_id, mask), total in utils.split_by_day(closed).items()
+        ),
+        key=lambda i: (i['day'], i['user_id'], i['mask']),
+    )
+    open_rows = [i for i in workload.micros_rows() if i['clock_out'] is None]
+
+    def router(query: str, _) -> list:
+        if "clock_daily_totals" in query:
+            return rollup
+        return open_rows
+    db = StandInDatabase(router)
+
+    async def run():
+        file = await utils.write_export_csv(
+            db,  # pyright: ignore
+            0,
+            workload.start,
+            workload.end + timedelta(days=1),
+        )
+        files = utils.prepare_export_files(
+            file,
+            "clockins.csv",
+            DISCORD_FILESIZE_LIMIT,
+        )
+        for i in files:
+            i.close()
+        file.close()
+    return _time_async(run, repeats)
+
+
+def bench_show_page(workload: Workload, repeats: int) -> list[float]:
+    guild_id, user_id = workload.heaviest_user()
+    rows = [
+        i for i in workload.rows
+        if i['guild_id'] == guild_id and i['user_id'] == user_id
+    ]
+    rows.sort(key=lambda i: (i['clock_in'], i['id']), reverse=True)
+    utils.OpenSessionIndex.load(
+        utils.ClockIn.from_row(i) for i in rows if i['clock_out'] is None
+    )
+
+    async def run():
+        now = to_micros(workload.end)
+        batch = utils.ClockInBatch.from_clock_ins(
+            (utils.ClockIn.from_row(i) for i in rows),
+            now=now,
+        )
+        page = [
+            utils.ClockIn.from_row(i)
+            for i in rows[:InformationCommands.SHOW_PAGE_SIZE]
+        ]
+        show_page = InformationCommands.render_show_page(
+            guild_id,
+            user_id,
+            page,
+            batch.total_by_mask(),
+            page=1,
+            has_newer=False,
+            has_older=len(rows) > len(page),
+        )
+        return await InformationCommands.build_show_page(show_page)
+    return _time_async(run, repeats)
+
+
+def bench_show_page_cached(workload: Workload, repeats: int) -> list[float]:
+    guild_id, user_id = workload.heaviest_user()
+    rows = [
+        i for i in workload.rows
+        if i['guild_id'] == guild_id and i['user_id'] == user_id
+    ]
+    rows.sort(key=lambda i: (i['clock_in'], i['id']), reverse=True)
+    batch = utils.ClockInBatch.from_clock_ins(
+        (utils.ClockIn.from_row(i) for i in rows),
+        now=to_micros(workload.end),
+    )
+    page = [
+        utils.ClockIn.from_row(i)
+        for i in rows[:InformationCommands.SHOW_PAGE_SIZE]
+    ]
+    show_page = InformationCommands.render_show_page(
+        guild_id,
+        user_id,
+        page,
+        batch.total_by_mask(),
+        page=1,
+        has_newer=False,
+        has_older=len(rows) > len(page),
+    )
+    utils.OpenSessionIndex.load(
+        utils.ClockIn.from_row(i) for i in rows if i['clock_out'] is None
+    )
+
+    async def run():
+        return await InformationCommands.build_show_page(show_page)
+    return _time_async(run, repeats)
+
+
+BENCHMARKS: dict[str, Callable[[Workload, int], list[float]]] = {
+    "clock_in.from_row": bench_from_row,
+    "format_timedelta": bench_format_timedelta,
+    "information_export.aggregation": bench_export_aggregation,
+    "information_export.csv_pipeline": bench_export_csv,
+    "information_show.build_page": bench_show_page,
+    "information_show.cached_page": bench_show_page_cached,
+}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS))
+    parser.add_argument("--output", type=pathlib.Path)
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(i) for i in args.sizes.split(",")):
+        workload = generate_workload(size, seed=args.seed)
+        for name, benchmark in BENCHMARKS.items():
+            if args.only and name not in args.only:
+                continue
+            timings = benchmark(workload, args.repeats)
+            result = {
+                "name": name,
+                "sessions": size,
+                "repeats": args.repeats,
+                "min_seconds": min(timings),
+                "median_seconds": statistics.median(timings),
+                "max_seconds": max(timings),
+            }
+            results.append(result)
+            print(
+                f"{name:<36} {size:>9} sessions  "
+                f"median {result['median_seconds'] * 1000:10.2f}ms",
+                file=sys.stderr,
+            )
+
+    output = {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "timestamp": time.time(),
+        },
+        "results": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(output, indent=4))
+    else:
+        print(json.dumps(output, indent=4))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
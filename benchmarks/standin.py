@@ -0,0 +1,89 @@
+"""
+An in-process stand-in for the parts of ``vbu.Database`` that the
+benchmarked code paths use, serving pre-built rows instead of querying
+Postgres.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Sequence
+
+
+__all__ = (
+    'StandInDatabase',
+)
+
+
+Router = Callable[[str, Sequence[Any]], list]
+
+
+class _Transaction:
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        return None
+
+
+class _Cursor:
+
+    def __init__(self, rows: list):
+        self._rows = rows
+        self._position = 0
+
+    async def fetch(self, count: int) -> list:
+        rows = self._rows[self._position:self._position + count]
+        self._position += count
+        return rows
+
+
+class _PreparedStatement:
+
+    def __init__(self, router: Router, query: str):
+        self._router = router
+        self._query = query
+
+    async def fetch(self, *args) -> list:
+        return self._router(self._query, args)
+
+    async def fetchrow(self, *args) -> Any:
+        rows = self._router(self._query, args)
+        return rows[0] if rows else None
+
+    async def cursor(self, *args) -> _Cursor:
+        return _Cursor(self._router(self._query, args))
+
+
+class _Connection:
+
+    def __init__(self, router: Router):
+        self._router = router
+
+    def transaction(self) -> _Transaction:
+        return _Transaction()
+
+    def is_in_transaction(self) -> bool:
+        return False
+
+    async def prepare(self, query: str) -> _PreparedStatement:
+        return _PreparedStatement(self._router, query)
+
+    async def cursor(self, query: str, *args) -> _Cursor:
+        return _Cursor(self._router(query, args))
+
+
+class StandInDatabase:
+    """
+    Answers queries by passing their text and arguments to a router function,
+    which returns the rows to give back.
+    """
+
+    def __init__(self, router: Router):
+        self._router = router
+        self.conn = _Connection(router)
+
+    async def call(self, query: str, *args) -> list:
+        return self._router(query, args)
+
+    __call__ = call
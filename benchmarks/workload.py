@@ -0,0 +1,146 @@
+"""
+A seeded generator for synthetic clock in data.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime as dt, timedelta
+import random
+import uuid
+
+
+__all__ = (
+    'Workload',
+    'generate_workload',
+)
+
+
+# Every generated clock in happens in the days leading up to this point
+WORKLOAD_END = dt(2024, 1, 1)
+
+
+@dataclass
+class Workload:
+    seed: int
+    guild_ids: list[int]
+    user_ids: dict[int, list[int]]
+    masks: dict[int, list[str]]
+    rows: list[dict] = field(default_factory=list)
+    start: dt = WORKLOAD_END
+    end: dt = WORKLOAD_END
+
+    def micros_rows(self) -> list[dict]:
+        """
+        Get the rows with their timestamps as microseconds since the epoch,
+        as returned by the ClockInBatch queries.
+        """
+
+        epoch = dt(1970, 1, 1)
+        one = timedelta(microseconds=1)
+        return [
+            {
+                'guild_id': row['guild_id'],
+                'user_id': row['user_id'],
+                'mask': row['mask'],
+                'clock_in': (row['clock_in'] - epoch) // one,
+                'clock_out': (
+                    None if row['clock_out'] is None
+                    else (row['clock_out'] - epoch) // one
+                ),
+            }
+            for row in self.rows
+        ]
+
+    def heaviest_user(self) -> tuple[int, int]:
+        """
+        Get the (guild ID, user ID) with the most clock ins.
+        """
+
+        counts: dict[tuple[int, int], int] = {}
+        for row in self.rows:
+            key = (row['guild_id'], row['user_id'])
+            counts[key] = counts.get(key, 0) + 1
+        return max(counts, key=counts.__getitem__)
+
+
+def generate_workload(
+        sessions: int,
+        *,
+        seed: int = 0,
+        guilds: int = 10,
+        users_per_guild: int = 200,
+        masks_per_guild: int = 8,
+        days: int = 90,
+        open_ratio: float = 0.01,
+        midnight_ratio: float = 0.1,
+        admin_ratio: float = 0.02) -> Workload:
+    """
+    Generate a deterministic set of clock in rows, shaped like those from
+    the ``clock_ins`` table.
+
+    Most clock ins are day shifts. A share of them cross midnight, a share
+    are still open, and a share are admin-managed durations (which start on
+    2000-01-01, and can be negative).
+    """
+
+    rng = random.Random(seed)
+    guild_ids = [rng.getrandbits(60) for _ in range(guilds)]
+    user_ids = {
+        guild_id: [rng.getrandbits(60) for _ in range(users_per_guild)]
+        for guild_id in guild_ids
+    }
+    masks = {
+        guild_id: [f"mask_{i}" for i in range(masks_per_guild)]
+        for guild_id in guild_ids
+    }
+    workload = Workload(seed, guild_ids, user_ids, masks)
+    workload.start = WORKLOAD_END - timedelta(days=days)
+    managed_start = dt(2000, 1, 1)
+
+    # Users can only have one open clock in per mask
+    open_keys: set[tuple[int, int, str]] = set()
+
+    for _ in range(sessions):
+        guild_id = rng.choice(guild_ids)
+        user_id = rng.choice(user_ids[guild_id])
+        mask = rng.choice(masks[guild_id])
+        kind = rng.random()
+        row_id = uuid.UUID(int=rng.getrandbits(128))
+
+        # Admin adjustments
+        if kind < admin_ratio:
+            seconds = rng.randint(-8 * 3600, 8 * 3600)
+            clock_in = managed_start
+            clock_out = managed_start + timedelta(seconds=seconds)
+
+        # Open clock ins
+        elif (
+                kind < admin_ratio + open_ratio
+                and (guild_id, user_id, mask) not in open_keys):
+            open_keys.add((guild_id, user_id, mask))
+            clock_in = WORKLOAD_END - timedelta(seconds=rng.randint(60, 12 * 3600))
+            clock_out = None
+
+        # Shifts that cross midnight
+        elif kind < admin_ratio + open_ratio + midnight_ratio:
+            day = workload.start + timedelta(days=rng.randrange(days - 1))
+            clock_in = day + timedelta(hours=rng.randint(18, 23), minutes=rng.randrange(60))
+            clock_out = clock_in + timedelta(hours=rng.randint(3, 10), minutes=rng.randrange(60))
+
+        # Normal shifts
+        else:
+            day = workload.start + timedelta(days=rng.randrange(days))
+            clock_in = day + timedelta(hours=rng.randint(6, 12), minutes=rng.randrange(60))
+            clock_out = clock_in + timedelta(hours=rng.randint(1, 8), minutes=rng.randrange(60))
+
+        workload.rows.append({
+            'id': row_id,
+            'guild_id': guild_id,
+            'user_id': user_id,
+            'mask': mask,
+            'clock_in': clock_in,
+            'clock_out': clock_out,
+        })
+
+    return workload
@@ -0,0 +1,166 @@
+from datetime import datetime as dt, timedelta
+import time
+from typing import Optional
+
+from aiohttp import web
+from discord.ext import vbu
+
+from cogs import utils
+
+
+class API(vbu.Cog[vbu.Bot]):
+    """
+    Serves guild information over HTTP alongside the bot, on the host and
+    port set in the ``[api]`` section of the config.
+    """
+
+    def __init__(self, bot: vbu.Bot):
+        super().__init__(bot)
+        self.runner: Optional[web.AppRunner] = None
+        config = bot.config.get("api", {})
+        if config.get("enabled", False):
+            self.bot.loop.create_task(self.start_server(
+                config.get("host", "127.0.0.1"),
+                config.get("port", 8080),
+            ))
+
+    def cog_unload(self):
+        if self.runner is not None:
+            self.bot.loop.create_task(self.runner.cleanup())
+            self.runner = None
+
+    async def start_server(self, host: str, port: int) -> None:
+        """
+        Start the HTTP server.
+        """
+
+        app = web.Application()
+        app.router.add_get("/api/information", self.get_information)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        self.logger.info("Serving the API on %s:%s", host, port)
+
+    @staticmethod
+    def is_not_modified(request: web.Request, etag: str) -> bool:
+        """
+        Check the request's If-None-Match header against the current ETag of
+        the export.
+        """
+
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is None:
+            return False
+        tags = [i.strip().removeprefix("W/") for i in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    async def get_information(self, request: web.Request) -> web.StreamResponse:
+        """
+        Stream a guild's export as a CSV file. Requests need the guild's API
+        key as a bearer token.
+
+        The ETag is a fingerprint of the daily totals that the export reads,
+        so clients polling with If-None-Match get a 304 until something in
+        the range changes. While anyone is clocked in, open time is measured
+        up until the start of the current minute, and the ETag changes each
+        minute. There's no Last-Modified, since writes don't commit in the
+        order that they're timestamped in.
+        """
+
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await self.build_information_response(request)
+            status = response.status
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            utils.Metrics.record(
+                "api",
+                "information",
+                time.perf_counter() - started,
+                error=status >= 500,
+            )
+
+    async def build_information_response(self, request: web.Request) -> web.StreamResponse:
+        """
+        The body of :meth:`get_information`.
+        """
+
+        # Check the parameters
+        try:
+            guild_id = int(request.query["guild_id"])
+        except (KeyError, ValueError):
+            raise web.HTTPBadRequest(text="A numeric guild_id is required.")
+        try:
+            if "end" in request.query:
+                end_at = dt.strptime(request.query["end"], "%Y-%m-%d") + timedelta(days=1)
+            else:
+                end_at = dt.combine(dt.utcnow().date(), dt.min.time()) + timedelta(days=1)
+            if "start" in request.query:
+                start_at = dt.strptime(request.query["start"], "%Y-%m-%d")
+            else:
+                start_at = end_at - timedelta(days=30)
+        except ValueError:
+            raise web.HTTPBadRequest(text="Dates need to be in the format YYYY-MM-DD.")
+        if start_at >= end_at:
+            raise web.HTTPBadRequest(text="The start date needs to be before the end date.")
+
+        # Get the API key
+        scheme, _, api_key = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not api_key:
+            raise web.HTTPUnauthorized(
+                headers={"WWW-Authenticate": "Bearer"},
+                text="An API key is required.",
+            )
+
+        # Everything is read from one snapshot so that the CSV matches the
+        # ETag that it's sent with
+        async with vbu.Database() as db:
+            async with db.conn.transaction(isolation="repeatable_read", readonly=True):
+
+                # Check the key
+                state = await utils.get_api_state(db, guild_id, start_at, end_at)
+                if not utils.check_api_key(api_key, state["api_key_hash"]):
+                    raise web.HTTPUnauthorized(
+                        headers={"WWW-Authenticate": "Bearer"},
+                        text="That API key isn't valid for this guild.",
+                    )
+
+                # Work out the ETag
+                now: Optional[dt] = None
+                etag = state["fingerprint"]
+                if state["has_open_sessions"]:
+                    now = dt.utcnow().replace(second=0, microsecond=0)
+                    etag = f"{etag}-{now:%Y%m%d%H%M}"
+                headers = {
+                    "ETag": f'"{etag}"',
+                    "Cache-Control": "private, no-cache",
+                }
+                if self.is_not_modified(request, headers["ETag"]):
+                    return web.Response(status=304, headers=headers)
+
+                # Stream the CSV
+                response = web.StreamResponse(headers={
+                    **headers,
+                    "Content-Type": "text/csv; charset=utf-8",
+                    "Content-Disposition": 'attachment; filename="clockins.csv"',
+                })
+                response.enable_chunked_encoding()
+                await response.prepare(request)
+                async for chunk in utils.iter_export_csv(
+                        db,
+                        guild_id,
+                        start_at,
+                        end_at,
+                        now=now):
+                    await response.write(chunk)
+                await response.write_eof()
+                return response
+
+
+def setup(bot: vbu.Bot):
+    x = API(bot)
+    bot.add_cog(x)
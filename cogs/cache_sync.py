@@ -0,0 +1,92 @@
+import asyncio
+from typing import Optional
+
+from discord.ext import vbu, tasks
+
+from cogs import utils
+
+
+class CacheSync(vbu.Cog[vbu.Bot]):
+    """
+    Keeps this process's caches in step with the other shard processes,
+    using the Redis server set in the ``[redis]`` section of the config.
+    """
+
+    def __init__(self, bot: vbu.Bot):
+        super().__init__(bot)
+        self.listen_task: Optional[asyncio.Task] = None
+        self.resync_task: Optional[asyncio.Task] = None
+        self.enabled: bool = bot.config.get("redis", {}).get("enabled", False)
+        utils.SharedCache.setup(self.enabled)
+        if self.enabled:
+            utils.ClockIn.add_write_listener(utils.SharedCache.on_clock_in_written)
+            utils.SharedCache.recovered_listeners.append(self.on_recovered)
+            self.listen_task = self.bot.loop.create_task(self.listen())
+            self.check_redis.start()
+
+    def cog_unload(self):
+        if not self.enabled:
+            return
+        utils.ClockIn.remove_write_listener(utils.SharedCache.on_clock_in_written)
+        utils.SharedCache.recovered_listeners.remove(self.on_recovered)
+        if self.listen_task is not None:
+            self.listen_task.cancel()
+        self.check_redis.cancel()
+        utils.SharedCache.setup(False)
+
+    async def listen(self) -> None:
+        """
+        Apply writes made by the other processes, for as long as the
+        subscription lasts. If it can't be made or it drops, Redis is treated
+        as unreachable until :meth:`check_redis` finds it again, which
+        subscribes again through :meth:`on_recovered`.
+        """
+
+        channel = await utils.SharedCache.subscribe()
+        if channel is not None:
+            await utils.SharedCache.listen(channel)
+
+    @tasks.loop(minutes=1)
+    async def check_redis(self):
+        """
+        Ping Redis so that an outage is noticed (and reads fall back to the
+        database) even if nothing else is using it.
+        """
+
+        await utils.SharedCache.ping()
+
+    def on_recovered(self) -> None:
+        """
+        Reload everything that other processes might have written to while
+        Redis was unreachable, since we won't have heard about it.
+        """
+
+        utils.MaskRegistry.invalidate_all()
+        if self.resync_task is None or self.resync_task.done():
+            self.resync_task = self.bot.loop.create_task(self.resync())
+
+    async def resync(self) -> None:
+        """
+        Subscribe to writes again if the subscription was lost, and then
+        reload the open session index and the clock out schedule from the
+        database. Subscribing first means that nothing written while they're
+        reloading goes unheard.
+        """
+
+        if self.listen_task is None or self.listen_task.done():
+            channel = await utils.SharedCache.subscribe()
+            if channel is not None:
+                self.listen_task = self.bot.loop.create_task(
+                    utils.SharedCache.listen(channel),
+                )
+        await utils.ClockIn.hydrate_open_sessions(force=True)
+        await utils.AutoClockOut.rebuild()
+
+    @check_redis.before_loop
+    async def before_check_redis(self):
+        await self.bot.wait_until_ready()
+
+
+def setup(bot: vbu.Bot):
+    x = CacheSync(bot)
+    bot.add_cog(x)
@@ -0,0 +1,44 @@
+from typing import Optional
+
+from discord.ext import vbu, tasks
+
+from cogs import utils
+
+
+class EventTasks(vbu.Cog[vbu.Bot]):
+
+    def __init__(self, bot: vbu.Bot):
+        super().__init__(bot)
+        self.snapshotted_up_to: Optional[int] = None
+        self.take_snapshots.start()
+
+    def cog_unload(self):
+        self.take_snapshots.cancel()
+
+    @tasks.loop(minutes=10)
+    async def take_snapshots(self):
+        """
+        Snapshot the state of every user who has had events since the last
+        run, so that rebuilding it doesn't mean replaying their whole log.
+        """
+
+        async with vbu.Database() as db:
+            if self.snapshotted_up_to is None:
+                self.snapshotted_up_to = await utils.ClockEventLog.get_high_water_mark(db)
+            while True:
+                after = await utils.ClockEventLog.take_snapshots(
+                    db,
+                    self.snapshotted_up_to,
+                )
+                if after == self.snapshotted_up_to:
+                    break
+                self.snapshotted_up_to = after
+
+    @take_snapshots.before_loop
+    async def before_take_snapshots(self):
+        await self.bot.wait_until_ready()
+
+
+def setup(bot: vbu.Bot):
+    x = EventTasks(bot)
+    bot.add_cog(x)
@@ -1,10 +1,8 @@
-from functools import reduce
-import itertools
-from datetime import timedelta, date
-from typing import Optional, cast
-from asyncpg.connection import collections
-import io
-import csv
+import asyncio
+from datetime import datetime as dt, timedelta
+import time
+from typing import NamedTuple, Optional, cast
+import uuid
 
 import discord
 from discord.ext import vbu, commands
@@ -12,8 +10,62 @@ from discord.ext import vbu, commands
 from cogs import utils
 
 
+class ShowPage(NamedTuple):
+    """
+    A page of the information show output with everything that doesn't
+    change over time already formatted.
+    """
+
+    guild_id: int
+    user_id: int
+    page: int
+    closed_totals: dict[str, timedelta]
+    total_lines: dict[str, str]
+    clock_in_lines: str
+    previous_id: Optional[str]
+    next_id: Optional[str]
+
+
 class InformationCommands(vbu.Cog[vbu.Bot]):
 
+    # The upload limit for guilds without any boosts
+    DEFAULT_FILESIZE_LIMIT = 8 * 1024 * 1024
+
+    # How many clock ins are shown on each page of information show, and
+    # how many users' first pages are kept rendered
+    SHOW_PAGE_SIZE = 10
+    SHOW_CACHE_SIZE = 1_000
+
+    # How many events are shown by information showall
+    SHOWALL_EVENT_COUNT = 20
+
+    # How many users are shown by information leaderboard
+    LEADERBOARD_SIZE = 10
+
+    # How many clock ins information clear archives at once, how long it
+    # waits between batches, and how often it updates its progress message
+    CLEAR_BATCH_SIZE = 1_000
+    CLEAR_BATCH_DELAY = 0.5
+    CLEAR_PROGRESS_INTERVAL = 5
+
+    def __init__(self, bot: vbu.Bot):
+        super().__init__(bot)
+        self.clear_tasks: dict[int, asyncio.Task] = {}
+        self.show_cache: utils.RenderCache[ShowPage] = utils.RenderCache(self.SHOW_CACHE_SIZE)
+        utils.ClockIn.add_write_listener(self.show_cache.on_clock_in_written)
+
+    def cog_unload(self):
+        utils.ClockIn.remove_write_listener(self.show_cache.on_clock_in_written)
+        utils.ReportPool.shutdown()
+        for task in self.clear_tasks.values():
+            task.cancel()
+
+    async def cog_before_invoke(self, ctx: vbu.Context):
+        utils.Metrics.command_started(ctx)
+
+    async def cog_after_invoke(self, ctx: vbu.Context):
+        utils.Metrics.command_finished(ctx)
+
     @commands.group(
         application_command_meta=commands.ApplicationCommandMeta(
             guild_only=True,
@@ -52,71 +104,285 @@ class InformationCommands(vbu.Cog[vbu.Bot]):
         if ctx.interaction.guild_id is None:
             return
         await ctx.interaction.response.defer()
-        async with vbu.Database() as db:
-            all_clock_ins = await utils.ClockIn.get_all(
-                db,
-                ctx.interaction.guild_id,
-                user.id,
-            )
-
-        # Get the valid clock ins
-        all_clock_ins = [
-            i
-            for i in all_clock_ins
-        ]
-
-        # Format into an embed per mask
-        embeds = []
-        for mask, clock_ins in itertools.groupby(
-                all_clock_ins,
-                key=lambda i: i.mask.capitalize()):
-            clock_ins = list(clock_ins)
-            if not clock_ins:
-                continue
-            embed = vbu.Embed(title=mask)
-            total_delta = reduce(
-                lambda x, y: x + y,
-                [i.duration_with_negative for i in clock_ins],
-            )
-            embed.description = (
-                f"This user has a total clock in time of "
-                f"**{utils.format_timedelta(total_delta)}**."
-            )
-            field_line_list = []
-            for ci in clock_ins:
-                if ci.clocked_out_at is None:
-                    field_line_list.append(
-                        f"\N{BULLET} {ci.clock_in_relative} - **Currently clocked in**"
-                    )
-                else:
-                    if ci.managed and ci.duration.total_seconds() < 0:
-                        field_line_list.append(
-                            f"\N{BULLET} [Admin] Removed **{utils.format_timedelta(ci.duration)}**"
-                        )
-                    elif ci.managed:
-                        field_line_list.append(
-                            f"\N{BULLET} [Admin] Added **{utils.format_timedelta(ci.duration)}**"
-                        )
-                    else:
-                        field_line_list.append(
-                            f"\N{BULLET} {ci.clock_in_relative} - {ci.clock_out_relative} "
-                            f"(**{utils.format_timedelta(ci.duration)}**)"
-                        )
-            embed.add_field(
-                name="Clock Ins",
-                value="\n".join(field_line_list),
-                inline=False,
-            )
-            embeds.append(embed)
+        embeds, components = await self.get_show_page(
+            ctx.interaction.guild_id,
+            user.id,
+        )
 
         # Send embeds
         if embeds:
             await ctx.interaction.followup.send(
                 embeds=embeds,
+                components=components,
             )
         else:
             await ctx.interaction.followup.send("No clock ins found.")
 
+    @staticmethod
+    def format_clock_in_line(ci: utils.ClockIn) -> str:
+        """
+        Format a clock in as a line for the information show embed.
+        """
+
+        if ci.clocked_out_at is None:
+            return (
+                f"\N{BULLET} `{ci.mask}` {ci.clock_in_relative} - "
+                f"**Currently clocked in**"
+            )
+        if ci.managed and ci.duration.total_seconds() < 0:
+            return (
+                f"\N{BULLET} `{ci.mask}` [Admin] Removed "
+                f"**{utils.format_timedelta(ci.duration)}**"
+            )
+        if ci.managed:
+            return (
+                f"\N{BULLET} `{ci.mask}` [Admin] Added "
+                f"**{utils.format_timedelta(ci.duration)}**"
+            )
+        return (
+            f"\N{BULLET} `{ci.mask}` {ci.clock_in_relative} - "
+            f"{ci.clock_out_relative} "
+            f"(**{utils.format_timedelta(ci.duration)}**)"
+        )
+
+    @staticmethod
+    def encode_page_key(ci: utils.ClockIn) -> str:
+        """
+        Encode a clock in's pagination key so that it can fit in a button's
+        custom ID.
+        """
+
+        micros = (ci.clocked_in_at - dt(1970, 1, 1)) // timedelta(microseconds=1)
+        return f"{micros} {uuid.UUID(ci.id).hex}"
+
+    @staticmethod
+    def decode_page_key(micros: str, id: str) -> tuple[dt, uuid.UUID]:
+        """
+        Decode a pagination key made by :meth:`encode_page_key`.
+        """
+
+        return (
+            dt(1970, 1, 1) + timedelta(microseconds=int(micros)),
+            uuid.UUID(id),
+        )
+
+    async def get_show_page(
+            self,
+            guild_id: int,
+            user_id: int,
+            *,
+            page: int = 1,
+            before: Optional[tuple[dt, uuid.UUID]] = None,
+            after: Optional[tuple[dt, uuid.UUID]] = None) -> tuple[
+                list[vbu.Embed],
+                Optional[discord.ui.MessageComponents]]:
+        """
+        Build a page of the information show output for a user. Totals for
+        each mask are calculated by the database, and only the clock ins on
+        the requested page are fetched.
+
+        The first page is rendered from the show cache when it can be, in
+        which case only the totals for masks that the user is clocked into
+        are worked out again.
+        """
+
+        # See if we've got the first page already
+        is_first_page = before is None and after is None
+        if is_first_page:
+            show_page = self.show_cache.get(guild_id, user_id)
+            if show_page is not None:
+                return await self.build_show_page(show_page)
+
+        # Get one more row than we need so that we know if there's another page
+        version = self.show_cache.version
+        async with vbu.Database() as db:
+            clock_ins = await utils.ClockIn.get_page(
+                db,
+                guild_id,
+                user_id,
+                before=before,
+                after=after,
+                limit=self.SHOW_PAGE_SIZE + 1,
+            )
+            mask_totals = await utils.ClockIn.get_mask_totals(
+                db,
+                guild_id,
+                user_id,
+                include_open=False,
+            )
+        if not clock_ins and not mask_totals:
+            return [], None
+
+        # Work out which directions we can go in
+        has_more = len(clock_ins) > self.SHOW_PAGE_SIZE
+        if after is not None:
+            has_newer, has_older = has_more, True
+            clock_ins = clock_ins[-self.SHOW_PAGE_SIZE:]
+        else:
+            has_newer, has_older = before is not None, has_more
+            clock_ins = clock_ins[:self.SHOW_PAGE_SIZE]
+        show_page = self.render_show_page(
+            guild_id,
+            user_id,
+            clock_ins,
+            mask_totals,
+            page=page,
+            has_newer=has_newer,
+            has_older=has_older,
+        )
+        if is_first_page:
+            self.show_cache.set(guild_id, user_id, show_page, version)
+        return await self.build_show_page(show_page)
+
+    @classmethod
+    def render_show_page(
+            cls,
+            guild_id: int,
+            user_id: int,
+            clock_ins: list[utils.ClockIn],
+            closed_totals: dict[str, timedelta],
+            *,
+            page: int,
+            has_newer: bool,
+            has_older: bool) -> ShowPage:
+        """
+        Format the parts of a page of the information show output that only
+        change when the user's clock ins are written to.
+        """
+
+        previous_id = next_id = None
+        if has_newer and clock_ins:
+            previous_id = (
+                f"INFO_SHOW {user_id} {page - 1} A "
+                f"{cls.encode_page_key(clock_ins[0])}"
+            )
+        if has_older and clock_ins:
+            next_id = (
+                f"INFO_SHOW {user_id} {page + 1} B "
+                f"{cls.encode_page_key(clock_ins[-1])}"
+            )
+        return ShowPage(
+            guild_id=guild_id,
+            user_id=user_id,
+            page=page,
+            closed_totals=closed_totals,
+            total_lines={
+                mask: cls.format_total_line(mask, total)
+                for mask, total in closed_totals.items()
+            },
+            clock_in_lines=(
+                "\n".join(cls.format_clock_in_line(ci) for ci in clock_ins)
+                or "No clock ins found."
+            ),
+            previous_id=previous_id,
+            next_id=next_id,
+        )
+
+    @staticmethod
+    def format_total_line(mask: str, total: timedelta) -> str:
+        """
+        Format a mask's total as a line for the information show embed.
+        """
+
+        return (
+            f"\N{BULLET} **{mask.capitalize()}** - "
+            f"{utils.format_timedelta(total) or 'no time'}"
+        )
+
+    @classmethod
+    async def build_show_page(
+            cls,
+            show_page: ShowPage) -> tuple[
+                list[vbu.Embed],
+                Optional[discord.ui.MessageComponents]]:
+        """
+        Build the embed and buttons for a rendered page of the information
+        show output. The totals for any masks that the user is currently
+        clocked into are worked out again from their current clock ins, since
+        they go up over time.
+        """
+
+        # Redo the totals for anything that's open
+        total_lines = dict(show_page.total_lines)
+        open_totals: dict[str, timedelta] = {}
+        for clock_in in await utils.ClockIn.get_current(
+                None,
+                show_page.guild_id,
+                show_page.user_id):
+            open_totals[clock_in.mask] = (
+                open_totals.get(clock_in.mask, timedelta(0))
+                + clock_in.duration_with_negative
+            )
+        for mask, total in open_totals.items():
+            total_lines[mask] = cls.format_total_line(
+                mask,
+                show_page.closed_totals.get(mask, timedelta(0)) + total,
+            )
+
+        # Build the embed
+        embed = vbu.Embed(title="Clock Ins")
+        embed.description = (
+            f"Total clock in time for <@{show_page.user_id}>:\n"
+            + "\n".join(line for _, line in sorted(total_lines.items()))
+        )
+        embed.add_field(
+            name="Clock Ins",
+            value=show_page.clock_in_lines,
+            inline=False,
+        )
+        embed.set_footer(text=f"Page {show_page.page}")
+
+        # Build the buttons
+        if show_page.previous_id is None and show_page.next_id is None:
+            return [embed], None
+        components = discord.ui.MessageComponents(
+            discord.ui.ActionRow(
+                discord.ui.Button(
+                    label="Previous",
+                    custom_id=show_page.previous_id or "INFO_SHOW_NONE_PREVIOUS",
+                    disabled=show_page.previous_id is None,
+                ),
+                discord.ui.Button(
+                    label="Next",
+                    custom_id=show_page.next_id or "INFO_SHOW_NONE_NEXT",
+                    disabled=show_page.next_id is None,
+                ),
+            ),
+        )
+        return [embed], components
+
+    @vbu.Cog.listener("on_component_interaction")
+    async def information_show_page_listener(
+            self,
+            interaction: discord.ComponentInteraction):
+        """
+        Move between pages of the information show output.
+        """
+
+        if not interaction.custom_id.startswith("INFO_SHOW "):
+            return
+        if interaction.guild_id is None:
+            return
+        _, user_id, page, direction, micros, id = interaction.custom_id.split(" ")
+        key = self.decode_page_key(micros, id)
+        embeds, components = await self.get_show_page(
+            interaction.guild_id,
+            int(user_id),
+            page=int(page),
+            before=key if direction == "B" else None,
+            after=key if direction == "A" else None,
+        )
+        if not embeds:
+            return await interaction.response.edit_message(
+                content="No clock ins found.",
+                embeds=[],
+                components=None,
+            )
+        await interaction.response.edit_message(
+            embeds=embeds,
+            components=components,
+        )
+
     @commands.context_command(
         name="Get clock ins for user."
     )
@@ -127,107 +393,390 @@ class InformationCommands(vbu.Cog[vbu.Bot]):
         await self.information_show(ctx, user)
 
     @information.command(
-        name="export",
+        name="showall",
         application_command_meta=commands.ApplicationCommandMeta(
             guild_only=True,
-        )
+            options=[
+                discord.ApplicationCommandOption(
+                    name="user",
+                    description="The user to show information about.",
+                    type=discord.ApplicationCommandOptionType.user,
+                ),
+            ],
+        ),
     )
-    async def information_export(self, ctx: commands.SlashContext):
+    async def information_showall(
+            self,
+            ctx: utils.types.GuildSlashContext,
+            user: Optional[discord.Member] = None):
         """
-        Export all of the users from the database into a CSV file.
+        Shows a log of everything that's happened to a user's clock ins.
         """
 
-        # Defer so we can actually do stuff
+        user = user or ctx.author  # pyright: ignore
+        user = cast(discord.Member, user)
+        if ctx.interaction.guild_id is None:
+            return
         await ctx.interaction.response.defer()
 
-        # Get all clockins
-        assert ctx.interaction.guild_id
+        # Rebuild their totals from the event log, and get their latest events
         async with vbu.Database() as db:
-            all_clock_ins = await utils.ClockIn.get_all_for_guild(
+            state = await utils.ClockEventLog.get_state(
+                db,
+                ctx.interaction.guild_id,
+                user.id,
+            )
+            events = await utils.ClockEventLog.get_latest_events(
                 db,
                 ctx.interaction.guild_id,
+                user.id,
+                self.SHOWALL_EVENT_COUNT,
             )
+        if not events:
+            return await ctx.interaction.followup.send("No clock ins found.")
 
-        # Set up a dict to store each day's user clock in duration
-        clock_in_durations: dict[date, dict[int, timedelta]]
-        clock_in_durations = collections.defaultdict(dict)
+        # Build the embed
+        embed = vbu.Embed(title="Clock In Log")
+        embed.description = (
+            f"Latest events for <@{user.id}>:\n"
+            + "\n".join(self.format_event_line(i) for i in events)
+        )
+        embed.add_field(
+            name="Totals",
+            value=(
+                "\n".join(
+                    self.format_total_line(mask, total)
+                    for mask, total in sorted(state.total_by_mask().items())
+                )
+                or "No time."
+            ),
+            inline=False,
+        )
+        await ctx.interaction.followup.send(embeds=[embed])
 
-        # Group the clockins by user ID
-        for user_id, clockins in itertools.groupby(
-                all_clock_ins,
-                key=lambda i: i.user_id):
+    @staticmethod
+    def format_event_line(event: utils.ClockEvent) -> str:
+        """
+        Format an event as a line for the information showall embed.
+        """
 
-            # Group the clockins by day
-            for day, clockins in itertools.groupby(
-                    clockins,
-                    key=lambda i: i.clocked_in_at.date()):
+        duration = f"**{utils.format_timedelta(timedelta(seconds=abs(event.seconds)))}**"
+        recorded_at = discord.utils.format_dt(event.recorded_at, style="f")
+        clocked_in_at = discord.utils.format_dt(event.clock_in, style="f")
+        if event.clock_out is None:
+            span = f"{clocked_in_at} - **Currently clocked in**"
+        else:
+            length = utils.format_timedelta(event.clock_out - event.clock_in) or "no time"
+            span = (
+                f"{clocked_in_at} - "
+                f"{discord.utils.format_dt(event.clock_out, style='f')} "
+                f"(**{length}**)"
+            )
+        if event.kind == "clock_in":
+            return f"\N{BULLET} `{event.mask}` Clocked in {clocked_in_at}"
+        if event.kind == "clock_out" and event.clock_out is not None:
+            return (
+                f"\N{BULLET} `{event.mask}` Clocked out "
+                f"{discord.utils.format_dt(event.clock_out, style='f')} ({duration})"
+            )
+        if event.kind == "session":
+            return f"\N{BULLET} `{event.mask}` {span}"
+        if event.kind == "duration" and event.seconds < 0:
+            return f"\N{BULLET} `{event.mask}` [Admin] Removed {duration} {recorded_at}"
+        if event.kind == "duration":
+            return f"\N{BULLET} `{event.mask}` [Admin] Added {duration} {recorded_at}"
+        if event.kind == "reopen":
+            return f"\N{BULLET} `{event.mask}` Reopened {recorded_at}: {span}"
+        if event.kind == "removed":
+            return f"\N{BULLET} `{event.mask}` Moved away {recorded_at}: {span}"
+        if event.kind == "archived":
+            return f"\N{BULLET} `{event.mask}` Cleared {recorded_at}"
+        return f"\N{BULLET} `{event.mask}` Edited {recorded_at}: {span}"
 
-                # Get the total duration for the day
-                total_duration = reduce(
-                    lambda x, y: x + y,
-                    [i.duration_with_negative for i in clockins],
-                )
+    @information.command(
+        name="leaderboard",
+        application_command_meta=commands.ApplicationCommandMeta(
+            guild_only=True,
+            options=[
+                discord.ApplicationCommandOption(
+                    name="mask",
+                    description="The mask to rank users by.",
+                    type=discord.ApplicationCommandOptionType.string,
+                    required=True,
+                    autocomplete=True,
+                ),
+                discord.ApplicationCommandOption(
+                    name="period",
+                    description="The time to count. Defaults to this week.",
+                    type=discord.ApplicationCommandOptionType.string,
+                    required=False,
+                    choices=[
+                        discord.ApplicationCommandOptionChoice(name="This week", value="week"),
+                        discord.ApplicationCommandOptionChoice(name="This month", value="month"),
+                        discord.ApplicationCommandOptionChoice(name="All time", value="all"),
+                    ],
+                ),
+            ],
+        ),
+    )
+    async def information_leaderboard(
+            self,
+            ctx: utils.types.GuildSlashContext,
+            mask: str,
+            period: str = "week"):
+        """
+        Shows the users with the most time with a mask.
+        """
 
-                # Add the duration to the dict
-                clock_in_durations[day][user_id] = total_duration
-
-        # Make a CSV file
-        csv_file = io.StringIO()
-        csv_writer = csv.writer(csv_file)
-        csv_writer.writerow(["Year", "Month", "Day", "User ID", "Duration"])
-        for day, user_durations in clock_in_durations.items():
-            for user_id, duration in user_durations.items():
-                csv_writer.writerow([
-                    day.year,
-                    day.month,
-                    day.day,
-                    f"{user_id}\t",
-                    duration.total_seconds(),
-                ])
-
-        # Send the file
-        csv_file.seek(0)
-        await ctx.interaction.followup.send(
-            file=discord.File(
-                csv_file,
-                filename="clockins.csv",
-            ),
+        # Get the leaderboard
+        if ctx.interaction.guild_id is None:
+            return
+        async with vbu.Database() as db:
+            leaderboard = await utils.ClockIn.get_leaderboard(
+                db,
+                ctx.interaction.guild_id,
+                mask,
+                period,
+                self.LEADERBOARD_SIZE,
+            )
+        if not leaderboard:
+            return await ctx.interaction.response.send_message(
+                f"Nobody has any time with the mask `{mask}` yet.",
+                allowed_mentions=discord.AllowedMentions.none(),
+            )
+
+        # Build the embed
+        titles = {"week": "This Week", "month": "This Month", "all": "All Time"}
+        embed = vbu.Embed(title=f"{mask.capitalize()} Leaderboard - {titles.get(period, period)}")
+        embed.description = "\n".join(
+            f"**{index}.** <@{user_id}> - {utils.format_timedelta(total)}"
+            for index, (user_id, total) in enumerate(leaderboard, start=1)
+        )
+        await ctx.interaction.response.send_message(
+            embeds=[embed],
+            allowed_mentions=discord.AllowedMentions.none(),
         )
 
+    @information_leaderboard.autocomplete
+    @utils.Metrics.timed("autocomplete")
+    async def information_leaderboard_autocomplete(
+            self,
+            _,
+            interaction: discord.AutocompleteInteraction):
+        """
+        Give the user a list of the guild's masks.
+        """
+
+        assert interaction.guild_id
+        masks = await utils.MaskRegistry.search(
+            interaction.guild_id,
+            utils.get_focused_value(interaction),
+        )
+        return await interaction.response.send_autocomplete([
+            discord.ApplicationCommandOptionChoice(name=i, value=i)
+            for i in masks
+        ])
+
     @information.command(
-        name="clear",
+        name="export",
         application_command_meta=commands.ApplicationCommandMeta(
             guild_only=True,
+            options=[
+                discord.ApplicationCommandOption(
+                    name="start",
+                    description="The first day to export (YYYY-MM-DD). Defaults to 30 days ago.",
+                    type=discord.ApplicationCommandOptionType.string,
+                    required=False,
+                ),
+                discord.ApplicationCommandOption(
+                    name="end",
+                    description="The last day to export (YYYY-MM-DD). Defaults to today.",
+                    type=discord.ApplicationCommandOptionType.string,
+                    required=False,
+                ),
+            ],
         )
     )
-    async def information_clear(self, ctx: commands.SlashContext):
+    async def information_export(
+            self,
+            ctx: commands.SlashContext,
+            start: Optional[str] = None,
+            end: Optional[str] = None):
         """
-        Clear all of the clock ins from the database.
+        Export all of the users from the database into a CSV file.
         """
 
+        # Work out the range that we want to export
+        try:
+            if end:
+                end_at = dt.strptime(end, "%Y-%m-%d") + timedelta(days=1)
+            else:
+                end_at = dt.utcnow()
+            if start:
+                start_at = dt.strptime(start, "%Y-%m-%d")
+            else:
+                start_at = end_at - timedelta(days=30)
+        except ValueError:
+            return await ctx.interaction.response.send_message(
+                "Dates need to be in the format `YYYY-MM-DD`.",
+            )
+        if start_at >= end_at:
+            return await ctx.interaction.response.send_message(
+                "The start date needs to be before the end date.",
+            )
+
         # Defer so we can actually do stuff
         await ctx.interaction.response.defer()
 
-        # Delete all users
+        # Write the CSV file
         assert ctx.interaction.guild_id
         async with vbu.Database() as db:
-            await db.call(
-                """
-                DELETE FROM
-                    clock_ins
-                WHERE
-                    guild_id = $1
-                    AND clock_out IS NOT NULL
-                """,
+            csv_file = await utils.write_export_csv(
+                db,
                 ctx.interaction.guild_id,
+                start_at,
+                end_at,
+            )
+
+        # Make sure it fits in Discord's upload limit - this compresses the
+        # file, so do it off of the event loop
+        size_limit = self.DEFAULT_FILESIZE_LIMIT
+        if isinstance(ctx.interaction.guild, discord.Guild):
+            size_limit = ctx.interaction.guild.filesize_limit
+        files = await asyncio.to_thread(
+            utils.prepare_export_files,
+            csv_file,
+            "clockins.csv",
+            size_limit,
+        )
+
+        # Send the files
+        try:
+            for index in range(0, len(files), utils.export.MAX_ATTACHMENTS):
+                await ctx.interaction.followup.send(
+                    files=files[index:index + utils.export.MAX_ATTACHMENTS],
+                )
+        finally:
+            csv_file.close()
+            for file in files:
+                file.close()
+
+    @information.command(
+        name="clear",
+        application_command_meta=commands.ApplicationCommandMeta(
+            guild_only=True,
+        )
+    )
+    async def information_clear(self, ctx: commands.SlashContext):
+        """
+        Clear all of the clock ins from the database.
+        """
+
+        # Only run one clear per guild at a time
+        assert ctx.interaction.guild_id
+        guild_id = ctx.interaction.guild_id
+        if guild_id in self.clear_tasks:
+            return await ctx.interaction.response.send_message(
+                "The clock ins for this server are already being cleared.",
             )
 
-        # Send a message
-        await ctx.interaction.followup.send(
-            "Cleared all clock ins from the database."
+        # The clear runs in the background, reporting back as it goes
+        self.clear_tasks[guild_id] = asyncio.create_task(
+            self.clear_guild(ctx, guild_id),
         )
 
+    @staticmethod
+    async def edit_progress(
+            message: discord.WebhookMessage,
+            content: str) -> None:
+        """
+        Edit a progress message, ignoring any failures (such as the
+        interaction having expired).
+        """
+
+        try:
+            await message.edit(content=content)
+        except discord.HTTPException:
+            pass
+
+    async def clear_guild(
+            self,
+            ctx: commands.SlashContext,
+            guild_id: int) -> None:
+        """
+        Clear a guild's clock ins. Open clock ins are rolled over so that
+        no time is lost, and then every closed clock in from before the clear
+        is moved into the archive in small batches, with a pause between each
+        so that other guilds' queries aren't held up.
+        """
+
+        archived = 0
+        try:
+            await ctx.interaction.response.defer()
+            message = await ctx.interaction.followup.send(
+                "Clearing clock ins...",
+                wait=True,
+            )
+
+            # Roll over anyone who's clocked in
+            cleared_at = dt.utcnow()
+            async with vbu.Database() as db:
+                rolled_over = await utils.ClockIn.roll_over_open_sessions(
+                    db,
+                    guild_id,
+                    cleared_at,
+                )
+
+            # Archive everything that's closed, a batch at a time
+            last_update = time.monotonic()
+            while True:
+                async with vbu.Database() as db:
+                    moved = await utils.ClockIn.archive_closed_batch(
+                        db,
+                        guild_id,
+                        cleared_at,
+                        self.CLEAR_BATCH_SIZE,
+                    )
+                archived += moved
+                self.show_cache.invalidate_guild(guild_id)
+                if moved == 0:
+                    break
+                if time.monotonic() - last_update >= self.CLEAR_PROGRESS_INTERVAL:
+                    await self.edit_progress(
+                        message,
+                        f"Clearing clock ins... {archived:,} archived so far.",
+                    )
+                    last_update = time.monotonic()
+                await asyncio.sleep(self.CLEAR_BATCH_DELAY)
+
+            # And we done
+            content = f"Cleared {archived:,} clock ins from the database."
+            if rolled_over:
+                content += (
+                    f" {len(rolled_over):,} open clock ins were clocked out "
+                    f"and back in again so that no time is lost."
+                )
+            await self.edit_progress(message, content)
+        except Exception:
+            self.logger.exception("Failed to clear clock ins for guild %s", guild_id)
+            try:
+                await ctx.interaction.followup.send(
+                    (
+                        f"Something went wrong clearing the clock ins - "
+                        f"{archived:,} were archived before it stopped."
+                    ),
+                )
+            except discord.HTTPException:
+                pass
+        finally:
+            self.clear_tasks.pop(guild_id, None)
+
 
 def setup(bot: vbu.Bot):
     x = InformationCommands(bot)
     bot.add_cog(x)
+    config = bot.config.get("report_pool", {})
+    utils.ReportPool.configure(
+        enabled=config.get("enabled", False),
+        max_workers=config.get("max_workers", 2),
+    )
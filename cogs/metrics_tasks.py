@@ -0,0 +1,28 @@
+from discord.ext import vbu, tasks
+
+from cogs import utils
+
+
+class MetricsTasks(vbu.Cog[vbu.Bot]):
+
+    def __init__(self, bot: vbu.Bot):
+        super().__init__(bot)
+        utils.Metrics.setup(bot)
+        self.flush_metrics.start()
+
+    def cog_unload(self):
+        self.flush_metrics.cancel()
+        self.bot.loop.create_task(utils.Metrics.flush())
+
+    @tasks.loop(seconds=10)
+    async def flush_metrics(self):
+        """
+        Send the metrics that have been recorded since the last run.
+        """
+
+        await utils.Metrics.flush()
+
+
+def setup(bot: vbu.Bot):
+    x = MetricsTasks(bot)
+    bot.add_cog(x)
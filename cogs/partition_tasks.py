@@ -0,0 +1,44 @@
+from discord.ext import vbu, tasks
+
+from cogs import utils
+
+
+class PartitionTasks(vbu.Cog[vbu.Bot]):
+
+    def __init__(self, bot: vbu.Bot):
+        super().__init__(bot)
+        self.maintain_partitions.start()
+
+    def cog_unload(self):
+        self.maintain_partitions.cancel()
+
+    @tasks.loop(hours=6)
+    async def maintain_partitions(self):
+        """
+        Create the clock ins partitions for the coming months, and drop any
+        that have passed the retention period.
+        """
+
+        config = self.bot.config.get("partitions", {})
+        retention_months = config.get("retention_months", 0)
+        async with vbu.Database() as db:
+            await utils.ensure_partitions(
+                db,
+                config.get("months_ahead", 3),
+            )
+            if retention_months > 0:
+                dropped = await utils.drop_expired_partitions(
+                    db,
+                    retention_months,
+                )
+                for name in dropped:
+                    self.logger.info("Dropped clock ins partition %s", name)
+
+    @maintain_partitions.before_loop
+    async def before_maintain_partitions(self):
+        await self.bot.wait_until_ready()
+
+
+def setup(bot: vbu.Bot):
+    x = PartitionTasks(bot)
+    bot.add_cog(x)
@@ -1,9 +1,11 @@
-import collections
+from datetime import timedelta
 
 import discord
 from discord.ext import vbu, commands
 import asyncpg
 
+from cogs import utils
+
 
 class SettingsCommands(vbu.Cog[vbu.Bot]):
 
@@ -15,6 +17,12 @@ class SettingsCommands(vbu.Cog[vbu.Bot]):
 
         return value.isidentifier()
 
+    async def cog_before_invoke(self, ctx: vbu.Context):
+        utils.Metrics.command_started(ctx)
+
+    async def cog_after_invoke(self, ctx: vbu.Context):
+        utils.Metrics.command_finished(ctx)
+
     @commands.group(
         application_command_meta=commands.ApplicationCommandMeta(
             guild_only=True,
@@ -76,25 +84,14 @@ class SettingsCommands(vbu.Cog[vbu.Bot]):
             )
 
         # Add the mask to the guild
+        assert ctx.interaction.guild_id
         async with vbu.Database() as db:
             try:
-                await db(
-                    """
-                    INSERT INTO
-                        clock_masks
-                        (
-                            guild_id,
-                            role_id,
-                            mask
-                        )
-                    VALUES
-                        (
-                            $1,
-                            $2,
-                            $3
-                        )
-                    """,
-                    ctx.interaction.guild_id, role.id, mask,
+                await utils.MaskRegistry.add(
+                    db,
+                    ctx.interaction.guild_id,
+                    role.id,
+                    mask,
                 )
             except asyncpg.exceptions.UniqueViolationError:
                 await ctx.interaction.response.send_message(
@@ -132,19 +129,12 @@ class SettingsCommands(vbu.Cog[vbu.Bot]):
         """
 
         # Remove the mask
+        assert ctx.interaction.guild_id
         async with vbu.Database() as db:
-            rows = await db(
-                """
-                DELETE FROM
-                    clock_masks
-                WHERE
-                    guild_id = $1
-                AND
-                    mask = $2
-                RETURNING
-                    role_id
-                """,
-                ctx.interaction.guild_id, mask,
+            rows = await utils.MaskRegistry.remove(
+                db,
+                ctx.interaction.guild_id,
+                mask,
             )
 
         # And we done
@@ -178,23 +168,7 @@ class SettingsCommands(vbu.Cog[vbu.Bot]):
             raise AssertionError("Guild is None")
 
         # Get the masks
-        async with vbu.Database() as db:
-            rows = await db(
-                """
-                SELECT
-                    *
-                FROM
-                    clock_masks
-                WHERE
-                    guild_id = $1
-                """,
-                ctx.interaction.guild_id,
-            )
-
-        # Sort it into a dict
-        masks: dict[int, list[str]] = collections.defaultdict(list)
-        for row in rows:
-            masks[row["role_id"]].append(row["mask"])
+        masks = await utils.MaskRegistry.get(ctx.interaction.guild_id)
 
         # Make the embed
         embed = vbu.Embed(use_random_colour=True)
@@ -214,7 +188,110 @@ class SettingsCommands(vbu.Cog[vbu.Bot]):
             allowed_mentions=discord.AllowedMentions.none(),
         )
 
+    @settings.command(
+        name="max-shift",
+        application_command_meta=commands.ApplicationCommandMeta(
+            options=[
+                discord.ApplicationCommandOption(
+                    name="duration",
+                    description="How long users can stay clocked in for. Leave empty to remove the limit.",
+                    type=discord.ApplicationCommandOptionType.string,
+                    required=False,
+                ),
+            ],
+            guild_only=True,
+        ),
+    )
+    async def settings_max_shift(
+            self,
+            ctx: vbu.SlashContext,
+            duration: str = "") -> None:
+        """
+        Set how long users can stay clocked in for before they're clocked out
+        automatically.
+        """
+
+        # Only let server managers change it
+        user = ctx.interaction.user
+        if not isinstance(user, discord.Member) or not user.guild_permissions.manage_guild:
+            return await ctx.interaction.response.send_message(
+                "You need the **Manage Server** permission to do that.",
+                ephemeral=True,
+            )
+
+        # Work out the new limit
+        max_shift_length = None
+        if duration:
+            max_shift_length = utils.parse_duration(duration)
+            if max_shift_length is None or max_shift_length < timedelta(0):
+                return await ctx.interaction.response.send_message(
+                    "Invalid duration format - give it like `8h` or `1d 2h 30m`.",
+                )
+            if not max_shift_length:
+                max_shift_length = None
+
+        # Save it
+        assert ctx.interaction.guild_id
+        async with vbu.Database() as db:
+            await utils.AutoClockOut.set_max_shift_length(
+                db,
+                ctx.interaction.guild_id,
+                max_shift_length,
+            )
+
+        # And we done
+        if max_shift_length is None:
+            return await ctx.interaction.response.send_message(
+                "Users will no longer be clocked out automatically.",
+            )
+        return await ctx.interaction.response.send_message(
+            (
+                "Users will be clocked out automatically after "
+                f"**{utils.format_timedelta(max_shift_length)}**."
+            ),
+        )
+
+    @settings.command(
+        name="api-key",
+        application_command_meta=commands.ApplicationCommandMeta(
+            guild_only=True,
+        ),
+    )
+    async def settings_api_key(
+            self,
+            ctx: vbu.SlashContext) -> None:
+        """
+        Generate a new key for the HTTP API, replacing your guild's old one.
+        """
+
+        # Only let server managers see the key
+        user = ctx.interaction.user
+        if not isinstance(user, discord.Member) or not user.guild_permissions.manage_guild:
+            return await ctx.interaction.response.send_message(
+                "You need the **Manage Server** permission to do that.",
+                ephemeral=True,
+            )
+
+        # Make a new key
+        assert ctx.interaction.guild_id
+        async with vbu.Database() as db:
+            api_key = await utils.reset_api_key(
+                db,
+                ctx.interaction.guild_id,
+            )
+
+        # And we done
+        await ctx.interaction.response.send_message(
+            (
+                f"Your new API key is `{api_key}`. Send it as a bearer token "
+                "in the `Authorization` header. It won't be shown again, and "
+                "your old key no longer works."
+            ),
+            ephemeral=True,
+        )
+
     @settings_masks_remove.autocomplete
+    @utils.Metrics.timed("autocomplete")
     async def settings_masks_remove_autocomplete(
             self,
             _,
@@ -223,21 +300,14 @@ class SettingsCommands(vbu.Cog[vbu.Bot]):
         Give the user a list of masks that they can remove.
         """
 
-        async with vbu.Database() as db:
-            rows = await db.call(
-                """
-                SELECT
-                    mask
-                FROM
-                    clock_masks
-                WHERE
-                    guild_id = $1
-                """,
-                interaction.guild_id,
-            )
+        assert interaction.guild_id
+        masks = await utils.MaskRegistry.search(
+            interaction.guild_id,
+            utils.get_focused_value(interaction),
+        )
         return await interaction.response.send_autocomplete([
-            discord.ApplicationCommandOptionChoice(name=i['mask'])
-            for i in rows[:25]
+            discord.ApplicationCommandOptionChoice(name=i)
+            for i in masks
         ])
 
 
@@ -1,5 +1,5 @@
-import re
-from datetime import datetime as dt, timedelta
+from datetime import datetime as dt
+from typing import Optional
 
 import discord
 from discord.ext import vbu, commands
@@ -9,32 +9,43 @@ from cogs import utils
 
 class UserCommands(vbu.Cog[vbu.Bot]):
 
+    @vbu.Cog.listener()
+    async def on_ready(self):
+        """
+        Load the open clock ins into memory so that clock outs don't need to
+        query for them, and start clocking out anything that's been open for
+        longer than its guild allows.
+        """
+
+        await utils.ClockIn.hydrate_open_sessions()
+        await utils.AutoClockOut.start(
+            self.bot.shard_count,
+            self.bot.shard_ids,
+        )
+
+    def cog_unload(self):
+        utils.AutoClockOut.stop()
+
     @staticmethod
+    @utils.Metrics.timed("query")
     async def get_masks_for_user(
-            db: vbu.Database,
-            user: discord.Member) -> list[str]:
+            user: discord.Member,
+            db: Optional[vbu.Database] = None) -> list[str]:
         """
         Get the masks that a user can use to clock in/out with.
         """
 
-        # Get the masks from the database
-        masks = await db.call(
-            """
-            SELECT
-                mask
-            FROM
-                clock_masks
-            WHERE
-                guild_id = $1
-            AND
-                role_id = ANY($2::BIGINT[])
-            """,
+        return await utils.MaskRegistry.get_masks_for_roles(
             user.guild.id,
             user.role_ids + [user.guild.default_role.id],
+            db,
         )
 
-        # Return the masks
-        return [mask['mask'] for mask in masks]
+    async def cog_before_invoke(self, ctx: vbu.Context):
+        utils.Metrics.command_started(ctx)
+
+    async def cog_after_invoke(self, ctx: vbu.Context):
+        utils.Metrics.command_finished(ctx)
 
     @commands.group(
         application_command_meta=commands.ApplicationCommandMeta(),
@@ -140,43 +151,42 @@ class UserCommands(vbu.Cog[vbu.Bot]):
         # Defer because apparently this takes time :/
         await ctx.interaction.response.defer()
 
-        # Open a db connection
+        # The checks share one connection, so any cache misses don't need to
+        # acquire their own
         async with vbu.Database() as db:
 
             # Get the masks for the user
-            allowed_masks = await self.get_masks_for_user(
-                db,
-                user,
-            )
+            allowed_masks = await self.get_masks_for_user(user, db)
 
             # See if they're already clocked in for that mask
-            clock_in = await utils.ClockIn.get_latest(
+            current = await utils.ClockIn.get_latest(
                 db,
                 ctx.guild.id,
                 user.id,
                 mask,
             )
-            if clock_in:
-                return await ctx.interaction.followup.send(
-                    "You're already clocked in with that mask.",
-                )
 
-            # See if they're allowed to use that mask
-            if mask not in allowed_masks:
-                return await ctx.interaction.followup.send(
-                    "You don't have permission to use that mask.",
+            # Create a new clock in if they're allowed to - the database does
+            # both checks again so that a stale cache or a double submit can't
+            # get through
+            allowed = mask.casefold() in (i.casefold() for i in allowed_masks)
+            clock_in = None
+            if current is None and allowed:
+                allowed, clock_in = await utils.ClockIn.open_session(
+                    db,
+                    ctx.guild.id,
+                    user.id,
+                    user.role_ids + [user.guild.default_role.id],
+                    mask,
                 )
-
-            # Create a new clock in
-            clock_in = utils.ClockIn(
-                id=None,
-                guild_id=ctx.guild.id,
-                user_id=user.id,
-                mask=mask,
-                clocked_in_at=dt.utcnow(),
-                clocked_out_at=None,
+        if current is None and not allowed:
+            return await ctx.interaction.followup.send(
+                "You don't have permission to use that mask.",
+            )
+        if clock_in is None:
+            return await ctx.interaction.followup.send(
+                "You're already clocked in with that mask.",
             )
-            await clock_in.update(db)
 
         # Send a message
         await ctx.interaction.followup.send(
@@ -215,27 +225,19 @@ class UserCommands(vbu.Cog[vbu.Bot]):
         # Defer so we can have a nice loading message
         await ctx.interaction.response.defer()
 
-        # Open a database connection
+        # Clock them out, if they're clocked in with that mask
         async with vbu.Database() as db:
-
-            # See if they're already clocked in with that mask
-            clock_in = await utils.ClockIn.get_latest(
+            clock_in = await utils.ClockIn.close_session(
                 db,
                 ctx.guild.id,
                 user.id,
                 mask,
             )
 
-            # If not, give them an error
-            if not clock_in:
-                return await ctx.interaction.followup.send(
-                    "You're not clocked in with that mask.",
-                )
-
-            # Otherwise, clock them out
-            await clock_in.update(
-                db,
-                clocked_out_at=dt.utcnow(),
+        # If not, give them an error
+        if not clock_in:
+            return await ctx.interaction.followup.send(
+                "You're not clocked in with that mask.",
             )
 
         # Tell them we're done
@@ -284,32 +286,12 @@ class UserCommands(vbu.Cog[vbu.Bot]):
         """
 
         # Build a timedelta from what the user said
-        duration_group = re.search(
-            (
-                r"(?:(?P<negative>-)?)\s*"
-                r"(?:(?P<days>\d+?)d)?\s*"
-                r"(?:(?P<hours>\d+?)h)?\s*"
-                r"(?:(?P<minutes>\d+?)m)?\s*"
-                r"(?:(?P<seconds>\d+?)s)?"
-            ),
-            duration,
-            re.IGNORECASE,
-        )
-        if not duration_group:
+        duration_delta = utils.parse_duration(duration)
+        if duration_delta is None:
             return await ctx.interaction.response.send_message(
                 "Invalid duration format.",
             )
 
-        # Build a timedelta
-        duration_delta = timedelta(
-            days=int(duration_group.group("days") or 0),
-            hours=int(duration_group.group("hours") or 0),
-            minutes=int(duration_group.group("minutes") or 0),
-            seconds=int(duration_group.group("seconds") or 0),
-        )
-        if duration_group.group("negative"):
-            duration_delta = -duration_delta
-
         # Open a database connection
         start = dt(2000, 1, 1)
         async with vbu.Database() as db:
@@ -331,9 +313,186 @@ class UserCommands(vbu.Cog[vbu.Bot]):
             ),
         )
 
+    @staticmethod
+    async def get_role_members(role: discord.Role) -> Optional[list[discord.Member]]:
+        """
+        Get the members of a guild that have a given role, leaving out bots.
+        Members are read from the cache, which the members intent fills. If
+        the guild's members haven't all been cached yet they're requested
+        first, and ``None`` is returned if they can't be.
+        """
+
+        if not role.guild.chunked:
+            try:
+                await role.guild.chunk()
+            except discord.ClientException:
+                return None
+        return [
+            member
+            for member in role.members
+            if not member.bot
+        ]
+
+    @clockother.command(
+        name="role-in",
+        application_command_meta=commands.ApplicationCommandMeta(
+            options=[
+                discord.ApplicationCommandOption(
+                    name="role",
+                    description="The role whose members you want to clock in.",
+                    type=discord.ApplicationCommandOptionType.role,
+                    required=True,
+                ),
+                discord.ApplicationCommandOption(
+                    name="mask",
+                    description="The mask to use for the clock.",
+                    type=discord.ApplicationCommandOptionType.string,
+                    required=True,
+                    autocomplete=True,
+                ),
+            ],
+        ),
+    )
+    async def clockother_role_in(
+            self,
+            ctx: utils.types.GuildSlashContext,
+            role: discord.Role,
+            mask: str):
+        """
+        Clocks every member of a role in to a specific mask.
+        """
+
+        # Defer since writing a whole role can take a while
+        await ctx.interaction.response.defer()
+
+        # Get the members of the role
+        members = await self.get_role_members(role)
+        if members is None:
+            return await ctx.interaction.followup.send(
+                "I haven't been able to load this server's members yet, so I "
+                "can't tell who has that role. Try again in a minute.",
+            )
+
+        async with vbu.Database() as db:
+
+            # Work out which members are allowed to use the mask - masks are
+            # case insensitive, as they are in the database
+            roles = await utils.MaskRegistry.get(ctx.guild.id, db)
+            mask_role_ids = {
+                role_id
+                for role_id, masks in roles.items()
+                if mask.casefold() in (i.casefold() for i in masks)
+            }
+            allowed = [
+                member.id
+                for member in members
+                if mask_role_ids.intersection(
+                    member.role_ids + [ctx.guild.default_role.id],
+                )
+            ]
+
+            # And clock them all in at once
+            clock_ins = []
+            if allowed:
+                clock_ins = await utils.ClockIn.open_sessions_for_users(
+                    db,
+                    ctx.guild.id,
+                    allowed,
+                    mask,
+                )
+
+        # Tell them what changed
+        lines = [
+            f"Clocked in **{len(clock_ins)}** member(s) of {role.mention} "
+            f"with the mask `{mask}`."
+        ]
+        if len(allowed) > len(clock_ins):
+            lines.append(
+                f"**{len(allowed) - len(clock_ins)}** member(s) were "
+                f"already clocked in."
+            )
+        if len(members) > len(allowed):
+            lines.append(
+                f"**{len(members) - len(allowed)}** member(s) don't have "
+                f"permission to use that mask."
+            )
+        await ctx.interaction.followup.send(
+            "\n".join(lines),
+            allowed_mentions=discord.AllowedMentions.none(),
+        )
+
+    @clockother.command(
+        name="role-out",
+        application_command_meta=commands.ApplicationCommandMeta(
+            options=[
+                discord.ApplicationCommandOption(
+                    name="role",
+                    description="The role whose members you want to clock out.",
+                    type=discord.ApplicationCommandOptionType.role,
+                    required=True,
+                ),
+                discord.ApplicationCommandOption(
+                    name="mask",
+                    description="The mask to use for the clock.",
+                    type=discord.ApplicationCommandOptionType.string,
+                    required=True,
+                    autocomplete=True,
+                ),
+            ],
+        ),
+    )
+    async def clockother_role_out(
+            self,
+            ctx: utils.types.GuildSlashContext,
+            role: discord.Role,
+            mask: str):
+        """
+        Clocks every member of a role out of a specific mask.
+        """
+
+        # Defer since writing a whole role can take a while
+        await ctx.interaction.response.defer()
+
+        # Get the members of the role
+        members = await self.get_role_members(role)
+        if members is None:
+            return await ctx.interaction.followup.send(
+                "I haven't been able to load this server's members yet, so I "
+                "can't tell who has that role. Try again in a minute.",
+            )
+
+        # Clock them all out at once
+        clock_ins = []
+        if members:
+            async with vbu.Database() as db:
+                clock_ins = await utils.ClockIn.close_sessions_for_users(
+                    db,
+                    ctx.guild.id,
+                    [member.id for member in members],
+                    mask,
+                )
+
+        # Tell them what changed
+        lines = [
+            f"Clocked out **{len(clock_ins)}** member(s) of {role.mention} "
+            f"from the mask `{mask}`."
+        ]
+        if len(members) > len(clock_ins):
+            lines.append(
+                f"**{len(members) - len(clock_ins)}** member(s) weren't "
+                f"clocked in with that mask."
+            )
+        await ctx.interaction.followup.send(
+            "\n".join(lines),
+            allowed_mentions=discord.AllowedMentions.none(),
+        )
+
+    @clockother_role_in.autocomplete
+    @clockother_role_out.autocomplete
     @clockother_in.autocomplete
     @clock_in.autocomplete
     @clockother_duration.autocomplete
+    @utils.Metrics.timed("autocomplete")
     async def clock_in_autocomplete(
             self,
             ctx: utils.types.GuildSlashContext,
@@ -342,32 +501,25 @@ class UserCommands(vbu.Cog[vbu.Bot]):
         Autocomplete for the clock in command.
         """
 
-        # Get current clock ins for that user
-        async with vbu.Database() as db:
-            rows = await db.call(
-                """
-                SELECT
-                    mask
-                FROM
-                    clock_masks
-                WHERE
-                    guild_id = $1
-                """,
-                ctx.interaction.guild_id,
-            )
+        # Get the masks for the guild that match what they've typed
+        masks = await utils.MaskRegistry.search(
+            ctx.guild.id,
+            utils.get_focused_value(interaction),
+        )
 
-        # Return the masks that they're clocked in with
+        # Return the masks that they can clock in with
         options = [
             discord.ApplicationCommandOptionChoice(
-                name=r['mask'],
-                value=r['mask'],
+                name=mask,
+                value=mask,
             )
-            for r in rows
+            for mask in masks
         ]
         await interaction.response.send_autocomplete(options)
 
     @clockother_out.autocomplete
     @clock_out.autocomplete
+    @utils.Metrics.timed("autocomplete")
     async def clock_out_autocomplete(
             self,
             ctx: utils.types.GuildSlashContext,
@@ -376,15 +528,12 @@ class UserCommands(vbu.Cog[vbu.Bot]):
         Autocomplete for the clock out command.
         """
 
-        # Open a database connection
-        async with vbu.Database() as db:
-
-            # Get current clock ins for that user
-            clock_ins = await utils.ClockIn.get_current(
-                db,
-                ctx.guild.id,
-                ctx.author.id,
-            )
+        # Get current clock ins for that user
+        clock_ins = await utils.ClockIn.get_current(
+            None,
+            ctx.guild.id,
+            ctx.author.id,
+        )
 
         # Return the masks that they're clocked in with
         options = [
@@ -400,3 +549,9 @@ class UserCommands(vbu.Cog[vbu.Bot]):
 def setup(bot: vbu.Bot):
     x = UserCommands(bot)
     bot.add_cog(x)
+    config = bot.config.get("write_buffer", {})
+    utils.ClockInWriteBuffer.configure(
+        enabled=config.get("enabled", False),
+        max_delay=config.get("max_delay_ms", 5) / 1_000,
+        max_batch=config.get("max_batch", 500),
+    )
@@ -1,3 +1,15 @@
 from . import types
 from .models import *
 from .formatter import *
+from .mask_registry import *
+from .autocomplete import *
+from .metrics import *
+from .report_pool import *
+from .export import *
+from .day_buckets import *
+from .partitions import *
+from .auto_clock_out import *
+from .api_keys import *
+from .render_cache import *
+from .event_log import *
+from .shared_cache import *
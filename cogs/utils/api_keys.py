@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+from datetime import datetime as dt
+import hashlib
+import hmac
+import secrets
+from typing import TYPE_CHECKING, Optional
+
+from .metrics import Metrics
+from .models import queries
+
+if TYPE_CHECKING:
+    import asyncpg
+    from discord.ext import vbu
+
+
+__all__ = (
+    'reset_api_key',
+    'get_api_state',
+    'check_api_key',
+)
+
+
+def _hash_api_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+@Metrics.timed("query")
+async def reset_api_key(
+        db: vbu.Database,
+        guild_id: int) -> str:
+    """
+    Generate a new API key for a guild, replacing any that it already had.
+    Only the key's hash is stored, so the key itself is returned to be shown
+    to the user once.
+    """
+
+    api_key = secrets.token_urlsafe(32)
+    await queries.SET_API_KEY_HASH.fetch(db, guild_id, _hash_api_key(api_key))
+    return api_key
+
+
+@Metrics.timed("query")
+async def get_api_state(
+        db: vbu.Database,
+        guild_id: int,
+        start: dt,
+        end: dt) -> asyncpg.Record:
+    """
+    Get a guild's API key hash, a fingerprint of the daily totals that an
+    export between the given times would read (and of the guild's open
+    clock ins), and whether anyone in it is clocked in. The fingerprint is
+    built from the transaction IDs that wrote each total, so it changes as
+    soon as a write commits, whatever order writes commit in.
+    """
+
+    return await queries.GET_API_STATE.fetchrow(
+        db,
+        guild_id,
+        start,
+        end,
+        dt(2000, 1, 1),
+    )
+
+
+def check_api_key(
+        api_key: str,
+        api_key_hash: Optional[str]) -> bool:
+    """
+    Check an API key against a stored hash, in constant time.
+    """
+
+    if api_key_hash is None:
+        return False
+    return hmac.compare_digest(_hash_api_key(api_key), api_key_hash)
@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime as dt, timedelta
+import heapq
+import logging
+from typing import TYPE_CHECKING, ClassVar, NamedTuple, Optional
+
+from .metrics import Metrics
+from .models import ClockIn, OpenSessionIndex, queries
+
+if TYPE_CHECKING:
+    from discord.ext import vbu
+
+
+__all__ = (
+    'AutoClockOut',
+)
+
+
+log = logging.getLogger("cogs.utils.auto_clock_out")
+
+
+class _Deadline(NamedTuple):
+    at: dt
+    clock_in_id: str
+    guild_id: int
+    user_id: int
+    mask: str
+
+
+class AutoClockOut:
+    """
+    Clocks users out once they've been clocked in for longer than their
+    guild's maximum shift length, at the moment that the limit was reached.
+
+    Deadlines are kept in a min-heap, and a single task sleeps until the
+    earliest one rather than polling the database. Entries aren't removed
+    when a clock in is closed or a guild's setting changes - they're checked
+    against the database when they come due, and skipped if they no longer
+    match. Adding a clock in and handling a deadline are both
+    O(log n).
+
+    Each shard process only schedules the guilds on its own shards, and
+    clock outs only close a clock in if it's still open with the same
+    start time, so a clock out made elsewhere is never overwritten.
+    """
+
+    max_shift_lengths: ClassVar[dict[int, timedelta]] = {}
+    shard_count: ClassVar[int] = 1
+    shard_ids: ClassVar[list[int]] = [0]
+
+    _heap: ClassVar[list[_Deadline]] = []
+    _scheduled_during_rebuild: ClassVar[Optional[list[_Deadline]]] = None
+    _wakeup: ClassVar[Optional[asyncio.Event]] = None
+    _task: ClassVar[Optional[asyncio.Task]] = None
+
+    @classmethod
+    async def start(
+            cls,
+            shard_count: Optional[int] = None,
+            shard_ids: Optional[list[int]] = None) -> None:
+        """
+        Load the maximum shift lengths for the guilds on the given shards
+        (or every guild, if there's no sharding) and start the scheduler if
+        it isn't already running. Open clock ins need to have been hydrated
+        into the open session index first.
+        """
+
+        if cls._task is not None and not cls._task.done():
+            return
+        cls.shard_count = shard_count or 1
+        cls.shard_ids = list(range(cls.shard_count)) if shard_ids is None else shard_ids
+        cls._wakeup = asyncio.Event()
+        ClockIn.add_write_listener(cls.on_clock_in_written)
+        await cls.rebuild()
+        cls._task = asyncio.create_task(cls._run())
+
+    @classmethod
+    def stop(cls) -> None:
+        """
+        Stop the scheduler.
+        """
+
+        ClockIn.remove_write_listener(cls.on_clock_in_written)
+        if cls._task is not None:
+            cls._task.cancel()
+            cls._task = None
+
+    @classmethod
+    @Metrics.timed("query")
+    async def rebuild(cls, db: Optional[vbu.Database] = None) -> None:
+        """
+        Replace the heap with a fresh one built from the database with a
+        single query. Anything scheduled while the query was running is
+        kept.
+        """
+
+        cls._scheduled_during_rebuild = []
+        try:
+            async with queries.acquire(db) as db:
+                rows = await queries.GET_MAX_SHIFT_SESSIONS.fetch(
+                    db,
+                    cls.shard_count,
+                    cls.shard_ids,
+                )
+            scheduled = cls._scheduled_during_rebuild
+        finally:
+            cls._scheduled_during_rebuild = None
+        max_shift_lengths: dict[int, timedelta] = {}
+        heap: set[_Deadline] = set(scheduled)
+        for row in rows:
+            max_shift_lengths[row['guild_id']] = row['max_shift_length']
+            if row['id'] is None:
+                continue
+            heap.add(_Deadline(
+                row['clock_in'] + row['max_shift_length'],
+                str(row['id']),
+                row['guild_id'],
+                row['user_id'],
+                row['mask'],
+            ))
+        cls.max_shift_lengths = max_shift_lengths
+        cls._heap = list(heap)
+        heapq.heapify(cls._heap)
+        cls._wake()
+
+    @classmethod
+    @Metrics.timed("query")
+    async def set_max_shift_length(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            max_shift_length: Optional[timedelta]) -> None:
+        """
+        Set (or, with ``None``, remove) a guild's maximum shift length, and
+        schedule the guild's open clock ins against it.
+        """
+
+        await queries.SET_MAX_SHIFT_LENGTH.fetch(db, guild_id, max_shift_length)
+        if max_shift_length is None:
+            cls.max_shift_lengths.pop(guild_id, None)
+            return
+        cls.max_shift_lengths[guild_id] = max_shift_length
+        for clock_in in OpenSessionIndex.get_for_guild(guild_id):
+            cls.schedule(clock_in)
+
+    @classmethod
+    def on_clock_in_written(cls, clock_in: ClockIn) -> None:
+        """
+        Schedule newly opened clock ins. Closed ones are left for
+        :meth:`_expire` to skip.
+        """
+
+        if clock_in.clocked_out_at is None:
+            cls.schedule(clock_in)
+
+    @classmethod
+    def schedule(cls, clock_in: ClockIn) -> None:
+        """
+        Add an open clock in to the heap, if its guild has a maximum shift
+        length.
+        """
+
+        max_shift_length = cls.max_shift_lengths.get(clock_in.guild_id)
+        if max_shift_length is None or not cls.is_own_guild(clock_in.guild_id):
+            return
+        deadline = _Deadline(
+            clock_in.clocked_in_at + max_shift_length,
+            clock_in.id,
+            clock_in.guild_id,
+            clock_in.user_id,
+            clock_in.mask,
+        )
+        heapq.heappush(cls._heap, deadline)
+        if cls._scheduled_during_rebuild is not None:
+            cls._scheduled_during_rebuild.append(deadline)
+        if cls._heap[0] is deadline:
+            cls._wake()
+
+    @classmethod
+    def is_own_guild(cls, guild_id: int) -> bool:
+        """
+        Whether a guild is on one of this process's shards.
+        """
+
+        return (guild_id >> 22) % cls.shard_count in cls.shard_ids
+
+    @classmethod
+    def _wake(cls) -> None:
+        if cls._wakeup is not None:
+            cls._wakeup.set()
+
+    @classmethod
+    async def _run(cls) -> None:
+        """
+        Sleep until the earliest deadline (or until an earlier one is added),
+        then clock out everything that's due.
+        """
+
+        assert cls._wakeup
+        while True:
+            cls._wakeup.clear()
+            now = dt.utcnow()
+            due: list[_Deadline] = []
+            while cls._heap and cls._heap[0].at <= now:
+                due.append(heapq.heappop(cls._heap))
+            if due:
+                try:
+                    await cls._expire(due)
+                except Exception:
+                    log.exception("Failed to automatically clock out %s clock ins", len(due))
+                    for deadline in due:
+                        heapq.heappush(cls._heap, deadline)
+                    await asyncio.sleep(60)
+                    continue
+
+            timeout = None
+            if cls._heap:
+                timeout = max((cls._heap[0].at - dt.utcnow()).total_seconds(), 0)
+            try:
+                await asyncio.wait_for(cls._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    @classmethod
+    async def _expire(cls, due: list[_Deadline]) -> None:
+        """
+        Clock out each of the due clock ins that's still open and still
+        past its guild's maximum shift length. This is checked by the
+        database rather than the open session index, since the index can be
+        behind writes made by other processes.
+        """
+
+        async with queries.acquire() as db:
+            for deadline in due:
+                max_shift_length = cls.max_shift_lengths.get(deadline.guild_id)
+                if max_shift_length is None:
+                    continue
+                rows = await queries.EXPIRE_SESSION.fetch(
+                    db,
+                    deadline.guild_id,
+                    deadline.user_id,
+                    deadline.mask,
+                    deadline.clock_in_id,
+                    deadline.at - max_shift_length,
+                    deadline.at,
+                )
+                for row in rows:
+                    ClockIn.written(ClockIn.from_row(row))
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import discord
+
+
+__all__ = (
+    'get_focused_value',
+)
+
+
+def get_focused_value(
+        interaction: discord.AutocompleteInteraction) -> Optional[str]:
+    """
+    Get the value that the user has partially typed into the option that
+    they're currently focused on, searching through any subcommand options.
+
+
+    Parameters
+    ----------
+    interaction : discord.AutocompleteInteraction
+        The autocomplete interaction to look through.
+    """
+
+    options = list(interaction.options or ())
+    while options:
+        option = options.pop(0)
+        if getattr(option, "focused", False):
+            return str(option.value) if option.value is not None else None
+        options.extend(getattr(option, "options", None) or ())
+    return None
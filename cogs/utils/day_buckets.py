@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from array import array
+import collections
+from datetime import date, timedelta
+from typing import Optional
+
+from .models.clock_in_batch import ClockInBatch, MICROSECONDS_PER_DAY
+
+
+__all__ = (
+    'split_by_day',
+)
+
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Admin-managed durations are stored as starting on this day
+MANAGED_DAY = date(2000, 1, 1).toordinal() - EPOCH_ORDINAL
+
+
+def split_by_day(
+        batch: ClockInBatch,
+        *,
+        start: Optional[date] = None,
+        end: Optional[date] = None) -> dict[tuple[date, int, str], timedelta]:
+    """
+    Split every clock in in a batch at day boundaries (UTC), and total the
+    time that falls on each day per user and mask.
+
+    A clock in from 22:00 until 06:00 the next day puts two hours on the first
+    day and six on the second. Open clock ins are measured up until the
+    batch's "now". Durations that are zero or negative (such as admin
+    removals) aren't intervals that can be split, so are put wholly on the day
+    that they start on, as are admin-managed durations - however long they
+    are, they all belong on the managed day.
+
+    This is still a Python loop over every clock in - working from the
+    batch's arrays only saves building a :class:`ClockIn` for each row.
+    Clock ins within a single day (nearly all of them) are added to their day
+    as they're met, and only those that cross midnight are split day by day,
+    so the cost is linear in the number of clock ins plus the number of extra
+    days that they cross.
+
+
+    Parameters
+    ----------
+    batch : ClockInBatch
+        The clock ins to split.
+    start : Optional[datetime.date]
+        If given, days before this are left out of the result.
+    end : Optional[datetime.date]
+        If given, this day and any after it are left out of the result.
+    """
+
+    clock_ins = batch.clock_ins
+    clock_outs = batch.clock_outs_or_now()
+    start_days = array('q', [i // MICROSECONDS_PER_DAY for i in clock_ins])
+    end_days = array('q', [
+        (clock_out - 1) // MICROSECONDS_PER_DAY
+        if clock_out > clock_in and start_day != MANAGED_DAY
+        else start_day
+        for clock_in, clock_out, start_day in zip(clock_ins, clock_outs, start_days)
+    ])
+
+    totals: dict[tuple[int, int, int], int] = collections.defaultdict(int)
+    crossing: list[int] = []
+    for index, (user_id, mask_code, clock_in, clock_out, start_day, end_day) in enumerate(zip(
+            batch.user_ids,
+            batch.mask_codes,
+            clock_ins,
+            clock_outs,
+            start_days,
+            end_days)):
+        if start_day == end_day:
+            totals[(start_day, user_id, mask_code)] += clock_out - clock_in
+        else:
+            crossing.append(index)
+
+    # Split the clock ins that cross midnight
+    for index in crossing:
+        user_id = batch.user_ids[index]
+        mask_code = batch.mask_codes[index]
+        clock_in, clock_out = clock_ins[index], clock_outs[index]
+        for day in range(start_days[index], end_days[index] + 1):
+            day_start = day * MICROSECONDS_PER_DAY
+            day_end = day_start + MICROSECONDS_PER_DAY
+            totals[(day, user_id, mask_code)] += (
+                min(clock_out, day_end) - max(clock_in, day_start)
+            )
+
+    # Convert the keys back into something usable
+    start_index = None if start is None else start.toordinal() - EPOCH_ORDINAL
+    end_index = None if end is None else end.toordinal() - EPOCH_ORDINAL
+    return {
+        (
+            date.fromordinal(EPOCH_ORDINAL + day),
+            user_id,
+            batch.masks[mask_code],
+        ): timedelta(microseconds=total)
+        for (day, user_id, mask_code), total in totals.items()
+        if (start_index is None or day >= start_index)
+        and (end_index is None or day < end_index)
+    }
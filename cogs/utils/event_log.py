@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+from datetime import datetime as dt, timedelta
+import json
+from typing import TYPE_CHECKING, NamedTuple, Optional
+
+from .metrics import Metrics
+from .models import queries
+
+if TYPE_CHECKING:
+    from discord.ext import vbu
+
+
+__all__ = (
+    'ClockEvent',
+    'UserState',
+    'ClockEventLog',
+)
+
+
+class ClockEvent(NamedTuple):
+    id: int
+    kind: str
+    mask: str
+    clock_in_id: str
+    clock_in: dt
+    clock_out: Optional[dt]
+    seconds: float
+    recorded_at: dt
+    transaction_id: int
+
+    @classmethod
+    def from_row(cls, row: dict) -> ClockEvent:
+        return cls(
+            id=row['id'],
+            kind=row['kind'],
+            mask=row['mask'],
+            clock_in_id=str(row['clock_in_id']),
+            clock_in=row['clock_in'],
+            clock_out=row['clock_out'],
+            seconds=row['seconds'],
+            recorded_at=row['recorded_at'],
+            transaction_id=row['transaction_id'],
+        )
+
+
+class UserState:
+    """
+    A user's closed time per mask and their open clock ins, as derived from
+    their events from transactions before :attr:`horizon`. :attr:`event_id`
+    is the newest of those events.
+    """
+
+    __slots__ = (
+        'event_id',
+        'horizon',
+        'totals',
+        'open',
+    )
+
+    def __init__(
+            self,
+            event_id: int = 0,
+            horizon: int = 0,
+            totals: Optional[dict[str, float]] = None,
+            open: Optional[dict[str, tuple[str, dt]]] = None):
+        self.event_id: int = event_id
+        self.horizon: int = horizon
+        self.totals: dict[str, float] = totals or {}
+        self.open: dict[str, tuple[str, dt]] = open or {}
+
+    def apply(self, event: ClockEvent) -> None:
+        """
+        Move the state on by a single event.
+        """
+
+        self.event_id = max(self.event_id, event.id)
+        if event.seconds:
+            self.totals[event.mask] = self.totals.get(event.mask, 0) + event.seconds
+        if event.kind not in ("removed", "archived") and event.clock_out is None:
+            self.open[event.clock_in_id] = (event.mask, event.clock_in)
+        else:
+            self.open.pop(event.clock_in_id, None)
+
+    def total_by_mask(self, now: Optional[dt] = None) -> dict[str, timedelta]:
+        """
+        Get the total time per mask, with open clock ins measured up until
+        the given time (or the current time).
+        """
+
+        now = now or dt.utcnow()
+        totals = {
+            mask: timedelta(seconds=seconds)
+            for mask, seconds in self.totals.items()
+        }
+        for mask, clock_in in self.open.values():
+            totals[mask] = totals.get(mask, timedelta(0)) + (now - clock_in)
+        return totals
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "totals": self.totals,
+            "open": {
+                clock_in_id: [mask, clock_in.isoformat()]
+                for clock_in_id, (mask, clock_in) in self.open.items()
+            },
+        })
+
+    @classmethod
+    def from_json(cls, event_id: int, horizon: int, data: str) -> UserState:
+        state = json.loads(data)
+        return cls(
+            event_id,
+            horizon,
+            state["totals"],
+            {
+                clock_in_id: (mask, dt.fromisoformat(clock_in))
+                for clock_in_id, (mask, clock_in) in state["open"].items()
+            },
+        )
+
+
+class ClockEventLog:
+    """
+    Reads the append-only log of clock in events, and keeps each user's
+    snapshot of their derived state up to date so that rebuilding it only
+    means replaying the events since their snapshot. Events are logged by a
+    trigger on clock_ins, so each write to it costs an extra insert.
+
+    Events are numbered in the order that they're written rather than the
+    order that they're committed, so snapshots go by transaction instead. A
+    snapshot covers the events from transactions before its horizon - the
+    oldest transaction that was still running when it was taken - all of
+    which had finished, and replays pick up every event from the horizon
+    onwards, however it's numbered.
+    """
+
+    @classmethod
+    @Metrics.timed("query")
+    async def get_latest_events(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            user_id: int,
+            limit: int) -> list[ClockEvent]:
+        """
+        Get a user's most recent events, newest first.
+        """
+
+        rows = await queries.GET_LATEST_EVENTS.fetch(db, guild_id, user_id, limit)
+        return [ClockEvent.from_row(row) for row in rows]
+
+    @classmethod
+    async def _get_snapshot(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            user_id: int) -> UserState:
+        snapshot = await queries.GET_EVENT_SNAPSHOT.fetchrow(db, guild_id, user_id)
+        if snapshot is None:
+            return UserState()
+        return UserState.from_json(
+            snapshot['event_id'],
+            snapshot['horizon'],
+            snapshot['state'],
+        )
+
+    @classmethod
+    @Metrics.timed("query")
+    async def get_state(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            user_id: int) -> UserState:
+        """
+        Rebuild a user's state from their latest snapshot and the events
+        since its horizon.
+        """
+
+        state = await cls._get_snapshot(db, guild_id, user_id)
+        rows = await queries.GET_EVENTS_SINCE.fetch(db, guild_id, user_id, state.horizon)
+        for row in rows:
+            state.apply(ClockEvent.from_row(row))
+        return state
+
+    @classmethod
+    async def get_settled_state(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            user_id: int,
+            horizon: int) -> Optional[UserState]:
+        """
+        Rebuild a user's state from the events from transactions before the
+        given horizon, to be snapshotted. Returns ``None`` if there's nothing
+        new to snapshot.
+
+        Writes to a clock in wait for the last one to commit, but a later
+        write can still be from an older transaction. If an event from the
+        horizon onwards comes before one from before it for the same clock
+        in, replaying from the snapshot would apply them out of order, so
+        the horizon is pulled back to before it.
+        """
+
+        state = await cls._get_snapshot(db, guild_id, user_id)
+        events = [
+            ClockEvent.from_row(row)
+            for row in await queries.GET_EVENTS_SINCE.fetch(db, guild_id, user_id, state.horizon)
+        ]
+        while True:
+            first_unsettled: dict[str, ClockEvent] = {}
+            for event in events:
+                if event.transaction_id >= horizon:
+                    first_unsettled.setdefault(event.clock_in_id, event)
+            overtaken = [
+                first_unsettled[event.clock_in_id].transaction_id
+                for event in events
+                if event.transaction_id < horizon
+                and event.clock_in_id in first_unsettled
+                and first_unsettled[event.clock_in_id].id < event.id
+            ]
+            if not overtaken:
+                break
+            horizon = min(overtaken)
+        if horizon <= state.horizon:
+            return None
+        for event in events:
+            if event.transaction_id < horizon:
+                state.apply(event)
+        state.horizon = horizon
+        return state
+
+    @classmethod
+    @Metrics.timed("query")
+    async def take_snapshots(
+            cls,
+            db: vbu.Database,
+            after: int,
+            *,
+            batch_size: int = 10_000) -> int:
+        """
+        Snapshot every user with events from the transactions that have
+        finished since the given horizon, in batches of about
+        ``batch_size`` events.
+
+        Returns the horizon that the next call should start from, which is
+        ``after`` again once there's nothing settled left.
+        """
+
+        rows = await queries.GET_SETTLED_EVENT_USERS.fetch(db, after, batch_size)
+        for row in rows:
+            state = await cls.get_settled_state(
+                db,
+                row['guild_id'],
+                row['user_id'],
+                row['horizon'],
+            )
+            if state is None:
+                continue
+            await queries.SET_EVENT_SNAPSHOT.fetch(
+                db,
+                row['guild_id'],
+                row['user_id'],
+                state.event_id,
+                state.horizon,
+                state.to_json(),
+            )
+        if not rows:
+            return after
+        return rows[0]['horizon']
+
+    @classmethod
+    async def get_high_water_mark(cls, db: vbu.Database) -> int:
+        """
+        Get the newest horizon that anyone's been snapshotted up to, which is
+        where snapshotting picks up from after a restart.
+        """
+
+        row = await queries.GET_SNAPSHOT_HIGH_WATER_MARK.fetchrow(db)
+        return row['horizon']
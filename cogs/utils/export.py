@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+from datetime import date, datetime as dt, timedelta
+import gzip
+import io
+import shutil
+import tempfile
+from typing import IO, TYPE_CHECKING, AsyncIterator, Optional
+
+import discord
+
+from .day_buckets import split_by_day
+from .models import ClockIn, ClockInBatch
+from .report_pool import ReportPool
+
+if TYPE_CHECKING:
+    from discord.ext import vbu
+
+
+__all__ = (
+    'iter_export_csv',
+    'write_export_csv',
+    'prepare_export_files',
+)
+
+
+# Files bigger than this are moved from memory onto disk
+SPOOL_MAX_SIZE = 1024 * 1024
+
+# The most attachments that Discord allows on a single message
+MAX_ATTACHMENTS = 10
+
+CSV_HEADER = ["Year", "Month", "Day", "User ID", "Mask", "Duration"]
+
+
+def _encode_csv_rows(rows: list[tuple[int, int, str, float]]) -> bytes:
+    """
+    Encode daily totals, given as (day ordinal, user ID, mask, seconds)
+    tuples, as CSV rows. This is run in the report pool.
+    """
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for ordinal, user_id, mask, total_seconds in rows:
+        day = date.fromordinal(ordinal)
+        writer.writerow([
+            day.year,
+            day.month,
+            day.day,
+            f"{user_id}\t",
+            mask,
+            total_seconds,
+        ])
+    return buffer.getvalue().encode()
+
+
+async def iter_export_csv(
+        db: vbu.Database,
+        guild_id: int,
+        start: dt,
+        end: dt,
+        *,
+        now: Optional[dt] = None) -> AsyncIterator[bytes]:
+    """
+    Generate a CSV of each user's total clock in time per day, per mask, for
+    a guild, yielding it in encoded chunks as it's read from the database.
+
+    Closed time is read from the daily totals rollup and streamed back in
+    batches, so only a couple of batches are held in memory at any time.
+    Time from open clock ins is split across the days that it covers and
+    merged in. The splitting and the CSV encoding are done in the
+    :class:`ReportPool`.
+
+
+    Parameters
+    ----------
+    db : vbu.Database
+        The database connection to stream the totals through.
+    guild_id : int
+        The guild to export.
+    start : datetime.datetime
+        The time to start the export from. The whole of its day is included.
+    end : datetime.datetime
+        The time to end the export at.
+    now : Optional[datetime.datetime]
+        The time to measure open clock ins up until. Defaults to the current
+        time.
+    """
+
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(CSV_HEADER)
+    yield buffer.getvalue().encode()
+
+    # Get the time from open clock ins
+    open_clock_ins = await ClockInBatch.fetch_for_guild(
+        db,
+        guild_id,
+        closed=False,
+        now=now,
+    )
+    open_totals = await ReportPool.run(
+        split_by_day,
+        open_clock_ins,
+        start=start.date(),
+        end=(end - timedelta(microseconds=1)).date() + timedelta(days=1),
+    )
+
+    # And write the totals, reading each batch while the last is encoded
+    pending: Optional[asyncio.Future[bytes]] = None
+    async for batch in ClockIn.iter_daily_totals(
+            db,
+            guild_id,
+            start,
+            end,
+            extra=open_totals):
+        encoded = ReportPool.run(_encode_csv_rows, [
+            (total.day.toordinal(), total.user_id, total.mask, total.total_seconds)
+            for total in batch
+        ])
+        if pending is not None:
+            yield await pending
+        pending = encoded
+    if pending is not None:
+        yield await pending
+
+
+async def write_export_csv(
+        db: vbu.Database,
+        guild_id: int,
+        start: dt,
+        end: dt) -> IO[bytes]:
+    """
+    Write the output of :func:`iter_export_csv` into a spooled temporary
+    file, returning the file rewound to its start.
+
+
+    Parameters
+    ----------
+    db : vbu.Database
+        The database connection to stream the totals through.
+    guild_id : int
+        The guild to export.
+    start : datetime.datetime
+        The time to start the export from. The whole of its day is included.
+    end : datetime.datetime
+        The time to end the export at.
+    """
+
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    async for chunk in iter_export_csv(db, guild_id, start, end):
+        output.write(chunk)
+    output.seek(0)
+    return output
+
+
+def _split_csv(
+        file: IO[bytes],
+        size_limit: int) -> list[IO[bytes]]:
+    """
+    Split a CSV file into parts no larger than the size limit, each with the
+    header row repeated at the top.
+    """
+
+    header = file.readline()
+    parts: list[IO[bytes]] = []
+    current: IO[bytes] | None = None
+    current_size = 0
+    for line in file:
+        if current is None or current_size + len(line) > size_limit:
+            current = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+            current.write(header)
+            current_size = len(header)
+            parts.append(current)
+        current.write(line)
+        current_size += len(line)
+    for part in parts:
+        part.seek(0)
+    return parts
+
+
+def prepare_export_files(
+        file: IO[bytes],
+        filename: str,
+        size_limit: int) -> list[discord.File]:
+    """
+    Turn an export into files that fit within Discord's attachment size
+    limit. Files that are too large are gzipped, and if they're still too
+    large, they're split into several CSV files instead.
+
+
+    Parameters
+    ----------
+    file : IO[bytes]
+        The CSV file to upload, rewound to its start.
+    filename : str
+        The name of the CSV file, including its extension.
+    size_limit : int
+        The largest a single attachment can be, in bytes.
+    """
+
+    # See if it fits as-is
+    file.seek(0, io.SEEK_END)
+    size = file.tell()
+    file.seek(0)
+    if size <= size_limit:
+        return [discord.File(file, filename=filename)]
+
+    # Try compressing it
+    compressed = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    with gzip.GzipFile(fileobj=compressed, mode="wb") as gzip_file:
+        shutil.copyfileobj(file, gzip_file)
+    if compressed.tell() <= size_limit:
+        compressed.seek(0)
+        return [discord.File(compressed, filename=f"{filename}.gz")]
+    compressed.close()
+
+    # Split it into parts
+    file.seek(0)
+    stem = filename.rsplit(".", 1)[0]
+    return [
+        discord.File(part, filename=f"{stem}_{index}.csv")
+        for index, part in enumerate(_split_csv(file, size_limit), start=1)
+    ]
@@ -1,7 +1,22 @@
 from datetime import timedelta
+import re
+from typing import Optional
 
 __all__ = (
     'format_timedelta',
+    'parse_duration',
+)
+
+
+DURATION_PATTERN = re.compile(
+    (
+        r"(?:(?P<negative>-)?)\s*"
+        r"(?:(?P<days>\d+?)d)?\s*"
+        r"(?:(?P<hours>\d+?)h)?\s*"
+        r"(?:(?P<minutes>\d+?)m)?\s*"
+        r"(?:(?P<seconds>\d+?)s)?"
+    ),
+    re.IGNORECASE,
 )
 
 
@@ -42,3 +57,31 @@ def format_timedelta(td: timedelta) -> str:
     # Return the string
     return string
 
+
+def parse_duration(value: str) -> Optional[timedelta]:
+    """
+    Parse a duration given as a string like "-1d 2h 3m 4s" into a timedelta,
+    where every part is optional but at least one must be given. Returns
+    ``None`` if the string isn't a duration.
+
+
+    Parameters
+    ----------
+    value : str
+        The duration that you want to parse.
+    """
+
+    match = DURATION_PATTERN.fullmatch(value.strip())
+    if not match:
+        return None
+    if not any(match.group(i) for i in ("days", "hours", "minutes", "seconds")):
+        return None
+    duration = timedelta(
+        days=int(match.group("days") or 0),
+        hours=int(match.group("hours") or 0),
+        minutes=int(match.group("minutes") or 0),
+        seconds=int(match.group("seconds") or 0),
+    )
+    if match.group("negative"):
+        duration = -duration
+    return duration
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import collections
+from typing import TYPE_CHECKING, ClassVar, Optional
+
+from .models import queries
+from .shared_cache import SharedCache
+
+if TYPE_CHECKING:
+    from discord.ext import vbu
+
+
+__all__ = (
+    'MaskRegistry',
+)
+
+
+class _GuildMasks:
+    """
+    The cached masks for a single guild, along with a sorted index of their
+    casefolded names so that they can be searched by prefix.
+    """
+
+    __slots__ = (
+        'roles',
+        '_keys',
+        '_masks',
+    )
+
+    def __init__(self, roles: dict[int, list[str]]):
+        self.roles: dict[int, list[str]] = roles
+        index = sorted(
+            (mask.casefold(), mask)
+            for masks in roles.values()
+            for mask in masks
+        )
+        self._keys: list[str] = [i[0] for i in index]
+        self._masks: list[str] = [i[1] for i in index]
+
+    def search(self, value: str, limit: int, max_scan: int) -> list[str]:
+        """
+        Get up to ``limit`` masks matching the given value. Masks starting
+        with the value come first (exact matches first, then alphabetically),
+        followed by masks that contain it elsewhere, ranked by how early the
+        match is. No more than ``max_scan`` masks are checked for the
+        substring matches so that huge guilds have a bounded search time.
+        """
+
+        value = value.strip().casefold()
+        if not value:
+            return self._masks[:limit]
+
+        # Prefix matches are a contiguous run in the sorted keys
+        start = bisect.bisect_left(self._keys, value)
+        found: list[str] = []
+        for i in range(start, len(self._keys)):
+            if len(found) >= limit or not self._keys[i].startswith(value):
+                break
+            found.append(self._masks[i])
+        if len(found) >= limit:
+            return found
+
+        # Fill the rest with masks that contain the value
+        contains: list[tuple[int, str]] = []
+        for key, mask in zip(self._keys[:max_scan], self._masks[:max_scan]):
+            position = key.find(value)
+            if position > 0:
+                contains.append((position, mask))
+        contains.sort(key=lambda i: i[0])
+        found.extend(mask for _, mask in contains[:limit - len(found)])
+        return found
+
+
+class MaskRegistry:
+    """
+    An in-memory cache of each guild's masks, stored as a role ID -> mask
+    list mapping. Guilds are loaded lazily the first time they're asked for,
+    and are dropped again whenever their masks are written to.
+
+    If the shared cache is on, guilds that aren't cached locally are looked
+    for in Redis before the database, and writes drop the guild in every
+    process. While Redis can't be reached, other processes' writes can't be
+    heard about, so masks are read from the database every time instead.
+    """
+
+    AUTOCOMPLETE_LIMIT: ClassVar[int] = 25
+    SEARCH_MAX_SCAN: ClassVar[int] = 2_000
+    SHARED_TTL: ClassVar[int] = 300
+
+    _cache: ClassVar[dict[int, _GuildMasks]] = {}
+    _locks: ClassVar[dict[int, asyncio.Lock]] = {}
+    _generations: ClassVar[collections.Counter[int]] = collections.Counter()
+
+    @classmethod
+    async def get(
+            cls,
+            guild_id: int,
+            db: Optional[vbu.Database] = None) -> dict[int, list[str]]:
+        """
+        Get the role ID -> mask list mapping for a guild, only going to the
+        database if the guild isn't already cached. If no database
+        connection is given and one is needed, one will be opened.
+        """
+
+        return (await cls._get_guild(guild_id, db)).roles
+
+    @classmethod
+    async def _get_guild(
+            cls,
+            guild_id: int,
+            db: Optional[vbu.Database] = None) -> _GuildMasks:
+        """
+        Get the cached masks for a guild, loading them if need be.
+        """
+
+        # Nothing can be trusted to be fresh if we can't hear about writes
+        if SharedCache.degraded():
+            return _GuildMasks(await cls._load(guild_id, db))
+
+        # See if it's cached
+        try:
+            return cls._cache[guild_id]
+        except KeyError:
+            pass
+
+        # Only let one task fill a given guild at a time
+        lock = cls._locks.setdefault(guild_id, asyncio.Lock())
+        async with lock:
+            if guild_id in cls._cache:
+                return cls._cache[guild_id]
+            generation = cls._generations[guild_id]
+            shared = await SharedCache.get(f"masks:{guild_id}")
+            if shared is not None:
+                roles = {int(role_id): masks for role_id, masks in shared.items()}
+            else:
+                roles = await cls._load(guild_id, db)
+            masks = _GuildMasks(roles)
+
+            # Don't store the result if it was invalidated mid-query
+            if generation == cls._generations[guild_id]:
+                cls._cache[guild_id] = masks
+                if shared is None:
+                    await SharedCache.set(f"masks:{guild_id}", roles, cls.SHARED_TTL)
+            return masks
+
+    @staticmethod
+    async def _load(
+            guild_id: int,
+            db: Optional[vbu.Database] = None) -> dict[int, list[str]]:
+        """
+        Read a guild's masks from the database.
+        """
+
+        async with queries.acquire(db) as db:
+            rows = await queries.GET_GUILD_MASKS.fetch(db, guild_id)
+        roles: dict[int, list[str]] = collections.defaultdict(list)
+        for row in rows:
+            roles[row['role_id']].append(row['mask'])
+        return dict(roles)
+
+    @classmethod
+    async def get_all_masks(cls, guild_id: int) -> list[str]:
+        """
+        Get every mask that exists in a guild.
+        """
+
+        roles = await cls.get(guild_id)
+        return [mask for masks in roles.values() for mask in masks]
+
+    @classmethod
+    async def search(
+            cls,
+            guild_id: int,
+            value: str | None,
+            limit: int | None = None) -> list[str]:
+        """
+        Get the masks in a guild that best match a partially typed value,
+        capped at Discord's autocomplete limit.
+        """
+
+        masks = await cls._get_guild(guild_id)
+        return masks.search(
+            value or "",
+            limit or cls.AUTOCOMPLETE_LIMIT,
+            cls.SEARCH_MAX_SCAN,
+        )
+
+    @classmethod
+    async def get_masks_for_roles(
+            cls,
+            guild_id: int,
+            role_ids: list[int],
+            db: Optional[vbu.Database] = None) -> list[str]:
+        """
+        Get the masks that are available to any of the given roles.
+        """
+
+        roles = await cls.get(guild_id, db)
+        return [
+            mask
+            for role_id in role_ids
+            for mask in roles.get(role_id, ())
+        ]
+
+    @classmethod
+    async def add(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            role_id: int,
+            mask: str) -> None:
+        """
+        Add a mask to a role, and drop the guild from the cache in every
+        process. Raises :class:`asyncpg.UniqueViolationError` if the mask
+        already exists.
+        """
+
+        try:
+            await queries.ADD_MASK.fetch(db, guild_id, role_id, mask)
+        finally:
+            await cls.invalidate_shared(guild_id)
+
+    @classmethod
+    async def remove(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            mask: str) -> list[int]:
+        """
+        Remove a mask from a guild, and drop the guild from the cache in
+        every process. Returns the IDs of the roles that the mask was removed
+        from.
+        """
+
+        try:
+            rows = await queries.REMOVE_MASK.fetch(db, guild_id, mask)
+        finally:
+            await cls.invalidate_shared(guild_id)
+        return [row['role_id'] for row in rows]
+
+    @classmethod
+    def invalidate(cls, guild_id: int) -> None:
+        """
+        Drop a guild from the cache so that it's reloaded on its next use.
+        This should be called after any write to a guild's masks.
+        """
+
+        cls._generations[guild_id] += 1
+        cls._cache.pop(guild_id, None)
+
+    @classmethod
+    def invalidate_all(cls) -> None:
+        """
+        Drop every guild from the cache, including any that are being
+        loaded.
+        """
+
+        for guild_id in set(cls._cache) | set(cls._locks):
+            cls.invalidate(guild_id)
+
+    @classmethod
+    async def invalidate_shared(cls, guild_id: int) -> None:
+        """
+        Drop a guild from this process's cache and from Redis, and tell the
+        other processes to drop it too.
+        """
+
+        cls.invalidate(guild_id)
+        await SharedCache.invalidate(
+            f"masks:{guild_id}",
+            {"kind": "masks", "guild_id": guild_id},
+        )
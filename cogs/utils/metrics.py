@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import collections
+import functools
+import logging
+import time
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, ClassVar, NamedTuple, Optional, TypeVar
+
+if TYPE_CHECKING:
+    from discord.ext import vbu
+
+
+class _Metric(NamedTuple):
+    kind: str
+    name: str
+    seconds: float
+    rows: Optional[int]
+    error: bool
+
+
+__all__ = (
+    'Metrics',
+)
+
+
+log = logging.getLogger("cogs.utils.metrics")
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+G = TypeVar("G", bound=Callable[..., AsyncIterator[Any]])
+
+
+def _count_rows(result: Any) -> int:
+    """
+    Work out how many rows a query method returned.
+    """
+
+    if result is None or isinstance(result, bool):
+        return 0
+    if isinstance(result, tuple):
+        return sum(_count_rows(i) for i in result)
+    if hasattr(result, "__len__") and not isinstance(result, str):
+        return len(result)
+    return 1
+
+
+class Metrics:
+    """
+    Sends latency, row count, and error metrics to the statsd server set up
+    in the bot's config. Metrics are tagged with the name of the command,
+    autocomplete, or query that they're for, and are skipped until
+    :meth:`setup` has been called.
+
+    Recording a metric only adds it to a buffer, so timing a call never
+    waits on statsd. The buffer is sent in one go by :meth:`flush`, which
+    the MetricsTasks cog runs every few seconds. If it isn't flushed, only
+    the latest :attr:`MAX_PENDING` metrics are kept.
+    """
+
+    PREFIX: ClassVar[str] = "clocker"
+    MAX_PENDING: ClassVar[int] = 10_000
+
+    bot: ClassVar[Optional[vbu.Bot]] = None
+    _command_starts: ClassVar[dict[int, float]] = {}
+    _pending: ClassVar[collections.deque[_Metric]] = collections.deque(maxlen=MAX_PENDING)
+
+    @classmethod
+    def setup(cls, bot: vbu.Bot) -> None:
+        """
+        Set the bot whose statsd connection should be used.
+        """
+
+        cls.bot = bot
+
+    @classmethod
+    def record(
+            cls,
+            kind: str,
+            name: str,
+            seconds: float,
+            *,
+            rows: Optional[int] = None,
+            error: bool = False) -> None:
+        """
+        Queue the metrics for a single command, autocomplete, or query to be
+        sent on the next :meth:`flush`.
+        """
+
+        if cls.bot is None:
+            return
+        cls._pending.append(_Metric(kind, name, seconds, rows, error))
+
+    @classmethod
+    async def flush(cls) -> None:
+        """
+        Send every queued metric over a single statsd connection.
+        """
+
+        if cls.bot is None or not cls._pending:
+            return
+        pending = list(cls._pending)
+        cls._pending.clear()
+        try:
+            async with cls.bot.stats() as stats:
+                for metric in pending:
+                    tags = {metric.kind: metric.name}
+                    stats.histogram(
+                        f"{cls.PREFIX}.{metric.kind}.latency",
+                        metric.seconds * 1_000,
+                        tags=tags,
+                    )
+                    if metric.rows is not None:
+                        stats.histogram(
+                            f"{cls.PREFIX}.{metric.kind}.rows",
+                            metric.rows,
+                            tags=tags,
+                        )
+                    if metric.error:
+                        stats.increment(f"{cls.PREFIX}.{metric.kind}.errors", tags=tags)
+        except Exception:
+            log.exception("Failed to send %s metrics", len(pending))
+
+    @classmethod
+    def command_started(cls, ctx: vbu.Context) -> None:
+        """
+        Mark the start of a command. Call from ``cog_before_invoke``.
+        """
+
+        cls._command_starts[id(ctx)] = time.perf_counter()
+
+    @classmethod
+    def command_finished(cls, ctx: vbu.Context) -> None:
+        """
+        Record the latency of a command, and whether it failed. Call from
+        ``cog_after_invoke``, which is run whether or not the command raised.
+        """
+
+        started = cls._command_starts.pop(id(ctx), None)
+        if started is None or ctx.command is None:
+            return
+        cls.record(
+            "command",
+            ctx.command.qualified_name,
+            time.perf_counter() - started,
+            error=ctx.command_failed,
+        )
+
+    @classmethod
+    def timed(cls, kind: str) -> Callable[[F], F]:
+        """
+        A decorator to record the latency, errors, and (for queries) the row
+        count of a coroutine function.
+        """
+
+        def decorator(function: F) -> F:
+            name = function.__qualname__
+
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                result = None
+                error = False
+                try:
+                    result = await function(*args, **kwargs)
+                    return result
+                except Exception:
+                    error = True
+                    raise
+                finally:
+                    cls.record(
+                        kind,
+                        name,
+                        time.perf_counter() - started,
+                        rows=_count_rows(result) if kind == "query" else None,
+                        error=error,
+                    )
+            return wrapper  # pyright: ignore
+        return decorator
+
+    @classmethod
+    def timed_iterator(cls, kind: str) -> Callable[[G], G]:
+        """
+        A decorator to record the latency, errors, and row count of an async
+        generator that yields batches of rows. The latency covers the time
+        until the generator is exhausted or closed.
+        """
+
+        def decorator(function: G) -> G:
+            name = function.__qualname__
+
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                rows = 0
+                error = False
+                try:
+                    async for batch in function(*args, **kwargs):
+                        rows += _count_rows(batch)
+                        yield batch
+                except Exception:
+                    error = True
+                    raise
+                finally:
+                    cls.record(
+                        kind,
+                        name,
+                        time.perf_counter() - started,
+                        rows=rows,
+                        error=error,
+                    )
+            return wrapper  # pyright: ignore
+        return decorator
@@ -0,0 +1,418 @@
+"""
+Applies the database schema and its versioned migrations.
+
+The base schema in ``config/database.pgsql`` is applied first, followed by
+each file in ``config/migrations`` (named ``NNNN_description.pgsql``) that
+hasn't been applied yet. Applied versions are recorded in the
+``schema_migrations`` table.
+
+Every statement is run on its own outside of a transaction so that indexes
+can be built with ``CREATE INDEX CONCURRENTLY`` while the bot is running. As
+such, statements must be idempotent (``IF NOT EXISTS`` and friends), and must
+be separated by a semicolon at the end of a line.
+
+Run with ``python -m cogs.utils.migrations``, with ``--check`` to EXPLAIN
+each of the ClockIn queries and make sure that they use their intended index,
+or with ``--reconcile`` to rebuild the daily totals rollup from the raw clock
+ins (which also backfills it after it's first created).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime
+import json
+import pathlib
+import re
+import uuid
+from typing import Any, Iterator, NamedTuple
+
+import asyncpg
+import toml
+
+from .day_buckets import split_by_day
+from .models import ClockInBatch, queries
+
+
+__all__ = (
+    'apply_schema',
+    'check_query_plans',
+    'reconcile_daily_totals',
+)
+
+
+CONFIG_DIRECTORY = pathlib.Path(__file__).parent.parent.parent / "config"
+BASE_SCHEMA = CONFIG_DIRECTORY / "database.pgsql"
+MIGRATIONS_DIRECTORY = CONFIG_DIRECTORY / "migrations"
+
+_MIGRATION_NAME = re.compile(r"^(?P<version>\d+)_(?P<name>\w+)\.pgsql$")
+_CONCURRENT_INDEX = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(?P<name>\w+)",
+    re.IGNORECASE,
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    path: pathlib.Path
+
+
+class QueryPlanCheck(NamedTuple):
+    name: str
+    query: str
+    args: tuple[Any, ...]
+    index: str
+
+
+# The shape of each ClockIn query along with the index it should be using
+QUERY_PLAN_CHECKS: tuple[QueryPlanCheck, ...] = (
+    QueryPlanCheck(
+        "ClockIn.get_latest",
+        """
+        SELECT * FROM clock_ins_open_sessions
+        WHERE guild_id = $1 AND user_id = $2 AND mask = $3
+        """,
+        (0, 0, ""),
+        "clock_ins_open_sessions_pkey",
+    ),
+    QueryPlanCheck(
+        "ClockIn.get_current",
+        """
+        SELECT * FROM clock_ins_open_sessions
+        WHERE guild_id = $1 AND user_id = $2
+        ORDER BY clock_in DESC
+        """,
+        (0, 0),
+        "clock_ins_open_sessions_pkey",
+    ),
+    QueryPlanCheck(
+        "ClockIn.close_session",
+        queries.CLOSE_SESSION.sql,
+        (0, 0, "", datetime.datetime(2000, 1, 1)),
+        "clock_ins_pkey",
+    ),
+    QueryPlanCheck(
+        "ClockIn.get_page (newest)",
+        queries.GET_NEWEST_PAGE.sql,
+        (0, 0, 10),
+        "clock_ins_guild_id_user_id_clock_in_id_idx",
+    ),
+    QueryPlanCheck(
+        "ClockIn.get_page",
+        queries.GET_PAGE_BEFORE.sql,
+        (0, 0, datetime.datetime(2000, 1, 1), uuid.UUID(int=0), 10),
+        "clock_ins_guild_id_user_id_clock_in_id_idx",
+    ),
+    QueryPlanCheck(
+        "ClockIn.get_mask_totals",
+        queries.GET_MASK_TOTALS.sql,
+        (0, 0),
+        "clock_daily_totals_pkey",
+    ),
+    QueryPlanCheck(
+        "ClockInBatch.fetch_for_guild",
+        queries.FETCH_BATCH_FOR_GUILD.sql,
+        (0, datetime.datetime(2000, 1, 1), datetime.datetime(2000, 2, 1), None),
+        "clock_ins_guild_id_clock_in_idx",
+    ),
+)
+
+
+def _has_code(statement: str) -> bool:
+    """
+    Whether a statement has anything in it other than comments.
+    """
+
+    return any(
+        i.strip() and not i.strip().startswith("--")
+        for i in statement.splitlines()
+    )
+
+
+def split_statements(sql: str) -> Iterator[str]:
+    """
+    Split a schema file into its statements. Statements end with a semicolon
+    at the end of a line, other than within a ``$$`` quoted function body.
+    """
+
+    current: list[str] = []
+    in_body = False
+    for line in sql.splitlines():
+        current.append(line)
+        if line.split("--", 1)[0].count("$$") % 2:
+            in_body = not in_body
+        if not in_body and line.rstrip().endswith(";"):
+            statement = "\n".join(current).strip()
+            current = []
+            if _has_code(statement):
+                yield statement
+    leftover = "\n".join(current).strip()
+    if _has_code(leftover):
+        yield leftover
+
+
+def get_migrations() -> list[Migration]:
+    """
+    Get all of the migration files, ordered by version.
+    """
+
+    migrations = []
+    for path in MIGRATIONS_DIRECTORY.glob("*.pgsql"):
+        match = _MIGRATION_NAME.match(path.name)
+        if match is None:
+            raise ValueError(f"Invalid migration filename {path.name!r}")
+        migrations.append(Migration(
+            int(match.group("version")),
+            match.group("name"),
+            path,
+        ))
+    migrations.sort()
+    versions = [i.version for i in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError("Duplicate migration versions found")
+    return migrations
+
+
+async def _run_statement(conn: asyncpg.Connection, statement: str) -> None:
+    """
+    Run a single statement, first dropping any invalid index left behind by a
+    previously failed concurrent build of the same name.
+    """
+
+    match = _CONCURRENT_INDEX.search(statement)
+    if match:
+        invalid = await conn.fetchval(
+            """
+            SELECT
+                NOT indisvalid
+            FROM
+                pg_index
+            WHERE
+                indexrelid = to_regclass($1)
+            """,
+            match.group("name"),
+        )
+        if invalid:
+            await conn.execute(
+                f"DROP INDEX CONCURRENTLY IF EXISTS {match.group('name')}"
+            )
+    await conn.execute(statement)
+
+
+async def apply_schema(conn: asyncpg.Connection) -> list[Migration]:
+    """
+    Apply the base schema and any migrations that haven't yet been applied,
+    returning the migrations that were run.
+    """
+
+    for statement in split_statements(BASE_SCHEMA.read_text()):
+        await _run_statement(conn, statement)
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations(
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT TIMEZONE('UTC', NOW())
+        )
+        """
+    )
+    applied = {
+        row['version']
+        for row in await conn.fetch("SELECT version FROM schema_migrations")
+    }
+
+    ran = []
+    for migration in get_migrations():
+        if migration.version in applied:
+            continue
+        for statement in split_statements(migration.path.read_text()):
+            await _run_statement(conn, statement)
+        await conn.execute(
+            """
+            INSERT INTO
+                schema_migrations
+                (
+                    version,
+                    name
+                )
+            VALUES
+                (
+                    $1,
+                    $2
+                )
+            """,
+            migration.version, migration.name,
+        )
+        ran.append(migration)
+    return ran
+
+
+async def reconcile_daily_totals(
+        conn: asyncpg.Connection,
+        guild_id: int | None = None) -> int:
+    """
+    Rebuild the daily totals rollup from the raw clock ins, either for a
+    single guild or for every guild. Each guild's closed clock ins are split
+    at day boundaries as one batch and copied back in, in its own
+    transaction. The rollup is locked against writes while a guild is
+    rebuilt, so that clock ins written in the meantime aren't counted twice
+    or lost. The rewritten totals are new rows, so the guild's API exports
+    get new ETags. Returns the number of rollup rows written.
+    """
+
+    if guild_id is None:
+        guild_ids = [
+            row['guild_id']
+            for row in await conn.fetch(
+                """
+                SELECT guild_id FROM clock_ins
+                UNION
+                SELECT guild_id FROM clock_daily_totals
+                """
+            )
+        ]
+    else:
+        guild_ids = [guild_id]
+
+    written = 0
+    for guild_id in guild_ids:
+        async with conn.transaction():
+            await conn.execute(
+                "LOCK TABLE clock_daily_totals IN SHARE ROW EXCLUSIVE MODE"
+            )
+            batch = await ClockInBatch.fetch_from_connection(
+                conn,
+                guild_id,
+                closed=True,
+            )
+            totals = split_by_day(batch)
+            await conn.execute(
+                "DELETE FROM clock_daily_totals WHERE guild_id = $1",
+                guild_id,
+            )
+            await conn.copy_records_to_table(
+                "clock_daily_totals",
+                columns=("guild_id", "user_id", "mask", "day", "total_seconds"),
+                records=(
+                    (guild_id, user_id, mask, day, total.total_seconds())
+                    for (day, user_id, mask), total in totals.items()
+                ),
+            )
+            written += len(totals)
+    return written
+
+
+def _get_index_names(plan: Any) -> set[str]:
+    """
+    Get every index name used within an EXPLAIN (FORMAT JSON) plan.
+    """
+
+    found = set()
+    if isinstance(plan, dict):
+        if "Index Name" in plan:
+            found.add(plan["Index Name"])
+        for value in plan.values():
+            found |= _get_index_names(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            found |= _get_index_names(value)
+    return found
+
+
+async def _get_parent_indexes(
+        conn: asyncpg.Connection,
+        names: set[str]) -> set[str]:
+    """
+    Get the partitioned indexes that the given partition indexes belong to.
+    """
+
+    rows = await conn.fetch(
+        """
+        SELECT
+            parent.relname
+        FROM
+            pg_inherits
+        JOIN
+            pg_class AS parent
+        ON
+            parent.oid = pg_inherits.inhparent
+        JOIN
+            pg_class AS child
+        ON
+            child.oid = pg_inherits.inhrelid
+        WHERE
+            child.relname = ANY($1::TEXT[])
+        """,
+        list(names),
+    )
+    return {row['relname'] for row in rows}
+
+
+async def check_query_plans(
+        conn: asyncpg.Connection) -> dict[str, tuple[bool, set[str]]]:
+    """
+    EXPLAIN each of the ClockIn queries and see whether they use their
+    intended index. Sequential scans are disabled for the check so that small
+    development databases give the same plans as large ones. Indexes on a
+    clock_ins partition count as the index on clock_ins that they belong to.
+
+    Returns a dict of check name -> (passed, indexes used).
+    """
+
+    results = {}
+    async with conn.transaction():
+        await conn.execute("SET LOCAL enable_seqscan = off")
+        for check in QUERY_PLAN_CHECKS:
+            plan = await conn.fetchval(
+                f"EXPLAIN (FORMAT JSON) {check.query}",
+                *check.args,
+            )
+            used = _get_index_names(json.loads(plan))
+            used |= await _get_parent_indexes(conn, used)
+            results[check.name] = (check.index in used, used)
+    return results
+
+
+async def main(
+        config_path: pathlib.Path,
+        check: bool,
+        reconcile: bool) -> int:
+    config = toml.load(config_path)["database"]
+    conn = await asyncpg.connect(
+        user=config["user"],
+        password=config["password"],
+        database=config["database"],
+        host=config["host"],
+        port=config["port"],
+    )
+    try:
+        for migration in await apply_schema(conn):
+            print(f"Applied migration {migration.version:04d}_{migration.name}")
+        if reconcile:
+            written = await reconcile_daily_totals(conn)
+            print(f"Rebuilt {written} daily total rows")
+        if not check:
+            return 0
+        failed = False
+        for name, (passed, used) in (await check_query_plans(conn)).items():
+            used_string = ", ".join(sorted(used)) or "no index"
+            print(f"{'PASS' if passed else 'FAIL'} {name} ({used_string})")
+            failed = failed or not passed
+        return 1 if failed else 0
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--config",
+        type=pathlib.Path,
+        default=CONFIG_DIRECTORY / "config.toml",
+    )
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--reconcile", action="store_true")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(main(args.config, args.check, args.reconcile)))
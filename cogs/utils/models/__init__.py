@@ -1 +1,5 @@
 from .clock_ins import *
+from .open_sessions import *
+from .clock_in_batch import *
+from .queries import *
+from .write_buffer import *
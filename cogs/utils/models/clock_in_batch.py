@@ -0,0 +1,384 @@
+from __future__ import annotations
+
+from array import array
+from datetime import datetime as dt, timedelta
+import collections
+import itertools
+from typing import TYPE_CHECKING, Iterable, Optional
+from typing_extensions import Self
+
+from ..metrics import Metrics
+from . import queries
+from .clock_ins import ClockIn
+
+if TYPE_CHECKING:
+    import asyncpg
+    from discord.ext import vbu
+
+
+__all__ = (
+    'ClockInBatch',
+)
+
+
+EPOCH = dt(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+MICROSECONDS_PER_DAY = 86_400 * 1_000_000
+
+
+def to_micros(value: dt) -> int:
+    """
+    Convert a naive UTC datetime into microseconds since the epoch.
+    """
+
+    return (value - EPOCH) // ONE_MICROSECOND
+
+
+def from_micros(value: int) -> dt:
+    """
+    Convert microseconds since the epoch into a naive UTC datetime.
+    """
+
+    return EPOCH + timedelta(microseconds=value)
+
+
+class ClockInBatch:
+    """
+    A column-oriented collection of clock ins, for working with large numbers
+    of them at once without building a :class:`ClockIn` per row.
+
+    Each column is stored as a contiguous array of 64-bit integers.
+    Timestamps are microseconds since the epoch, masks are stored as indexes
+    into :attr:`masks`, and open clock ins have a clock out of :attr:`OPEN`.
+    Durations for open clock ins are measured up until :attr:`now`, which is
+    taken once when the batch is created so that every row is measured
+    against the same point in time.
+
+    The operations are plain Python loops over the columns - the savings
+    come from not building objects or datetimes per row, and from the
+    arrays being far smaller than lists of them, not from the arrays
+    themselves.
+    """
+
+    OPEN = -1
+
+    __slots__ = (
+        'guild_ids',
+        'user_ids',
+        'mask_codes',
+        'masks',
+        'clock_ins',
+        'clock_outs',
+        'now',
+        '_mask_lookup',
+    )
+
+    def __init__(self, now: Optional[int] = None):
+        self.guild_ids: array[int] = array('q')
+        self.user_ids: array[int] = array('q')
+        self.mask_codes: array[int] = array('q')
+        self.masks: list[str] = []
+        self.clock_ins: array[int] = array('q')
+        self.clock_outs: array[int] = array('q')
+        self.now: int = to_micros(dt.utcnow()) if now is None else now
+        self._mask_lookup: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.clock_ins)
+
+    def get_mask_code(self, mask: str) -> int:
+        """
+        Get the code used for a mask within this batch, adding it if it
+        doesn't exist yet.
+        """
+
+        try:
+            return self._mask_lookup[mask]
+        except KeyError:
+            code = self._mask_lookup[mask] = len(self.masks)
+            self.masks.append(mask)
+            return code
+
+    def append(
+            self,
+            guild_id: int,
+            user_id: int,
+            mask: str,
+            clock_in: int,
+            clock_out: Optional[int]) -> None:
+        """
+        Add a single clock in to the batch, with timestamps given as
+        microseconds since the epoch.
+        """
+
+        self.guild_ids.append(guild_id)
+        self.user_ids.append(user_id)
+        self.mask_codes.append(self.get_mask_code(mask))
+        self.clock_ins.append(clock_in)
+        self.clock_outs.append(self.OPEN if clock_out is None else clock_out)
+
+    def extend_rows(self, rows: Iterable[dict]) -> None:
+        """
+        Add rows with ``guild_id``, ``user_id``, ``mask``, ``clock_in`` and
+        ``clock_out`` columns, where the timestamps are microseconds since
+        the epoch.
+        """
+
+        for row in rows:
+            self.append(
+                row['guild_id'],
+                row['user_id'],
+                row['mask'],
+                row['clock_in'],
+                row['clock_out'],
+            )
+
+    @classmethod
+    def from_clock_ins(
+            cls,
+            clock_ins: Iterable[ClockIn],
+            now: Optional[int] = None) -> Self:
+        """
+        Build a batch from existing clock in objects.
+        """
+
+        batch = cls(now)
+        for ci in clock_ins:
+            batch.append(
+                ci.guild_id,
+                ci.user_id,
+                ci.mask,
+                to_micros(ci.clocked_in_at),
+                None if ci.clocked_out_at is None else to_micros(ci.clocked_out_at),
+            )
+        return batch
+
+    @classmethod
+    @Metrics.timed("query")
+    async def fetch_for_guild(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            start: Optional[dt] = None,
+            end: Optional[dt] = None,
+            *,
+            closed: Optional[bool] = None,
+            now: Optional[dt] = None,
+            batch_size: int = 10_000) -> Self:
+        """
+        Get the clock ins for a guild, optionally only those that started
+        within a given range, and optionally only those that are closed
+        (``closed=True``) or open (``closed=False``). The timestamps are
+        converted to integers by the database, and rows are read through a
+        server-side cursor, so no per-row datetime objects are created. Open
+        clock ins are read from the open sessions table rather than from
+        every partition. Open clock ins are measured up until ``now``, if
+        it's given, rather than the time of the fetch.
+        """
+
+        return await cls.fetch_from_connection(
+            db.conn,
+            guild_id,
+            start,
+            end,
+            closed=closed,
+            now=now,
+            batch_size=batch_size,
+        )
+
+    @classmethod
+    async def fetch_from_connection(
+            cls,
+            conn: asyncpg.Connection,
+            guild_id: int,
+            start: Optional[dt] = None,
+            end: Optional[dt] = None,
+            *,
+            closed: Optional[bool] = None,
+            now: Optional[dt] = None,
+            batch_size: int = 10_000) -> Self:
+        """
+        The same as :meth:`fetch_for_guild`, but using an asyncpg connection
+        directly, for use outside of the bot.
+        """
+
+        batch = cls(None if now is None else to_micros(now))
+        async with conn.transaction():
+            if closed is False:
+                cursor = await queries.FETCH_OPEN_BATCH_FOR_GUILD.cursor(
+                    conn,
+                    guild_id,
+                    start,
+                    end,
+                )
+            else:
+                cursor = await queries.FETCH_BATCH_FOR_GUILD.cursor(
+                    conn,
+                    guild_id,
+                    start,
+                    end,
+                    closed,
+                )
+            while True:
+                rows = await cursor.fetch(batch_size)
+                if not rows:
+                    break
+                batch.extend_rows(rows)
+        return batch
+
+    def to_clock_ins(self) -> list[ClockIn]:
+        """
+        Convert the batch back into clock in objects. The objects have no
+        IDs, so they shouldn't be written back to the database.
+        """
+
+        return [
+            ClockIn(
+                None,
+                guild_id,
+                user_id,
+                self.masks[mask_code],
+                from_micros(clock_in),
+                None if clock_out == self.OPEN else from_micros(clock_out),
+            )
+            for guild_id, user_id, mask_code, clock_in, clock_out in zip(
+                self.guild_ids,
+                self.user_ids,
+                self.mask_codes,
+                self.clock_ins,
+                self.clock_outs,
+            )
+        ]
+
+    def clock_outs_or_now(self) -> array[int]:
+        """
+        Get the clock out column with open clock ins replaced by
+        :attr:`now`.
+        """
+
+        now, open_ = self.now, self.OPEN
+        return array('q', [
+            now if clock_out == open_ else clock_out
+            for clock_out in self.clock_outs
+        ])
+
+    def durations(self) -> array[int]:
+        """
+        Get the duration of every clock in, in microseconds. Admin-managed
+        durations can be negative.
+        """
+
+        return array('q', map(
+            int.__sub__,
+            self.clock_outs_or_now(),
+            self.clock_ins,
+        ))
+
+    def total(self) -> timedelta:
+        """
+        Get the total duration of every clock in in the batch.
+        """
+
+        return timedelta(microseconds=sum(self.durations()))
+
+    def select(self, selectors: Iterable[bool]) -> Self:
+        """
+        Get a new batch with only the rows where the selector is truthy.
+        The new batch shares this batch's masks and "now".
+        """
+
+        selectors = list(selectors)
+        batch = type(self)(self.now)
+        batch.masks = self.masks
+        batch._mask_lookup = self._mask_lookup
+        batch.guild_ids = array('q', itertools.compress(self.guild_ids, selectors))
+        batch.user_ids = array('q', itertools.compress(self.user_ids, selectors))
+        batch.mask_codes = array('q', itertools.compress(self.mask_codes, selectors))
+        batch.clock_ins = array('q', itertools.compress(self.clock_ins, selectors))
+        batch.clock_outs = array('q', itertools.compress(self.clock_outs, selectors))
+        return batch
+
+    def filter(
+            self,
+            *,
+            guild_id: Optional[int] = None,
+            user_id: Optional[int] = None,
+            mask: Optional[str] = None,
+            start: Optional[dt] = None,
+            end: Optional[dt] = None,
+            is_open: Optional[bool] = None) -> Self:
+        """
+        Get a new batch with only the rows matching all of the given values.
+        ``start`` and ``end`` filter on the clock in time.
+        """
+
+        selectors: list[bool] = [True] * len(self)
+        if guild_id is not None:
+            selectors = [s and i == guild_id for s, i in zip(selectors, self.guild_ids)]
+        if user_id is not None:
+            selectors = [s and i == user_id for s, i in zip(selectors, self.user_ids)]
+        if mask is not None:
+            code = self._mask_lookup.get(mask, -1)
+            selectors = [s and i == code for s, i in zip(selectors, self.mask_codes)]
+        if start is not None:
+            start_micros = to_micros(start)
+            selectors = [s and i >= start_micros for s, i in zip(selectors, self.clock_ins)]
+        if end is not None:
+            end_micros = to_micros(end)
+            selectors = [s and i < end_micros for s, i in zip(selectors, self.clock_ins)]
+        if is_open is not None:
+            selectors = [
+                s and (i == self.OPEN) == is_open
+                for s, i in zip(selectors, self.clock_outs)
+            ]
+        return self.select(selectors)
+
+    @staticmethod
+    def _sum_by(keys: Iterable, values: Iterable[int]) -> dict:
+        totals: dict = collections.defaultdict(int)
+        for key, value in zip(keys, values):
+            totals[key] += value
+        return dict(totals)
+
+    def total_by_user(self) -> dict[int, timedelta]:
+        """
+        Get the total duration per user ID.
+        """
+
+        return {
+            user_id: timedelta(microseconds=total)
+            for user_id, total in self._sum_by(self.user_ids, self.durations()).items()
+        }
+
+    def total_by_mask(self) -> dict[str, timedelta]:
+        """
+        Get the total duration per mask.
+        """
+
+        return {
+            self.masks[code]: timedelta(microseconds=total)
+            for code, total in self._sum_by(self.mask_codes, self.durations()).items()
+        }
+
+    def total_by_user_and_mask(self) -> dict[tuple[int, str], timedelta]:
+        """
+        Get the total duration per (user ID, mask) pair.
+        """
+
+        totals = self._sum_by(zip(self.user_ids, self.mask_codes), self.durations())
+        return {
+            (user_id, self.masks[code]): timedelta(microseconds=total)
+            for (user_id, code), total in totals.items()
+        }
+
+    def total_by_day(self) -> dict[int, timedelta]:
+        """
+        Get the total duration per day that the clock ins started on, with
+        days given as the number of days since the epoch.
+        """
+
+        days = [i // MICROSECONDS_PER_DAY for i in self.clock_ins]
+        return {
+            day: timedelta(microseconds=total)
+            for day, total in self._sum_by(days, self.durations()).items()
+        }
@@ -1,23 +1,42 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Optional
+from typing import TYPE_CHECKING, AsyncIterator, Callable, ClassVar, NamedTuple, Optional
 from typing_extensions import Self
 from datetime import datetime as dt, timedelta, date
+import asyncio
+import copy
 import uuid
 
 import discord
 
+from ..metrics import Metrics
+from ..shared_cache import SharedCache
+from . import queries
+from .open_sessions import OpenSessionIndex
+from .write_buffer import ClockInWriteBuffer
+
 if TYPE_CHECKING:
     from discord.ext import vbu
 
 
 __all__ = (
     'ClockIn',
+    'DailyTotal',
 )
 
 
+class DailyTotal(NamedTuple):
+    day: date
+    user_id: int
+    mask: str
+    total_seconds: float
+
+
 class ClockIn:
 
+    _hydrate_lock = asyncio.Lock()
+    _write_listeners: ClassVar[list[Callable[[ClockIn], None]]] = []
+
     __slots__ = (
         '_id',
         'guild_id',
@@ -92,154 +111,467 @@ class ClockIn:
         )
 
     @classmethod
+    def add_write_listener(cls, listener: Callable[[ClockIn], None]) -> None:
+        """
+        Add a function to be called with every clock in that's written to
+        the database. Listeners are given a copy, and must not block.
+        """
+
+        if listener not in cls._write_listeners:
+            cls._write_listeners.append(listener)
+
+    @classmethod
+    def remove_write_listener(cls, listener: Callable[[ClockIn], None]) -> None:
+        """
+        Remove a listener added with :meth:`add_write_listener`.
+        """
+
+        if listener in cls._write_listeners:
+            cls._write_listeners.remove(listener)
+
+    @classmethod
+    def written(cls, clock_in: ClockIn) -> None:
+        """
+        Mark a clock in as having just been written to the database, updating
+        the open session index and telling every write listener.
+        """
+
+        OpenSessionIndex.apply(clock_in)
+        cls.notify_write_listeners(clock_in)
+
+    @classmethod
+    def notify_write_listeners(cls, clock_in: ClockIn) -> None:
+        """
+        Tell every write listener about a clock in that's been committed to
+        the database.
+        """
+
+        for listener in cls._write_listeners:
+            listener(copy.copy(clock_in))
+
+    @classmethod
+    @Metrics.timed("query")
+    async def hydrate_open_sessions(
+            cls,
+            db: Optional[vbu.Database] = None,
+            *,
+            force: bool = False) -> None:
+        """
+        Load every clock in that hasn't been clocked out into the open
+        session index. This only queries the database the first time it's
+        called, unless forced. If no database connection is given and one is
+        needed, one will be opened.
+        """
+
+        if OpenSessionIndex.hydrated and not force:
+            return
+        async with cls._hydrate_lock:
+            if OpenSessionIndex.hydrated and not force:
+                return
+            async with queries.acquire(db) as db:
+                rows = await queries.HYDRATE_OPEN_SESSIONS.fetch(db)
+            OpenSessionIndex.load(cls.from_row(row) for row in rows)
+
+    @classmethod
+    @Metrics.timed("query")
     async def get_latest(
             cls,
-            db: vbu.Database,
+            db: Optional[vbu.Database],
             guild_id: int,
             user_id: int,
             mask: str | None) -> Optional[Self]:
         """
         Get the latest clock in (that has not been clocked out) for a user with
-        a given mask.
-        """
-
-        query = """
-            SELECT
-                *
-            FROM
-                clock_ins
-            WHERE
-                guild_id = $1
-            AND
-                user_id = $2
-            AND
-                mask = $3
-            AND
-                clock_out IS NULL
-            ORDER BY
-                clock_in DESC
-            LIMIT 1
-        """
-        rows = await db.call(query, guild_id, user_id, mask)
-        if not rows:
+        a given mask. This is read from the open session index, or from the
+        database while the shared cache is degraded.
+        """
+
+        if mask is None:
+            return None
+        if SharedCache.degraded():
+            for clock_in in await cls._get_current_from_database(db, guild_id, user_id):
+                if clock_in.mask == mask:
+                    return clock_in
             return None
-        return cls.from_row(rows[0])
+        await cls.hydrate_open_sessions(db)
+        return OpenSessionIndex.get_latest(guild_id, user_id, mask)  # pyright: ignore
 
     @classmethod
+    @Metrics.timed("query")
     async def get_current(
             cls,
-            db: vbu.Database,
+            db: Optional[vbu.Database],
             guild_id: int,
             user_id: int) -> list[Self]:
         """
-        Get the current clock ins for a user.
+        Get the current clock ins for a user. This is read from the open
+        session index, or from the database while the shared cache is
+        degraded.
         """
 
-        query = """
-            SELECT
-                *
-            FROM
-                clock_ins
-            WHERE
-                guild_id = $1
-            AND
-                user_id = $2
-            AND
-                clock_out IS NULL
-            ORDER BY
-                clock_in DESC
+        if SharedCache.degraded():
+            return await cls._get_current_from_database(db, guild_id, user_id)
+        await cls.hydrate_open_sessions(db)
+        return OpenSessionIndex.get_current(guild_id, user_id)  # pyright: ignore
+
+    @classmethod
+    async def _get_current_from_database(
+            cls,
+            db: Optional[vbu.Database],
+            guild_id: int,
+            user_id: int) -> list[Self]:
+        """
+        Get the current clock ins for a user from the database, most recent
+        first, for when the open session index might be missing writes made
+        by other processes.
         """
-        rows = await db.call(query, guild_id, user_id)
+
+        async with queries.acquire(db) as db:
+            rows = await queries.GET_OPEN_SESSIONS_FOR_USER.fetch(db, guild_id, user_id)
         return [cls.from_row(row) for row in rows]
 
     @classmethod
-    async def get_all(
+    @Metrics.timed("query")
+    async def get_page(
             cls,
             db: vbu.Database,
             guild_id: int,
-            user_id: int) -> list[Self]:
+            user_id: int,
+            *,
+            before: Optional[tuple[dt, uuid.UUID]] = None,
+            after: Optional[tuple[dt, uuid.UUID]] = None,
+            limit: int = 10) -> list[Self]:
         """
-        Get all of the clock ins for a user.
+        Get a page of a user's clock ins, newest first, using keyset
+        pagination on (clock in time, ID). Give ``before`` to get the page of
+        clock ins older than the given key, or ``after`` to get the page of
+        clock ins newer than it. With neither, the newest page is returned.
         """
 
-        query = """
-            SELECT
-                *
-            FROM
-                clock_ins
-            WHERE
-                guild_id = $1
-            AND
-                user_id = $2
-            ORDER BY
-                clock_in DESC
-        """
-        rows = await db.call(query, guild_id, user_id)
+        if after is not None:
+            rows = await queries.GET_PAGE_AFTER.fetch(db, guild_id, user_id, *after, limit)
+            return [cls.from_row(row) for row in reversed(rows)]
+
+        if before is not None:
+            rows = await queries.GET_PAGE_BEFORE.fetch(db, guild_id, user_id, *before, limit)
+        else:
+            rows = await queries.GET_NEWEST_PAGE.fetch(db, guild_id, user_id, limit)
         return [cls.from_row(row) for row in rows]
 
     @classmethod
-    async def get_all_for_guild(
+    @Metrics.timed_iterator("query")
+    async def iter_daily_totals(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            start: dt,
+            end: dt,
+            *,
+            extra: Optional[dict[tuple[date, int, str], timedelta]] = None,
+            batch_size: int = 1_000) -> AsyncIterator[list[DailyTotal]]:
+        """
+        Stream the total clocked in time per day, per user, per mask for a
+        guild, for days within the given range (along with any admin-managed
+        durations), ordered by day, user, and mask.
+
+        Only closed clock ins are included, and they're read from the daily
+        totals rollup. Any ``extra`` totals, keyed by (day, user ID, mask)
+        - such as the time from open clock ins - are merged in.
+        """
+
+        # The extra totals are merged in as we go, so they need to be in the
+        # same order as the rows
+        pending = sorted(
+            DailyTotal(day, user_id, mask, total.total_seconds())
+            for (day, user_id, mask), total in (extra or {}).items()
+        )
+        pending.reverse()
+
+        async with db.conn.transaction():
+            cursor = await queries.ITER_DAILY_TOTALS.cursor(
+                db,
+                guild_id,
+                start,
+                end,
+                dt(2000, 1, 1),
+            )
+            while True:
+                rows = await cursor.fetch(batch_size)
+                if not rows:
+                    break
+                totals = []
+                for row in rows:
+                    total = DailyTotal(
+                        row['day'],
+                        row['user_id'],
+                        row['mask'],
+                        row['total_seconds'],
+                    )
+                    while pending and pending[-1][:3] < total[:3]:
+                        totals.append(pending.pop())
+                    if pending and pending[-1][:3] == total[:3]:
+                        total = total._replace(
+                            total_seconds=total.total_seconds + pending.pop().total_seconds,
+                        )
+                    totals.append(total)
+                yield totals
+        if pending:
+            yield pending[::-1]
+
+    @classmethod
+    @Metrics.timed("query")
+    async def get_daily_totals(
             cls,
             db: vbu.Database,
-            guild_id: int) -> list[Self]:
+            guild_id: int,
+            start: dt,
+            end: dt,
+            *,
+            extra: Optional[dict[tuple[date, int, str], timedelta]] = None) -> list[DailyTotal]:
         """
-        Get all of the clock ins for a guild.
+        Get the total clocked in time per day, per user, per mask for a
+        guild. See :meth:`iter_daily_totals`.
         """
 
-        query = """
-            SELECT
-                *
-            FROM
-                clock_ins
-            WHERE
-                guild_id = $1
-            ORDER BY
-                clock_in DESC
+        totals = []
+        async for batch in cls.iter_daily_totals(db, guild_id, start, end, extra=extra):
+            totals.extend(batch)
+        return totals
+
+    @classmethod
+    @Metrics.timed("query")
+    async def get_mask_totals(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            user_id: int,
+            *,
+            include_open: bool = True) -> dict[str, timedelta]:
         """
-        rows = await db.call(query, guild_id)
-        return [cls.from_row(row) for row in rows]
+        Get a user's total clocked in time per mask, including any time from
+        clock ins that are still open unless ``include_open`` is false.
+        Closed time is read from the daily totals rollup rather than from the
+        raw clock ins.
+        """
+
+        rows = await queries.GET_MASK_TOTALS.fetch(db, guild_id, user_id)
+        totals = {
+            row['mask']: timedelta(seconds=row['total_seconds'])
+            for row in rows
+        }
+        await cls.hydrate_open_sessions(db)
+        if not include_open:
+            return totals
+        for clock_in in await cls.get_current(db, guild_id, user_id):
+            totals[clock_in.mask] = (
+                totals.get(clock_in.mask, timedelta(0))
+                + clock_in.duration_with_negative
+            )
+        return totals
+
+    @classmethod
+    @Metrics.timed("query")
+    async def get_leaderboard(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            mask: str,
+            period: str,
+            limit: int,
+            now: Optional[dt] = None) -> list[tuple[int, timedelta]]:
+        """
+        Get the users with the most closed time with a mask this week, this
+        month, or of all time (``period`` being "week", "month", or "all"),
+        most first. The totals are kept up to date in the database, so this
+        reads ``limit`` rows from an index rather than summing clock ins.
+        """
+
+        today = (now or dt.utcnow()).date()
+        if period == "week":
+            period_start = today - timedelta(days=today.weekday())
+        else:
+            period_start = today.replace(day=1)
+        rows = await queries.GET_LEADERBOARD.fetch(
+            db,
+            guild_id,
+            mask,
+            period,
+            period_start,
+            limit,
+        )
+        return [
+            (row['user_id'], timedelta(seconds=row['total_seconds']))
+            for row in rows
+        ]
 
+    @classmethod
+    @Metrics.timed("query")
+    async def open_session(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            user_id: int,
+            role_ids: list[int],
+            mask: str,
+            clocked_in_at: Optional[dt] = None) -> tuple[bool, Optional[Self]]:
+        """
+        Clock a user in with a mask in a single statement, checking that one
+        of their roles has the mask and that they aren't already clocked in
+        with it. The clock in is first claimed in the open sessions table,
+        whose primary key is (guild ID, user ID, mask), so concurrent clock
+        ins can't both succeed.
+
+        Returns whether the user is allowed to use the mask, and the newly
+        created clock in (or ``None`` if they were already clocked in or
+        didn't have permission).
+
+        If the write buffer is on, clock ins arriving together are made
+        together, after any clock outs that are waiting to be written.
+        """
+
+        if ClockInWriteBuffer.enabled:
+            return await ClockInWriteBuffer.open_session(
+                guild_id,
+                user_id,
+                role_ids,
+                mask,
+                clocked_in_at or dt.utcnow(),
+            )
+        rows = await queries.OPEN_SESSION.fetch(
+            db,
+            guild_id,
+            user_id,
+            role_ids,
+            mask,
+            clocked_in_at or dt.utcnow(),
+        )
+        row = rows[0]
+        if row['id'] is None:
+            return row['allowed'], None
+        clock_in = cls.from_row(row)
+        cls.written(clock_in)
+        return True, clock_in
+
+    @classmethod
+    @Metrics.timed("query")
+    async def close_session(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            user_id: int,
+            mask: str,
+            clocked_out_at: Optional[dt] = None) -> Optional[Self]:
+        """
+        Clock a user out of a mask in a single statement, returning the
+        closed clock in (or ``None`` if they weren't clocked in with it).
+
+        If the write buffer is on, the clock in is found in the open session
+        index and closed through :meth:`update` instead, so that clock outs
+        arriving together are written together.
+        """
+
+        if ClockInWriteBuffer.enabled:
+            clock_in = await cls.get_latest(db, guild_id, user_id, mask)
+            if clock_in is None:
+                return None
+            await clock_in.update(
+                db,
+                clocked_out_at=clocked_out_at or dt.utcnow(),
+            )
+            return clock_in
+
+        rows = await queries.CLOSE_SESSION.fetch(
+            db,
+            guild_id,
+            user_id,
+            mask,
+            clocked_out_at or dt.utcnow(),
+        )
+        if not rows:
+            return None
+        clock_in = cls.from_row(rows[0])
+        cls.written(clock_in)
+        return clock_in
+
+    @classmethod
+    @Metrics.timed("query")
+    async def open_sessions_for_users(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            user_ids: list[int],
+            mask: str,
+            clocked_in_at: Optional[dt] = None) -> list[Self]:
+        """
+        Clock a group of users in with a mask in a single multi-row insert.
+        Users who are already clocked in with the mask are skipped, as is
+        everyone if the mask doesn't exist in the guild. Permission to use
+        the mask should be checked before calling this. Anything waiting in
+        the write buffer is written first.
+
+        Returns the newly created clock ins.
+        """
+
+        if ClockInWriteBuffer.enabled:
+            await ClockInWriteBuffer.flush()
+        rows = await queries.OPEN_SESSIONS_FOR_USERS.fetch(
+            db,
+            guild_id,
+            list(dict.fromkeys(user_ids)),
+            mask,
+            clocked_in_at or dt.utcnow(),
+        )
+        clock_ins = [cls.from_row(row) for row in rows]
+        for clock_in in clock_ins:
+            cls.written(clock_in)
+        return clock_ins
+
+    @classmethod
+    @Metrics.timed("query")
+    async def close_sessions_for_users(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            user_ids: list[int],
+            mask: str,
+            clocked_out_at: Optional[dt] = None) -> list[Self]:
+        """
+        Clock a group of users out of a mask in a single statement, returning
+        the clock ins that were closed. Anything waiting in the write buffer
+        is written first.
+        """
+
+        if ClockInWriteBuffer.enabled:
+            await ClockInWriteBuffer.flush()
+        rows = await queries.CLOSE_SESSIONS_FOR_USERS.fetch(
+            db,
+            guild_id,
+            list(dict.fromkeys(user_ids)),
+            mask,
+            clocked_out_at or dt.utcnow(),
+        )
+        clock_ins = [cls.from_row(row) for row in rows]
+        for clock_in in clock_ins:
+            cls.written(clock_in)
+        return clock_ins
+
+    @Metrics.timed("query")
     async def update(
             self,
             db: vbu.Database,
             **kwargs):
         """
-        Update the clock in with the current values.
+        Update the clock in with the current values. If the write buffer is
+        on, the write is batched with any others that arrive at the same
+        time, and this returns once the batch has been committed.
         """
 
         for i, o in kwargs.items():
             setattr(self, i, o)
-        query = """
-            INSERT INTO
-                clock_ins
-                (
-                    id,
-                    guild_id,
-                    user_id,
-                    mask,
-                    clock_in,
-                    clock_out
-                )
-            VALUES
-                (
-                    $1,
-                    $2,
-                    $3,
-                    $4,
-                    $5,
-                    $6
-                )
-            ON CONFLICT
-                (id)
-            DO UPDATE SET
-                guild_id = excluded.guild_id,
-                user_id = excluded.user_id,
-                mask = excluded.mask,
-                clock_in = excluded.clock_in,
-                clock_out = excluded.clock_out
-        """
-        await db.call(
-            query,
+        if ClockInWriteBuffer.enabled:
+            return await ClockInWriteBuffer.write(copy.copy(self))
+        await queries.UPSERT_CLOCK_IN.fetch(
+            db,
             self.id,
             self.guild_id,
             self.user_id,
@@ -247,3 +579,64 @@ class ClockIn:
             self.clocked_in_at,
             self.clocked_out_at,
         )
+        self.written(self)
+
+    @classmethod
+    @Metrics.timed("query")
+    async def roll_over_open_sessions(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            at: Optional[dt] = None) -> list[Self]:
+        """
+        Clock out every open clock in for a guild and clock each user in
+        again with the same mask, all at the same time and in one
+        transaction, so that the closed part can be cleared without losing
+        any time.
+
+        Returns the clock ins that were opened.
+        """
+
+        at = at or dt.utcnow()
+        async with db.conn.transaction():
+            closed_rows = await queries.CLOSE_SESSIONS_FOR_GUILD.fetch(
+                db,
+                guild_id,
+                at,
+            )
+            opened_rows = await queries.REOPEN_SESSIONS.fetch(
+                db,
+                guild_id,
+                [row['user_id'] for row in closed_rows],
+                [row['mask'] for row in closed_rows],
+                at,
+            )
+        opened = [cls.from_row(row) for row in opened_rows]
+        for clock_in in [cls.from_row(row) for row in closed_rows] + opened:
+            cls.written(clock_in)
+        return opened
+
+    @classmethod
+    @Metrics.timed("query")
+    async def archive_closed_batch(
+            cls,
+            db: vbu.Database,
+            guild_id: int,
+            before: dt,
+            limit: int) -> int:
+        """
+        Move up to ``limit`` of a guild's closed clock ins that started
+        before the given time into the archive table, in a single statement.
+        Rows locked by other writers are skipped rather than waited on.
+
+        Returns how many clock ins were moved.
+        """
+
+        row = await queries.ARCHIVE_CLOSED_BATCH.fetchrow(
+            db,
+            guild_id,
+            before,
+            limit,
+        )
+        assert row
+        return row['moved']
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import copy
+from typing import TYPE_CHECKING, ClassVar, Iterable, Optional
+
+if TYPE_CHECKING:
+    from .clock_ins import ClockIn
+
+
+__all__ = (
+    'OpenSessionIndex',
+)
+
+
+_Key = tuple[int, int, str]
+
+
+class OpenSessionIndex:
+    """
+    An in-process index of every clock in that hasn't been clocked out yet,
+    keyed by (guild ID, user ID, mask). Masks are compared case-insensitively,
+    the same as the database does. This is loaded once from the database and
+    then kept up to date by :meth:`ClockIn.update`.
+
+    Objects are copied on the way in and on the way out so that callers
+    modifying a clock in don't change what the index holds.
+    """
+
+    hydrated: ClassVar[bool] = False
+    _sessions: ClassVar[dict[_Key, dict[str, ClockIn]]] = {}
+    _by_user: ClassVar[dict[tuple[int, int], set[str]]] = {}
+    _keys: ClassVar[dict[str, _Key]] = {}
+
+    @staticmethod
+    def _key(guild_id: int, user_id: int, mask: str) -> _Key:
+        return (guild_id, user_id, mask.casefold())
+
+    @classmethod
+    def load(cls, clock_ins: Iterable[ClockIn]) -> None:
+        """
+        Replace the contents of the index with the given open clock ins.
+        """
+
+        cls._sessions = {}
+        cls._by_user = {}
+        cls._keys = {}
+        for clock_in in clock_ins:
+            cls.apply(clock_in)
+        cls.hydrated = True
+
+    @classmethod
+    def apply(cls, clock_in: ClockIn) -> None:
+        """
+        Update the index with a clock in that has just been written to the
+        database - open clock ins are added, closed ones are removed. A clock
+        in that's moved to a different user or mask is taken out from under
+        its old key.
+        """
+
+        key = cls._key(clock_in.guild_id, clock_in.user_id, clock_in.mask)
+        old_key = cls._keys.pop(clock_in.id, None)
+        if old_key is not None:
+            cls._remove(old_key, clock_in.id)
+        if clock_in.clocked_out_at is None:
+            cls._sessions.setdefault(key, {})[clock_in.id] = copy.copy(clock_in)
+            cls._by_user.setdefault(key[:2], set()).add(key[2])
+            cls._keys[clock_in.id] = key
+
+    @classmethod
+    def _remove(cls, key: _Key, clock_in_id: str) -> None:
+        sessions = cls._sessions.get(key)
+        if sessions is None:
+            return
+        sessions.pop(clock_in_id, None)
+        if not sessions:
+            del cls._sessions[key]
+            masks = cls._by_user.get(key[:2])
+            if masks is not None:
+                masks.discard(key[2])
+                if not masks:
+                    del cls._by_user[key[:2]]
+
+    @classmethod
+    def get_latest(
+            cls,
+            guild_id: int,
+            user_id: int,
+            mask: str) -> Optional[ClockIn]:
+        """
+        Get the most recent open clock in for a user with a given mask.
+        """
+
+        sessions = cls._sessions.get(cls._key(guild_id, user_id, mask))
+        if not sessions:
+            return None
+        latest = max(sessions.values(), key=lambda i: i.clocked_in_at)
+        return copy.copy(latest)
+
+    @classmethod
+    def get_current(cls, guild_id: int, user_id: int) -> list[ClockIn]:
+        """
+        Get the open clock ins for a user, most recent first.
+        """
+
+        found = [
+            session
+            for mask in cls._by_user.get((guild_id, user_id), ())
+            for session in cls._sessions[(guild_id, user_id, mask)].values()
+        ]
+        found.sort(key=lambda i: i.clocked_in_at, reverse=True)
+        return [copy.copy(i) for i in found]
+
+    @classmethod
+    def get_for_guild(cls, guild_id: int) -> list[ClockIn]:
+        """
+        Get every open clock in for a guild.
+        """
+
+        return [
+            copy.copy(session)
+            for key, sessions in cls._sessions.items()
+            if key[0] == guild_id
+            for session in sessions.values()
+        ]
@@ -0,0 +1,1199 @@
+from __future__ import annotations
+
+import contextlib
+from typing import TYPE_CHECKING, Any, AsyncIterator, ClassVar, Optional, Union
+import weakref
+
+import asyncpg
+
+if TYPE_CHECKING:
+    from asyncpg.cursor import Cursor
+    from asyncpg.prepared_stmt import PreparedStatement
+    from discord.ext import vbu
+
+
+__all__ = (
+    'Query',
+)
+
+
+Connectable = Union["vbu.Database", asyncpg.Connection]
+
+
+def _get_connection(db: Connectable) -> asyncpg.Connection:
+    """
+    Get the asyncpg connection that a database wrapper is using. Pooled
+    connections are handed out behind a new proxy on each acquire, so the
+    proxy is unwrapped to get the connection that's actually reused.
+    """
+
+    conn = getattr(db, "conn", db)
+    return getattr(conn, "_con", None) or conn
+
+
+@contextlib.asynccontextmanager
+async def acquire(db: Optional[vbu.Database] = None) -> AsyncIterator[vbu.Database]:
+    """
+    Use the given database connection, or acquire one from the pool if none
+    was given. This lets helpers that can be called on their own share the
+    connection of a handler that's running several statements.
+    """
+
+    if db is not None:
+        yield db
+        return
+    from discord.ext import vbu
+    async with vbu.Database() as db:
+        yield db
+
+
+class Query:
+    """
+    A named SQL statement that's prepared once per database connection and
+    then reused, so that Postgres doesn't parse and plan it again on every
+    call. Every query has a unique name, and can be looked up by it from
+    :attr:`registry`.
+    """
+
+    registry: ClassVar[dict[str, Query]] = {}
+    _prepared: ClassVar[weakref.WeakKeyDictionary[
+        asyncpg.Connection,
+        dict[str, PreparedStatement],
+    ]] = weakref.WeakKeyDictionary()
+
+    __slots__ = (
+        'name',
+        'sql',
+    )
+
+    def __init__(self, name: str, sql: str):
+        if name in self.registry:
+            raise ValueError(f"A query named {name!r} already exists")
+        self.name: str = name
+        self.sql: str = sql
+        self.registry[name] = self
+
+    def __repr__(self) -> str:
+        return f"<Query {self.name}>"
+
+    async def prepare(self, db: Connectable) -> PreparedStatement:
+        """
+        Get the prepared statement for this query on the given connection,
+        preparing it if it hasn't been yet.
+        """
+
+        conn = _get_connection(db)
+        statements = self._prepared.setdefault(conn, {})
+        try:
+            return statements[self.name]
+        except KeyError:
+            pass
+        statement = statements[self.name] = await conn.prepare(self.sql)
+        return statement
+
+    def forget(self, db: Connectable) -> None:
+        """
+        Drop this query's prepared statement for a connection so that it's
+        prepared again on its next use.
+        """
+
+        self._prepared.get(_get_connection(db), {}).pop(self.name, None)
+
+    async def _run(self, db: Connectable, method: str, *args: Any) -> Any:
+        statement = await self.prepare(db)
+        try:
+            return await getattr(statement, method)(*args)
+        except (
+                asyncpg.exceptions.InvalidCachedStatementError,
+                asyncpg.exceptions.OutdatedSchemaCacheError):
+            # The schema has changed underneath the statement. It can only be
+            # retried if we're not in a transaction that's now aborted.
+            self.forget(db)
+            if _get_connection(db).is_in_transaction():
+                raise
+            statement = await self.prepare(db)
+            return await getattr(statement, method)(*args)
+
+    async def fetch(self, db: Connectable, *args: Any) -> list[asyncpg.Record]:
+        """
+        Run the query and get every row.
+        """
+
+        return await self._run(db, "fetch", *args)
+
+    async def fetchrow(self, db: Connectable, *args: Any) -> Optional[asyncpg.Record]:
+        """
+        Run the query and get its first row.
+        """
+
+        return await self._run(db, "fetchrow", *args)
+
+    async def cursor(self, db: Connectable, *args: Any) -> Cursor:
+        """
+        Open a server-side cursor over the query. This needs to be called
+        from within a transaction.
+        """
+
+        statement = await self.prepare(db)
+        return await statement.cursor(*args)
+
+
+# Open sessions
+
+HYDRATE_OPEN_SESSIONS = Query(
+    "clock_ins.hydrate_open_sessions",
+    """
+    SELECT
+        id,
+        guild_id,
+        user_id,
+        mask,
+        clock_in,
+        NULL::TIMESTAMP AS clock_out
+    FROM
+        clock_ins_open_sessions
+    """,
+)
+
+GET_OPEN_SESSIONS_FOR_USER = Query(
+    "clock_ins.get_open_sessions_for_user",
+    """
+    SELECT
+        id,
+        guild_id,
+        user_id,
+        mask,
+        clock_in,
+        NULL::TIMESTAMP AS clock_out
+    FROM
+        clock_ins_open_sessions
+    WHERE
+        guild_id = $1
+    AND
+        user_id = $2
+    ORDER BY
+        clock_in DESC
+    """,
+)
+
+OPEN_SESSION = Query(
+    "clock_ins.open_session",
+    """
+    WITH allowed AS (
+        SELECT
+            mask::TEXT AS mask
+        FROM
+            clock_masks
+        WHERE
+            guild_id = $1
+        AND
+            role_id = ANY($3::BIGINT[])
+        AND
+            mask = $4::CITEXT
+        LIMIT 1
+    ),
+    claimed AS (
+        INSERT INTO
+            clock_ins_open_sessions
+            (
+                guild_id,
+                user_id,
+                mask,
+                id,
+                clock_in
+            )
+        SELECT
+            $1,
+            $2,
+            allowed.mask,
+            uuid_generate_v4(),
+            $5
+        FROM
+            allowed
+        ON CONFLICT
+            (guild_id, user_id, mask)
+        DO NOTHING
+        RETURNING
+            *
+    ),
+    inserted AS (
+        INSERT INTO
+            clock_ins
+            (
+                id,
+                guild_id,
+                user_id,
+                mask,
+                clock_in
+            )
+        SELECT
+            id,
+            guild_id,
+            user_id,
+            mask,
+            clock_in
+        FROM
+            claimed
+        RETURNING
+            *
+    )
+    SELECT
+        EXISTS (SELECT 1 FROM allowed) AS allowed,
+        inserted.*
+    FROM
+        (SELECT 1) AS _
+    LEFT JOIN
+        inserted
+    ON
+        TRUE
+    """,
+)
+
+CLOSE_SESSION = Query(
+    "clock_ins.close_session",
+    """
+    UPDATE
+        clock_ins
+    SET
+        clock_out = $4
+    FROM
+        clock_ins_open_sessions AS open_sessions
+    WHERE
+        open_sessions.guild_id = $1
+    AND
+        open_sessions.user_id = $2
+    AND
+        open_sessions.mask = $3
+    AND
+        clock_ins.id = open_sessions.id
+    AND
+        clock_ins.clock_in = open_sessions.clock_in
+    RETURNING
+        clock_ins.*
+    """,
+)
+
+EXPIRE_SESSION = Query(
+    "clock_ins.expire_session",
+    """
+    UPDATE
+        clock_ins
+    SET
+        clock_out = $6
+    FROM
+        clock_ins_open_sessions AS open_sessions
+    WHERE
+        open_sessions.guild_id = $1
+    AND
+        open_sessions.user_id = $2
+    AND
+        open_sessions.mask = $3
+    AND
+        open_sessions.id = $4
+    AND
+        open_sessions.clock_in = $5
+    AND
+        clock_ins.id = open_sessions.id
+    AND
+        clock_ins.clock_in = open_sessions.clock_in
+    AND
+        clock_ins.clock_out IS NULL
+    RETURNING
+        clock_ins.*
+    """,
+)
+
+OPEN_SESSIONS_BATCH = Query(
+    "clock_ins.open_sessions_batch",
+    """
+    WITH requests AS (
+        SELECT
+            *
+        FROM
+            UNNEST(
+                $1::INTEGER[],
+                $2::BIGINT[],
+                $3::BIGINT[],
+                $4::TEXT[],
+                $5::TIMESTAMP[]
+            ) AS requests(request, guild_id, user_id, mask, clock_in)
+    ),
+    allowed AS (
+        SELECT DISTINCT ON (requests.request)
+            requests.request,
+            requests.guild_id,
+            requests.user_id,
+            clock_masks.mask::TEXT AS mask,
+            requests.clock_in
+        FROM
+            requests
+        JOIN
+            UNNEST(
+                $6::INTEGER[],
+                $7::BIGINT[]
+            ) AS roles(request, role_id)
+        ON
+            roles.request = requests.request
+        JOIN
+            clock_masks
+        ON
+            clock_masks.guild_id = requests.guild_id
+        AND
+            clock_masks.role_id = roles.role_id
+        AND
+            clock_masks.mask = requests.mask::CITEXT
+        ORDER BY
+            requests.request
+    ),
+    claimed AS (
+        INSERT INTO
+            clock_ins_open_sessions
+            (
+                guild_id,
+                user_id,
+                mask,
+                id,
+                clock_in
+            )
+        SELECT
+            guild_id,
+            user_id,
+            mask,
+            uuid_generate_v4(),
+            clock_in
+        FROM
+            allowed
+        ORDER BY
+            request
+        ON CONFLICT
+            (guild_id, user_id, mask)
+        DO NOTHING
+        RETURNING
+            *
+    ),
+    inserted AS (
+        INSERT INTO
+            clock_ins
+            (
+                id,
+                guild_id,
+                user_id,
+                mask,
+                clock_in
+            )
+        SELECT
+            id,
+            guild_id,
+            user_id,
+            mask,
+            clock_in
+        FROM
+            claimed
+        RETURNING
+            *
+    )
+    SELECT
+        requests.request,
+        allowed.request IS NOT NULL AS allowed,
+        inserted.*
+    FROM
+        requests
+    LEFT JOIN
+        allowed
+    ON
+        allowed.request = requests.request
+    LEFT JOIN
+        inserted
+    ON
+        inserted.guild_id = allowed.guild_id
+    AND
+        inserted.user_id = allowed.user_id
+    AND
+        inserted.mask = allowed.mask
+    ORDER BY
+        requests.request
+    """,
+)
+
+OPEN_SESSIONS_FOR_USERS = Query(
+    "clock_ins.open_sessions_for_users",
+    """
+    WITH existing AS (
+        SELECT
+            mask::TEXT AS mask
+        FROM
+            clock_masks
+        WHERE
+            guild_id = $1
+        AND
+            mask = $3::CITEXT
+        LIMIT 1
+    ),
+    claimed AS (
+        INSERT INTO
+            clock_ins_open_sessions
+            (
+                guild_id,
+                user_id,
+                mask,
+                id,
+                clock_in
+            )
+        SELECT
+            $1,
+            members.user_id,
+            existing.mask,
+            uuid_generate_v4(),
+            $4
+        FROM
+            UNNEST($2::BIGINT[]) AS members (user_id),
+            existing
+        ON CONFLICT
+            (guild_id, user_id, mask)
+        DO NOTHING
+        RETURNING
+            *
+    )
+    INSERT INTO
+        clock_ins
+        (
+            id,
+            guild_id,
+            user_id,
+            mask,
+            clock_in
+        )
+    SELECT
+        id,
+        guild_id,
+        user_id,
+        mask,
+        clock_in
+    FROM
+        claimed
+    RETURNING
+        *
+    """,
+)
+
+CLOSE_SESSIONS_FOR_USERS = Query(
+    "clock_ins.close_sessions_for_users",
+    """
+    UPDATE
+        clock_ins
+    SET
+        clock_out = $4
+    FROM
+        clock_ins_open_sessions AS open_sessions
+    WHERE
+        open_sessions.guild_id = $1
+    AND
+        open_sessions.user_id = ANY($2::BIGINT[])
+    AND
+        open_sessions.mask = $3
+    AND
+        clock_ins.id = open_sessions.id
+    AND
+        clock_ins.clock_in = open_sessions.clock_in
+    RETURNING
+        clock_ins.*
+    """,
+)
+
+CLOSE_SESSIONS_FOR_GUILD = Query(
+    "clock_ins.close_sessions_for_guild",
+    """
+    UPDATE
+        clock_ins
+    SET
+        clock_out = $2
+    FROM
+        clock_ins_open_sessions AS open_sessions
+    WHERE
+        open_sessions.guild_id = $1
+    AND
+        clock_ins.id = open_sessions.id
+    AND
+        clock_ins.clock_in = open_sessions.clock_in
+    RETURNING
+        clock_ins.*
+    """,
+)
+
+REOPEN_SESSIONS = Query(
+    "clock_ins.reopen_sessions",
+    """
+    INSERT INTO
+        clock_ins
+        (
+            guild_id,
+            user_id,
+            mask,
+            clock_in
+        )
+    SELECT
+        $1,
+        sessions.user_id,
+        sessions.mask,
+        $4
+    FROM
+        UNNEST($2::BIGINT[], $3::TEXT[]) AS sessions (user_id, mask)
+    RETURNING
+        *
+    """,
+)
+
+UPSERT_CLOCK_IN = Query(
+    "clock_ins.upsert",
+    """
+    WITH updated AS (
+        UPDATE
+            clock_ins
+        SET
+            guild_id = $2,
+            user_id = $3,
+            mask = $4,
+            clock_in = $5,
+            clock_out = $6
+        WHERE
+            id = $1
+        RETURNING
+            id
+    )
+    INSERT INTO
+        clock_ins
+        (
+            id,
+            guild_id,
+            user_id,
+            mask,
+            clock_in,
+            clock_out
+        )
+    SELECT
+        $1,
+        $2,
+        $3,
+        $4,
+        $5,
+        $6
+    WHERE
+        NOT EXISTS (SELECT 1 FROM updated)
+    """,
+)
+
+UPSERT_CLOCK_INS = Query(
+    "clock_ins.upsert_many",
+    """
+    WITH batch AS (
+        SELECT
+            *
+        FROM
+            UNNEST(
+                $1::UUID[],
+                $2::BIGINT[],
+                $3::BIGINT[],
+                $4::TEXT[],
+                $5::TIMESTAMP[],
+                $6::TIMESTAMP[]
+            ) AS batch(id, guild_id, user_id, mask, clock_in, clock_out)
+    ),
+    updated AS (
+        UPDATE
+            clock_ins
+        SET
+            guild_id = batch.guild_id,
+            user_id = batch.user_id,
+            mask = batch.mask,
+            clock_in = batch.clock_in,
+            clock_out = batch.clock_out
+        FROM
+            batch
+        WHERE
+            clock_ins.id = batch.id
+        RETURNING
+            clock_ins.id
+    )
+    INSERT INTO
+        clock_ins
+        (
+            id,
+            guild_id,
+            user_id,
+            mask,
+            clock_in,
+            clock_out
+        )
+    SELECT
+        id,
+        guild_id,
+        user_id,
+        mask,
+        clock_in,
+        clock_out
+    FROM
+        batch
+    WHERE
+        id NOT IN (SELECT id FROM updated)
+    """,
+)
+
+ARCHIVE_CLOSED_BATCH = Query(
+    "clock_ins.archive_closed_batch",
+    """
+    WITH batch AS (
+        SELECT
+            id,
+            clock_in
+        FROM
+            clock_ins
+        WHERE
+            guild_id = $1
+        AND
+            clock_in < $2
+        AND
+            clock_out IS NOT NULL
+        LIMIT $3
+        FOR UPDATE SKIP LOCKED
+    ),
+    moved AS (
+        DELETE FROM
+            clock_ins
+        USING
+            batch
+        WHERE
+            clock_ins.id = batch.id
+        AND
+            clock_ins.clock_in = batch.clock_in
+        RETURNING
+            clock_ins.*
+    ),
+    archived AS (
+        INSERT INTO
+            clock_ins_archive
+            (
+                id,
+                guild_id,
+                user_id,
+                mask,
+                clock_in,
+                clock_out
+            )
+        SELECT
+            id,
+            guild_id,
+            user_id,
+            mask,
+            clock_in,
+            clock_out
+        FROM
+            moved
+    )
+    SELECT
+        (SELECT COUNT(*) FROM moved) AS moved
+    """,
+)
+
+
+# History
+
+GET_NEWEST_PAGE = Query(
+    "clock_ins.get_page",
+    """
+    SELECT
+        *
+    FROM
+        clock_ins
+    WHERE
+        guild_id = $1
+    AND
+        user_id = $2
+    ORDER BY
+        clock_in DESC,
+        id DESC
+    LIMIT $3
+    """,
+)
+
+GET_PAGE_BEFORE = Query(
+    "clock_ins.get_page_before",
+    """
+    SELECT
+        *
+    FROM
+        clock_ins
+    WHERE
+        guild_id = $1
+    AND
+        user_id = $2
+    AND
+        clock_in <= $3
+    AND
+        (clock_in, id) < ($3, $4::UUID)
+    ORDER BY
+        clock_in DESC,
+        id DESC
+    LIMIT $5
+    """,
+)
+
+GET_PAGE_AFTER = Query(
+    "clock_ins.get_page_after",
+    """
+    SELECT
+        *
+    FROM
+        clock_ins
+    WHERE
+        guild_id = $1
+    AND
+        user_id = $2
+    AND
+        clock_in >= $3
+    AND
+        (clock_in, id) > ($3, $4::UUID)
+    ORDER BY
+        clock_in ASC,
+        id ASC
+    LIMIT $5
+    """,
+)
+
+FETCH_BATCH_FOR_GUILD = Query(
+    "clock_ins.fetch_batch_for_guild",
+    """
+    SELECT
+        guild_id,
+        user_id,
+        mask,
+        (EXTRACT(EPOCH FROM clock_in) * 1000000)::BIGINT AS clock_in,
+        (EXTRACT(EPOCH FROM clock_out) * 1000000)::BIGINT AS clock_out
+    FROM
+        clock_ins
+    WHERE
+        guild_id = $1
+    AND
+        ($2::TIMESTAMP IS NULL OR clock_in >= $2)
+    AND
+        ($3::TIMESTAMP IS NULL OR clock_in < $3)
+    AND
+        ($4::BOOLEAN IS NULL OR (clock_out IS NOT NULL) = $4)
+    """,
+)
+
+
+FETCH_OPEN_BATCH_FOR_GUILD = Query(
+    "clock_ins.fetch_open_batch_for_guild",
+    """
+    SELECT
+        guild_id,
+        user_id,
+        mask,
+        (EXTRACT(EPOCH FROM clock_in) * 1000000)::BIGINT AS clock_in,
+        NULL::BIGINT AS clock_out
+    FROM
+        clock_ins_open_sessions
+    WHERE
+        guild_id = $1
+    AND
+        ($2::TIMESTAMP IS NULL OR clock_in >= $2)
+    AND
+        ($3::TIMESTAMP IS NULL OR clock_in < $3)
+    """,
+)
+
+
+# Totals
+
+ITER_DAILY_TOTALS = Query(
+    "clock_daily_totals.iter_for_guild",
+    """
+    SELECT
+        day,
+        user_id,
+        mask,
+        total_seconds
+    FROM
+        clock_daily_totals
+    WHERE
+        guild_id = $1
+    AND
+        (
+            (day >= DATE_TRUNC('day', $2::TIMESTAMP) AND day < $3::TIMESTAMP)
+            OR day = $4::TIMESTAMP::DATE
+        )
+    ORDER BY
+        day,
+        user_id,
+        mask COLLATE "C"
+    """,
+)
+
+GET_MASK_TOTALS = Query(
+    "clock_daily_totals.get_mask_totals",
+    """
+    SELECT
+        mask,
+        SUM(total_seconds)::DOUBLE PRECISION AS total_seconds
+    FROM
+        clock_daily_totals
+    WHERE
+        guild_id = $1
+    AND
+        user_id = $2
+    GROUP BY
+        mask
+    """,
+)
+
+
+GET_LEADERBOARD = Query(
+    "clock_leaderboard_totals.get_top",
+    """
+    SELECT
+        user_id,
+        total_seconds
+    FROM
+        clock_leaderboard_totals
+    WHERE
+        guild_id = $1
+    AND
+        mask = $2
+    AND
+        period = $3
+    AND
+        period_start = CASE WHEN $3 = 'all' THEN '-infinity'::DATE ELSE $4::DATE END
+    AND
+        total_seconds > 0
+    ORDER BY
+        total_seconds DESC,
+        user_id
+    LIMIT $5
+    """,
+)
+
+# Partitions
+
+ENSURE_PARTITIONS = Query(
+    "clock_ins.ensure_partitions",
+    """
+    SELECT
+        clock_ins_ensure_partitions($1)
+    """,
+)
+
+DROP_PARTITIONS_BEFORE = Query(
+    "clock_ins.drop_partitions_before",
+    """
+    SELECT
+        clock_ins_drop_partitions_before($1) AS name
+    """,
+)
+
+
+# Guild settings
+
+GET_MAX_SHIFT_SESSIONS = Query(
+    "guild_settings.get_max_shift_sessions",
+    """
+    SELECT
+        guild_settings.guild_id,
+        guild_settings.max_shift_length,
+        open_sessions.id,
+        open_sessions.user_id,
+        open_sessions.mask,
+        open_sessions.clock_in
+    FROM
+        guild_settings
+    LEFT JOIN
+        clock_ins_open_sessions AS open_sessions
+    ON
+        open_sessions.guild_id = guild_settings.guild_id
+    WHERE
+        guild_settings.max_shift_length IS NOT NULL
+    AND
+        (guild_settings.guild_id >> 22) % $1 = ANY($2::INTEGER[])
+    """,
+)
+
+SET_MAX_SHIFT_LENGTH = Query(
+    "guild_settings.set_max_shift_length",
+    """
+    INSERT INTO
+        guild_settings
+        (
+            guild_id,
+            max_shift_length
+        )
+    VALUES
+        (
+            $1,
+            $2
+        )
+    ON CONFLICT
+        (guild_id)
+    DO UPDATE SET
+        max_shift_length = excluded.max_shift_length
+    """,
+)
+
+GET_API_STATE = Query(
+    "guild_settings.get_api_state",
+    """
+    SELECT
+        guild_settings.api_key_hash,
+        MD5(CONCAT_WS(
+            ',',
+            totals.fingerprint,
+            open_sessions.fingerprint
+        )) AS fingerprint,
+        open_sessions.fingerprint IS NOT NULL AS has_open_sessions
+    FROM
+        (SELECT $1::BIGINT AS guild_id) AS guild
+    LEFT JOIN
+        guild_settings
+    ON
+        guild_settings.guild_id = guild.guild_id
+    CROSS JOIN LATERAL
+        (
+            SELECT
+                MD5(STRING_AGG(
+                    CONCAT_WS(':', user_id, mask, day, xmin),
+                    ','
+                    ORDER BY user_id, mask, day
+                )) AS fingerprint
+            FROM
+                clock_daily_totals
+            WHERE
+                guild_id = guild.guild_id
+            AND
+                (
+                    (day >= DATE_TRUNC('day', $2::TIMESTAMP) AND day < $3::TIMESTAMP)
+                    OR day = $4::TIMESTAMP::DATE
+                )
+        ) AS totals
+    CROSS JOIN LATERAL
+        (
+            SELECT
+                MD5(STRING_AGG(
+                    CONCAT_WS(':', id, clock_in),
+                    ','
+                    ORDER BY id
+                )) AS fingerprint
+            FROM
+                clock_ins_open_sessions
+            WHERE
+                guild_id = guild.guild_id
+        ) AS open_sessions
+    """,
+)
+
+SET_API_KEY_HASH = Query(
+    "guild_settings.set_api_key_hash",
+    """
+    INSERT INTO
+        guild_settings
+        (
+            guild_id,
+            api_key_hash
+        )
+    VALUES
+        (
+            $1,
+            $2
+        )
+    ON CONFLICT
+        (guild_id)
+    DO UPDATE SET
+        api_key_hash = excluded.api_key_hash
+    """,
+)
+
+
+# Masks
+
+GET_GUILD_MASKS = Query(
+    "clock_masks.get_for_guild",
+    """
+    SELECT
+        role_id,
+        mask
+    FROM
+        clock_masks
+    WHERE
+        guild_id = $1
+    """,
+)
+
+ADD_MASK = Query(
+    "clock_masks.add",
+    """
+    INSERT INTO
+        clock_masks
+        (
+            guild_id,
+            role_id,
+            mask
+        )
+    VALUES
+        (
+            $1,
+            $2,
+            $3
+        )
+    """,
+)
+
+REMOVE_MASK = Query(
+    "clock_masks.remove",
+    """
+    DELETE FROM
+        clock_masks
+    WHERE
+        guild_id = $1
+    AND
+        mask = $2
+    RETURNING
+        role_id
+    """,
+)
+
+
+# Events
+
+GET_LATEST_EVENTS = Query(
+    "clock_events.get_latest",
+    """
+    SELECT
+        *
+    FROM
+        clock_events
+    WHERE
+        guild_id = $1
+    AND
+        user_id = $2
+    ORDER BY
+        id DESC
+    LIMIT $3
+    """,
+)
+
+GET_EVENTS_SINCE = Query(
+    "clock_events.get_since",
+    """
+    SELECT
+        *
+    FROM
+        clock_events
+    WHERE
+        guild_id = $1
+    AND
+        user_id = $2
+    AND
+        transaction_id >= $3
+    ORDER BY
+        id
+    """,
+)
+
+GET_EVENT_SNAPSHOT = Query(
+    "clock_event_snapshots.get",
+    """
+    SELECT
+        event_id,
+        horizon,
+        state
+    FROM
+        clock_event_snapshots
+    WHERE
+        guild_id = $1
+    AND
+        user_id = $2
+    """,
+)
+
+SET_EVENT_SNAPSHOT = Query(
+    "clock_event_snapshots.set",
+    """
+    INSERT INTO
+        clock_event_snapshots
+        (
+            guild_id,
+            user_id,
+            event_id,
+            horizon,
+            state
+        )
+    VALUES
+        (
+            $1,
+            $2,
+            $3,
+            $4,
+            $5::JSONB
+        )
+    ON CONFLICT
+        (guild_id, user_id)
+    DO UPDATE SET
+        event_id = excluded.event_id,
+        horizon = excluded.horizon,
+        state = excluded.state,
+        taken_at = excluded.taken_at
+    WHERE
+        clock_event_snapshots.horizon < excluded.horizon
+    """,
+)
+
+GET_SNAPSHOT_HIGH_WATER_MARK = Query(
+    "clock_event_snapshots.get_high_water_mark",
+    """
+    SELECT
+        COALESCE(MAX(horizon), 0) AS horizon
+    FROM
+        clock_event_snapshots
+    """,
+)
+
+GET_SETTLED_EVENT_USERS = Query(
+    "clock_events.get_settled_users",
+    """
+    WITH horizon AS (
+        SELECT
+            TXID_SNAPSHOT_XMIN(TXID_CURRENT_SNAPSHOT()) AS transaction_id
+    ),
+    batch AS (
+        SELECT
+            clock_events.transaction_id
+        FROM
+            clock_events,
+            horizon
+        WHERE
+            clock_events.transaction_id >= $1
+        AND
+            clock_events.transaction_id < horizon.transaction_id
+        ORDER BY
+            clock_events.transaction_id
+        LIMIT $2
+    ),
+    upper_bound AS (
+        SELECT
+            CASE
+                WHEN COUNT(*) < $2 THEN (SELECT transaction_id FROM horizon)
+                ELSE GREATEST(MAX(transaction_id), $1 + 1)
+            END AS transaction_id
+        FROM
+            batch
+    )
+    SELECT DISTINCT
+        clock_events.guild_id,
+        clock_events.user_id,
+        upper_bound.transaction_id AS horizon
+    FROM
+        clock_events,
+        upper_bound
+    WHERE
+        clock_events.transaction_id >= $1
+    AND
+        clock_events.transaction_id < upper_bound.transaction_id
+    """,
+)
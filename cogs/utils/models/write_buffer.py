@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime as dt
+import logging
+from typing import TYPE_CHECKING, ClassVar, Optional
+
+from ..metrics import Metrics
+from . import queries
+from .open_sessions import OpenSessionIndex
+
+if TYPE_CHECKING:
+    import asyncpg
+
+    from .clock_ins import ClockIn
+
+
+__all__ = (
+    'ClockInWriteBuffer',
+)
+
+
+log = logging.getLogger("cogs.utils.models.write_buffer")
+
+
+class _PendingWrite:
+
+    __slots__ = (
+        'clock_in',
+        'futures',
+    )
+
+    def __init__(self, clock_in: ClockIn):
+        self.clock_in: ClockIn = clock_in
+        self.futures: list[asyncio.Future] = []
+
+
+class _PendingOpen:
+
+    __slots__ = (
+        'guild_id',
+        'user_id',
+        'role_ids',
+        'mask',
+        'clocked_in_at',
+        'future',
+    )
+
+    def __init__(
+            self,
+            guild_id: int,
+            user_id: int,
+            role_ids: list[int],
+            mask: str,
+            clocked_in_at: dt,
+            future: asyncio.Future):
+        self.guild_id: int = guild_id
+        self.user_id: int = user_id
+        self.role_ids: list[int] = role_ids
+        self.mask: str = mask
+        self.clocked_in_at: dt = clocked_in_at
+        self.future: asyncio.Future = future
+
+
+class ClockInWriteBuffer:
+    """
+    Coalesces :meth:`ClockIn.update` calls (which include clock outs) and
+    :meth:`ClockIn.open_session` calls that arrive close together into a
+    multi-row upsert and a multi-row clock in. Writes are held for at most
+    :attr:`max_delay` seconds, or until :attr:`max_batch` writes are
+    waiting, and then flushed. Several writes to the same clock in before a
+    flush only upsert its latest values.
+
+    Each flush writes its upserts before its clock ins, and flushes run one
+    at a time, so a clock in after a pending clock out of the same mask
+    isn't turned away because the clock out hasn't been written yet.
+
+    Callers wait until their write's batch has been committed, so a write
+    is never acknowledged before it's in the database. Upserts are applied
+    to this process's open session index as soon as they're queued, so that
+    clock ins and outs see pending writes straight away, while clock ins are
+    applied once they've been made, since it's the database that decides
+    whether they're allowed. The write listeners (which can tell other
+    processes) are only told once a write has been committed. If a batch
+    fails, each of its writes is retried on its own so that one bad row
+    doesn't fail the others, and the open session index is reloaded from
+    the database to undo anything that didn't make it.
+
+    The buffer is off until :meth:`configure` turns it on.
+    """
+
+    enabled: ClassVar[bool] = False
+    max_delay: ClassVar[float] = 0.005
+    max_batch: ClassVar[int] = 500
+
+    _pending: ClassVar[dict[str, _PendingWrite]] = {}
+    _opens: ClassVar[list[_PendingOpen]] = []
+    _flush_handle: ClassVar[Optional[asyncio.TimerHandle]] = None
+    _flush_tasks: ClassVar[set[asyncio.Task]] = set()
+    _flush_lock: ClassVar[Optional[asyncio.Lock]] = None
+
+    @classmethod
+    def configure(
+            cls,
+            *,
+            enabled: bool,
+            max_delay: float = 0.005,
+            max_batch: int = 500) -> None:
+        """
+        Turn the buffer on or off, and set how long writes can wait and how
+        many can be flushed at once.
+        """
+
+        cls.enabled = enabled
+        cls.max_delay = max_delay
+        cls.max_batch = max_batch
+
+    @classmethod
+    async def write(cls, clock_in: ClockIn) -> None:
+        """
+        Queue a clock in to be upserted, and wait until it's been committed.
+        """
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = cls._pending.get(clock_in.id)
+        if pending is None:
+            pending = cls._pending[clock_in.id] = _PendingWrite(clock_in)
+        pending.clock_in = clock_in
+        pending.futures.append(future)
+        OpenSessionIndex.apply(clock_in)
+        cls._queued()
+        await future
+
+    @classmethod
+    async def open_session(
+            cls,
+            guild_id: int,
+            user_id: int,
+            role_ids: list[int],
+            mask: str,
+            clocked_in_at: dt) -> tuple[bool, Optional[ClockIn]]:
+        """
+        Queue a clock in, and wait until it's been committed. Returns the
+        same as :meth:`ClockIn.open_session`.
+        """
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        cls._opens.append(_PendingOpen(
+            guild_id,
+            user_id,
+            role_ids,
+            mask,
+            clocked_in_at,
+            future,
+        ))
+        cls._queued()
+        return await future
+
+    @classmethod
+    def _queued(cls) -> None:
+        """
+        Flush now if the batch is full, or after the delay otherwise.
+        """
+
+        if len(cls._pending) + len(cls._opens) >= cls.max_batch:
+            cls._schedule_flush(0)
+        elif cls._flush_handle is None:
+            cls._schedule_flush(cls.max_delay)
+
+    @classmethod
+    def _schedule_flush(cls, delay: float) -> None:
+        if cls._flush_handle is not None:
+            cls._flush_handle.cancel()
+        loop = asyncio.get_running_loop()
+        cls._flush_handle = loop.call_later(delay, cls._start_flush)
+
+    @classmethod
+    def _start_flush(cls) -> None:
+        cls._flush_handle = None
+        task = asyncio.create_task(cls.flush())
+        cls._flush_tasks.add(task)
+        task.add_done_callback(cls._flush_tasks.discard)
+
+    @classmethod
+    async def flush(cls) -> None:
+        """
+        Write everything that's waiting to the database. Batches are flushed
+        one at a time so that writes to the same clock in land in order.
+        """
+
+        if cls._flush_handle is not None:
+            cls._flush_handle.cancel()
+            cls._flush_handle = None
+        if cls._flush_lock is None:
+            cls._flush_lock = asyncio.Lock()
+        async with cls._flush_lock:
+            batch = list(cls._pending.values())
+            opens = cls._opens
+            cls._pending = {}
+            cls._opens = []
+            if batch:
+                try:
+                    await cls._upsert([i.clock_in for i in batch])
+                except Exception:
+                    log.exception("Failed to flush %s clock ins, retrying them one by one", len(batch))
+                    await cls._upsert_each(batch)
+                else:
+                    for pending in batch:
+                        cls._committed(pending)
+            if opens:
+                try:
+                    rows = await cls._open(opens)
+                except Exception:
+                    log.exception("Failed to flush %s clock ins, retrying them one by one", len(opens))
+                    await cls._open_each(opens)
+                else:
+                    cls._opened(opens, rows)
+
+    @classmethod
+    async def _upsert_each(cls, batch: list[_PendingWrite]) -> None:
+        """
+        Upsert each write on its own, failing only the writes that fail, and
+        then bring the open session index back in line with the database.
+        """
+
+        from .clock_ins import ClockIn
+
+        for pending in batch:
+            try:
+                await cls._upsert([pending.clock_in])
+            except Exception as e:
+                for future in pending.futures:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                cls._committed(pending)
+        try:
+            await ClockIn.hydrate_open_sessions(force=True)
+        except Exception:
+            log.exception("Failed to reload the open session index")
+            return
+        for pending in cls._pending.values():
+            OpenSessionIndex.apply(pending.clock_in)
+
+    @classmethod
+    async def _open_each(cls, opens: list[_PendingOpen]) -> None:
+        """
+        Make each clock in on its own, failing only the ones that fail.
+        """
+
+        for pending_open in opens:
+            try:
+                rows = await cls._open([pending_open])
+            except Exception as e:
+                if not pending_open.future.done():
+                    pending_open.future.set_exception(e)
+            else:
+                cls._opened([pending_open], rows)
+
+    @staticmethod
+    def _opened(opens: list[_PendingOpen], rows: list[asyncpg.Record]) -> None:
+        """
+        Give each queued clock in its result. If the same clock in was asked
+        for more than once, only the first gets it, and the rest are told
+        that they're already clocked in.
+        """
+
+        from .clock_ins import ClockIn
+
+        given: set[str] = set()
+        for pending_open, row in zip(opens, rows):
+            clock_in = None
+            if row['id'] is not None and str(row['id']) not in given:
+                given.add(str(row['id']))
+                clock_in = ClockIn.from_row(row)
+                ClockIn.written(clock_in)
+            if not pending_open.future.done():
+                pending_open.future.set_result((row['allowed'], clock_in))
+
+    @staticmethod
+    def _committed(pending: _PendingWrite) -> None:
+        """
+        Tell the write listeners about a committed write, and then its
+        callers.
+        """
+
+        from .clock_ins import ClockIn
+
+        ClockIn.notify_write_listeners(pending.clock_in)
+        for future in pending.futures:
+            if not future.done():
+                future.set_result(None)
+
+    @staticmethod
+    @Metrics.timed("query")
+    async def _upsert(clock_ins: list[ClockIn]) -> None:
+        async with queries.acquire() as db:
+            await queries.UPSERT_CLOCK_INS.fetch(
+                db,
+                [i.id for i in clock_ins],
+                [i.guild_id for i in clock_ins],
+                [i.user_id for i in clock_ins],
+                [i.mask for i in clock_ins],
+                [i.clocked_in_at for i in clock_ins],
+                [i.clocked_out_at for i in clock_ins],
+            )
+
+    @staticmethod
+    @Metrics.timed("query")
+    async def _open(opens: list[_PendingOpen]) -> list[asyncpg.Record]:
+        async with queries.acquire() as db:
+            return await queries.OPEN_SESSIONS_BATCH.fetch(
+                db,
+                list(range(len(opens))),
+                [i.guild_id for i in opens],
+                [i.user_id for i in opens],
+                [i.mask for i in opens],
+                [i.clocked_in_at for i in opens],
+                [index for index, i in enumerate(opens) for _ in i.role_ids],
+                [role_id for i in opens for role_id in i.role_ids],
+            )
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from datetime import date, datetime as dt
+from typing import TYPE_CHECKING, Optional
+
+from .metrics import Metrics
+from .models import queries
+
+if TYPE_CHECKING:
+    from discord.ext import vbu
+
+
+__all__ = (
+    'ensure_partitions',
+    'drop_expired_partitions',
+)
+
+
+def _months_before(value: date, months: int) -> date:
+    """
+    Get the first day of the month that's a number of months before the
+    given date's month.
+    """
+
+    index = value.year * 12 + (value.month - 1) - months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+@Metrics.timed("query")
+async def ensure_partitions(
+        db: vbu.Database,
+        months_ahead: int = 3) -> None:
+    """
+    Make sure that the clock ins table has a partition for this month and
+    for the given number of months after it, so that new clock ins never
+    land in the default partition.
+    """
+
+    await queries.ENSURE_PARTITIONS.fetch(db, months_ahead)
+
+
+@Metrics.timed("query")
+async def drop_expired_partitions(
+        db: vbu.Database,
+        retention_months: int,
+        now: Optional[dt] = None) -> list[str]:
+    """
+    Detach and drop the monthly partitions of the clock ins table that ended
+    more than ``retention_months`` full months before the current month.
+    Their clock ins are deleted first so that their time comes out of the
+    daily totals, leaderboards, and event log as well. Months with a clock
+    in that's still open, and admin-managed durations, are kept. Returns the
+    names of the partitions that were dropped.
+    """
+
+    cutoff = _months_before((now or dt.utcnow()).date(), retention_months)
+    rows = await queries.DROP_PARTITIONS_BEFORE.fetch(db, cutoff)
+    return [row['name'] for row in rows]
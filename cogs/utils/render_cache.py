@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import collections
+from typing import TYPE_CHECKING, Generic, Optional, TypeVar
+
+if TYPE_CHECKING:
+    from .models import ClockIn
+
+
+__all__ = (
+    'RenderCache',
+)
+
+
+T = TypeVar("T")
+_Key = tuple[int, int]
+
+
+class RenderCache(Generic[T]):
+    """
+    A bounded least-recently-used cache of rendered output per (guild ID,
+    user ID), dropped whenever one of that user's clock ins is written.
+    Register :meth:`on_clock_in_written` with
+    :meth:`ClockIn.add_write_listener` to keep it up to date.
+
+    Anything rendered from data that was read while a write was happening
+    could be stale, so callers take a :attr:`version` before reading, and
+    :meth:`set` ignores values whose version is out of date.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size: int = max_size
+        self.version: int = 0
+        self._entries: collections.OrderedDict[_Key, T] = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, guild_id: int, user_id: int) -> Optional[T]:
+        """
+        Get the cached value for a user, marking it as recently used.
+        """
+
+        key = (guild_id, user_id)
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def set(self, guild_id: int, user_id: int, value: T, version: int) -> None:
+        """
+        Cache a value for a user, evicting the least recently used value if
+        the cache is full. Nothing is cached if anything was invalidated
+        since ``version`` was taken.
+        """
+
+        if version != self.version:
+            return
+        key = (guild_id, user_id)
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, guild_id: int, user_id: int) -> None:
+        """
+        Drop the cached value for a user.
+        """
+
+        self.version += 1
+        self._entries.pop((guild_id, user_id), None)
+
+    def invalidate_guild(self, guild_id: int) -> None:
+        """
+        Drop the cached values for every user in a guild.
+        """
+
+        self.version += 1
+        for key in [i for i in self._entries if i[0] == guild_id]:
+            del self._entries[key]
+
+    def on_clock_in_written(self, clock_in: ClockIn) -> None:
+        self.invalidate(clock_in.guild_id, clock_in.user_id)
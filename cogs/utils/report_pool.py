@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import functools
+import logging
+from typing import Any, Callable, ClassVar, Optional, TypeVar
+
+
+__all__ = (
+    'ReportPool',
+)
+
+
+T = TypeVar("T")
+
+
+log = logging.getLogger("cogs.utils.report_pool")
+
+
+class ReportPool:
+    """
+    A bounded pool of worker processes for CPU-heavy report work, so that
+    building a large guild's export doesn't hold up the event loop (and with
+    it, heartbeats and every other guild's interactions).
+
+    Work is given to the pool as a module-level function and plain data -
+    arrays, tuples, and strings rather than model objects - so that as
+    little as possible is pickled on the way to the workers. At most
+    :attr:`max_workers` jobs run at once, and anything more waits its turn.
+
+    Until :meth:`configure` turns the pool on, work is run on a thread in
+    this process instead. If a worker dies, the pool is started again and the
+    work that was lost with it is retried once.
+    """
+
+    enabled: ClassVar[bool] = False
+    max_workers: ClassVar[int] = 2
+
+    _executor: ClassVar[Optional[ProcessPoolExecutor]] = None
+
+    @classmethod
+    def configure(cls, *, enabled: bool, max_workers: int = 2) -> None:
+        """
+        Turn the pool on or off, and set how many worker processes it can
+        use. Any existing workers are shut down.
+        """
+
+        cls.shutdown()
+        cls.enabled = enabled and max_workers > 0
+        cls.max_workers = max_workers
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """
+        Stop the worker processes once they've finished what they're doing.
+        """
+
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
+
+    @classmethod
+    def _get_executor(cls) -> ProcessPoolExecutor:
+        if cls._executor is None:
+            cls._executor = ProcessPoolExecutor(max_workers=cls.max_workers)
+        return cls._executor
+
+    @classmethod
+    def _restart(cls, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """
+        Replace a broken pool, unless another job has already done so.
+        """
+
+        if cls._executor is broken:
+            log.exception("A report worker died, starting a new pool")
+            broken.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
+        return cls._get_executor()
+
+    @classmethod
+    def run(
+            cls,
+            function: Callable[..., T],
+            *args: Any,
+            **kwargs: Any) -> asyncio.Future[T]:
+        """
+        Start running a function in the pool, returning a future for its
+        result. The work starts straight away, so a caller can carry on
+        reading the next batch of data before awaiting it.
+        """
+
+        call = functools.partial(function, *args, **kwargs)
+        if not cls.enabled:
+            return asyncio.ensure_future(asyncio.to_thread(call))
+        loop = asyncio.get_running_loop()
+        executor = cls._get_executor()
+        try:
+            future = loop.run_in_executor(executor, call)
+        except BrokenProcessPool:
+            executor = cls._restart(executor)
+            future = loop.run_in_executor(executor, call)
+        return asyncio.ensure_future(cls._retry_if_broken(future, executor, call))
+
+    @classmethod
+    async def _retry_if_broken(
+            cls,
+            future: asyncio.Future[T],
+            executor: ProcessPoolExecutor,
+            call: Callable[[], T]) -> T:
+        """
+        Wait for some work, running it once more in a new pool if its worker
+        died while it was running.
+        """
+
+        try:
+            return await future
+        except BrokenProcessPool:
+            executor = cls._restart(executor)
+            return await asyncio.get_running_loop().run_in_executor(executor, call)
@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime as dt
+import json
+import logging
+import time
+from typing import TYPE_CHECKING, Any, Callable, ClassVar, Optional
+import uuid
+
+if TYPE_CHECKING:
+    from discord.ext import vbu
+
+    from .models import ClockIn
+
+
+__all__ = (
+    'SharedCache',
+)
+
+
+log = logging.getLogger("cogs.utils.shared_cache")
+
+
+class SharedCache:
+    """
+    Shares cached data between the bot's shard processes through Redis.
+    Values are stored under :attr:`PREFIX`, and writes are announced on
+    :attr:`CHANNEL` so that every process can drop or update its own
+    in-memory copy.
+
+    Redis is only ever a cache - if it can't be reached, the failure is
+    logged, Redis is left alone for :attr:`RETRY_AFTER` seconds, and
+    callers fall back to Postgres. Since announcements might have been
+    missed while it was down, :attr:`recovered_listeners` are called once
+    it's reachable again so that anything built from them can be reloaded.
+
+    Everything goes through the connection's aioredis client (``re.conn``)
+    so that values are read and written the same way.
+    """
+
+    PREFIX: ClassVar[str] = "clocker"
+    CHANNEL: ClassVar[str] = "clocker:writes"
+    RETRY_AFTER: ClassVar[float] = 30
+
+    # An ID for this process, so that it can ignore its own announcements
+    ORIGIN: ClassVar[str] = uuid.uuid4().hex
+
+    enabled: ClassVar[bool] = False
+    connect: ClassVar[Optional[Callable[[], vbu.Redis]]] = None
+    recovered_listeners: ClassVar[list[Callable[[], Any]]] = []
+
+    _unavailable_until: ClassVar[Optional[float]] = None
+    _publish_tasks: ClassVar[set[asyncio.Task]] = set()
+    _applying_remote: ClassVar[bool] = False
+
+    @classmethod
+    def setup(
+            cls,
+            enabled: bool,
+            connect: Optional[Callable[[], vbu.Redis]] = None) -> None:
+        """
+        Turn the shared cache on or off. ``connect`` should return an async
+        context manager for a Redis connection, and defaults to
+        :class:`vbu.Redis`.
+        """
+
+        if connect is None:
+            from discord.ext import vbu
+            connect = vbu.Redis
+        cls.enabled = enabled
+        cls.connect = connect
+
+    @classmethod
+    def available(cls) -> bool:
+        """
+        Whether Redis is turned on and hasn't recently failed.
+        """
+
+        if not cls.enabled or cls.connect is None:
+            return False
+        if cls._unavailable_until is None:
+            return True
+        return time.monotonic() >= cls._unavailable_until
+
+    @classmethod
+    def degraded(cls) -> bool:
+        """
+        Whether Redis is turned on but can't currently be used, meaning that
+        writes from other processes might be going unheard.
+        """
+
+        return cls.enabled and not cls.available()
+
+    @classmethod
+    async def ping(cls) -> bool:
+        """
+        Check whether Redis can be reached, so that outages and recoveries
+        are noticed even when nothing else is using it.
+        """
+
+        if not cls.enabled or cls.connect is None:
+            return False
+        try:
+            async with cls.connect() as re:
+                await re.conn.ping()
+        except Exception:
+            cls._failed("ping")
+            return False
+        cls._succeeded()
+        return True
+
+    @classmethod
+    def _failed(cls, action: str) -> None:
+        if cls._unavailable_until is None:
+            log.exception("Failed to %s in Redis, falling back to Postgres", action)
+        cls._unavailable_until = time.monotonic() + cls.RETRY_AFTER
+
+    @classmethod
+    def _succeeded(cls) -> None:
+        if cls._unavailable_until is None:
+            return
+        cls._unavailable_until = None
+        log.info("Redis is reachable again")
+        for listener in cls.recovered_listeners:
+            listener()
+
+    @classmethod
+    async def get(cls, key: str) -> Optional[Any]:
+        """
+        Get a cached JSON value, or ``None`` if it isn't cached or Redis
+        can't be reached.
+        """
+
+        if not cls.available():
+            return None
+        assert cls.connect
+        try:
+            async with cls.connect() as re:
+                value = await re.conn.get(f"{cls.PREFIX}:{key}")
+        except Exception:
+            cls._failed("get a cached value")
+            return None
+        cls._succeeded()
+        return None if value is None else json.loads(value)
+
+    @classmethod
+    async def set(cls, key: str, value: Any, ttl: int) -> None:
+        """
+        Cache a JSON value for ``ttl`` seconds.
+        """
+
+        if not cls.available():
+            return
+        assert cls.connect
+        try:
+            async with cls.connect() as re:
+                await re.conn.set(f"{cls.PREFIX}:{key}", json.dumps(value), expire=ttl)
+        except Exception:
+            cls._failed("cache a value")
+            return
+        cls._succeeded()
+
+    @classmethod
+    async def invalidate(cls, key: str, message: dict[str, Any]) -> None:
+        """
+        Drop a cached value and tell the other processes about the write
+        that made it stale.
+        """
+
+        if not cls.available():
+            return
+        assert cls.connect
+        try:
+            async with cls.connect() as re:
+                await re.conn.delete(f"{cls.PREFIX}:{key}")
+                await re.conn.publish_json(cls.CHANNEL, {**message, "origin": cls.ORIGIN})
+        except Exception:
+            cls._failed("invalidate a cached value")
+            return
+        cls._succeeded()
+
+    @classmethod
+    async def publish(cls, message: dict[str, Any]) -> None:
+        """
+        Tell the other processes about a write.
+        """
+
+        if not cls.available():
+            return
+        assert cls.connect
+        try:
+            async with cls.connect() as re:
+                await re.conn.publish_json(cls.CHANNEL, {**message, "origin": cls.ORIGIN})
+        except Exception:
+            cls._failed("publish a write")
+            return
+        cls._succeeded()
+
+    @classmethod
+    async def subscribe(cls) -> Optional[Any]:
+        """
+        Subscribe to the writes announced by the other processes, returning
+        the channel to :meth:`listen` on, or ``None`` if Redis can't be
+        reached.
+        """
+
+        if not cls.available():
+            return None
+        assert cls.connect
+        try:
+            async with cls.connect() as re:
+                (channel,) = await re.conn.subscribe(cls.CHANNEL)
+        except Exception:
+            cls._failed("subscribe to writes")
+            return None
+        return channel
+
+    @classmethod
+    async def listen(cls, channel: Any) -> None:
+        """
+        Apply the writes announced on a channel from :meth:`subscribe` until
+        the subscription drops. Writes would go unheard from then on, so
+        Redis is treated as unreachable until it's found again, at which
+        point the :attr:`recovered_listeners` can subscribe again.
+        """
+
+        try:
+            while await channel.wait_message():
+                message = await channel.get_json()
+                try:
+                    cls.handle_message(message)
+                except Exception:
+                    log.exception("Failed to apply a write from another process")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            cls._failed("listen for writes")
+            return
+        log.warning("Lost the subscription to writes in Redis, falling back to Postgres")
+        cls._unavailable_until = time.monotonic() + cls.RETRY_AFTER
+
+    @classmethod
+    def on_clock_in_written(cls, clock_in: ClockIn) -> None:
+        """
+        Announce a clock in that this process has written, so that the
+        other processes can apply it to their open session indexes. Register
+        with :meth:`ClockIn.add_write_listener`.
+        """
+
+        if cls._applying_remote or not cls.available():
+            return
+        task = asyncio.create_task(cls.publish({
+            "kind": "clock_in",
+            "clock_in": cls.dump_clock_in(clock_in),
+        }))
+        cls._publish_tasks.add(task)
+        task.add_done_callback(cls._publish_tasks.discard)
+
+    @classmethod
+    def handle_message(cls, message: dict[str, Any]) -> None:
+        """
+        Apply a write that another process has announced.
+        """
+
+        from .mask_registry import MaskRegistry
+        from .models import ClockIn
+
+        if message.get("origin") == cls.ORIGIN:
+            return
+        if message["kind"] == "masks":
+            MaskRegistry.invalidate(message["guild_id"])
+        elif message["kind"] == "clock_in":
+            clock_in = ClockIn.from_row(cls.load_clock_in(message["clock_in"]))
+            cls._applying_remote = True
+            try:
+                ClockIn.written(clock_in)
+            finally:
+                cls._applying_remote = False
+
+    @staticmethod
+    def dump_clock_in(clock_in: ClockIn) -> dict[str, Any]:
+        return {
+            "id": clock_in.id,
+            "guild_id": clock_in.guild_id,
+            "user_id": clock_in.user_id,
+            "mask": clock_in.mask,
+            "clock_in": clock_in.clocked_in_at.isoformat(),
+            "clock_out": (
+                None
+                if clock_in.clocked_out_at is None
+                else clock_in.clocked_out_at.isoformat()
+            ),
+        }
+
+    @staticmethod
+    def load_clock_in(data: dict[str, Any]) -> dict[str, Any]:
+        """
+        Turn a clock in from :meth:`dump_clock_in` back into a row that can
+        be passed to :meth:`ClockIn.from_row`.
+        """
+
+        return {
+            "id": data["id"],
+            "guild_id": data["guild_id"],
+            "user_id": data["user_id"],
+            "mask": data["mask"],
+            "clock_in": dt.fromisoformat(data["clock_in"]),
+            "clock_out": (
+                None
+                if data["clock_out"] is None
+                else dt.fromisoformat(data["clock_out"])
+            ),
+        }
@@ -0,0 +1,67 @@
+"""
+A scratch Postgres schema for the tests that need the real database - its
+triggers, locks, and transaction visibility - rather than a stand-in.
+
+Set ``CLOCKER_TEST_DSN`` to a database that the tests can create schemas in
+to run them. They're skipped otherwise. Each test gets its own schema, with
+the base schema and every migration applied, and it's dropped afterwards.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+from typing import AsyncIterator, Awaitable, Callable
+import uuid
+
+import asyncpg
+import pytest
+
+from cogs.utils.migrations import apply_schema
+
+
+__all__ = (
+    'DSN',
+    'requires_postgres',
+    'scratch_database',
+)
+
+
+DSN = os.environ.get("CLOCKER_TEST_DSN")
+
+requires_postgres = pytest.mark.skipif(
+    DSN is None,
+    reason="CLOCKER_TEST_DSN isn't set",
+)
+
+
+@contextlib.asynccontextmanager
+async def scratch_database() -> AsyncIterator[Callable[[], Awaitable[asyncpg.Connection]]]:
+    """
+    Create a schema with everything applied, and yield a function that opens
+    a new connection to it. Connections are closed, and the schema dropped,
+    on the way out.
+    """
+
+    assert DSN is not None
+    schema = f"test_{uuid.uuid4().hex}"
+    connections: list[asyncpg.Connection] = []
+
+    async def connect() -> asyncpg.Connection:
+        conn = await asyncpg.connect(
+            DSN,
+            server_settings={"search_path": f"{schema}, public"},
+        )
+        connections.append(conn)
+        return conn
+
+    admin = await asyncpg.connect(DSN)
+    try:
+        await admin.execute(f"CREATE SCHEMA {schema}")
+        await apply_schema(await connect())
+        yield connect
+    finally:
+        for conn in connections:
+            await conn.close()
+        await admin.execute(f"DROP SCHEMA {schema} CASCADE")
+        await admin.close()
@@ -0,0 +1,116 @@
+"""
+An in-process stand-in for the parts of ``vbu.Redis`` (and the aioredis
+client underneath it) that the shared cache uses, with a switch to make it
+unreachable.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Any, Optional
+
+
+__all__ = (
+    'StandInRedis',
+)
+
+
+class _Channel:
+
+    def __init__(self):
+        self._messages: asyncio.Queue[Optional[str]] = asyncio.Queue()
+
+    async def wait_message(self) -> bool:
+        message = await self._messages.get()
+        if message is None:
+            return False
+        self._messages.put_nowait(message)
+        return True
+
+    async def get_json(self) -> Any:
+        message = self._messages.get_nowait()
+        assert message is not None
+        return json.loads(message)
+
+    def close(self) -> None:
+        self._messages.put_nowait(None)
+
+
+class _Client:
+
+    def __init__(self, redis: StandInRedis):
+        self._redis = redis
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._redis.values.get(key)
+
+    async def set(self, key: str, value: str, *, expire: int = 0) -> None:
+        self._redis.values[key] = value.encode()
+        self._redis.expiry[key] = expire
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._redis.values.pop(key, None)
+
+    async def ping(self) -> bytes:
+        return b"PONG"
+
+    async def publish_json(self, channel: str, data: Any) -> None:
+        self._redis.published.append(data)
+        for subscriber in self._redis.subscribers.get(channel, []):
+            subscriber._messages.put_nowait(json.dumps(data))
+
+    async def subscribe(self, channel: str) -> list[_Channel]:
+        return [self._redis.subscribe(channel)]
+
+
+class _Connection:
+
+    def __init__(self, redis: StandInRedis):
+        self._redis = redis
+        self.conn = _Client(redis)
+
+    async def __aenter__(self) -> _Connection:
+        self._redis.connections += 1
+        if self._redis.down:
+            raise ConnectionRefusedError("Redis is down")
+        return self
+
+    async def __aexit__(self, *_):
+        return None
+
+
+class StandInRedis:
+    """
+    Call an instance to get a connection, the same as ``vbu.Redis``.
+    """
+
+    logger = logging.getLogger("tests.redis_standin")
+
+    def __init__(self):
+        self.values: dict[str, bytes] = {}
+        self.expiry: dict[str, int] = {}
+        self.subscribers: dict[str, list[_Channel]] = {}
+        self.published: list[Any] = []
+        self.connections = 0
+        self.down = False
+
+    def __call__(self) -> _Connection:
+        return _Connection(self)
+
+    def subscribe(self, channel: str) -> _Channel:
+        subscriber = _Channel()
+        self.subscribers.setdefault(channel, []).append(subscriber)
+        return subscriber
+
+    def close(self) -> None:
+        """
+        Drop every subscription, as if the connection they're on had closed.
+        """
+
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                subscriber.close()
+        self.subscribers.clear()
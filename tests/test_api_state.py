@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime as dt
+
+from cogs import utils
+from cogs.utils.migrations import reconcile_daily_totals
+
+from .postgres import requires_postgres, scratch_database
+
+
+pytestmark = requires_postgres
+
+
+START = dt(2024, 1, 1)
+END = dt(2024, 2, 1)
+
+
+async def clock(conn, user_id: int, hour: int) -> None:
+    await conn.execute(
+        """
+        INSERT INTO
+            clock_ins
+            (
+                guild_id,
+                user_id,
+                mask,
+                clock_in,
+                clock_out
+            )
+        VALUES
+            (
+                1,
+                $1,
+                'work',
+                $2,
+                $3
+            )
+        """,
+        user_id,
+        dt(2024, 1, 10, hour),
+        dt(2024, 1, 10, hour, 30),
+    )
+
+
+async def fingerprint(conn) -> str:
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        state = await utils.get_api_state(conn, 1, START, END)
+    return state["fingerprint"]
+
+
+def test_etag_changes_when_writes_commit_out_of_order():
+
+    async def run():
+        async with scratch_database() as connect:
+            first, second, reader = await connect(), await connect(), await connect()
+
+            # Both users already have a total for the day, so neither write
+            # adds a row
+            await clock(first, 2, 1)
+            await clock(first, 3, 1)
+            before = await fingerprint(reader)
+
+            # The first write is made first but commits last
+            first_transaction = first.transaction()
+            await first_transaction.start()
+            await clock(first, 2, 9)
+            await asyncio.sleep(0.01)
+            async with second.transaction():
+                await clock(second, 3, 10)
+            after_second = await fingerprint(reader)
+            await first_transaction.commit()
+            after_first = await fingerprint(reader)
+
+        assert len({before, after_second, after_first}) == 3
+
+    asyncio.run(run())
+
+
+def test_etag_changes_when_reconciled():
+
+    async def run():
+        async with scratch_database() as connect:
+            conn = await connect()
+            await clock(conn, 2, 1)
+            before = await fingerprint(conn)
+            await reconcile_daily_totals(conn, 1)
+            assert await fingerprint(conn) != before
+
+    asyncio.run(run())
@@ -0,0 +1,33 @@
+from datetime import date, datetime as dt, timedelta
+
+from cogs import utils
+from cogs.utils.models.clock_in_batch import to_micros
+
+
+def make_batch(*clock_ins: tuple[dt, dt]) -> utils.ClockInBatch:
+    batch = utils.ClockInBatch(to_micros(dt(2024, 1, 10)))
+    for clock_in, clock_out in clock_ins:
+        batch.append(1, 2, "work", to_micros(clock_in), to_micros(clock_out))
+    return batch
+
+
+def test_split_across_midnight():
+    batch = make_batch((dt(2024, 1, 1, 22), dt(2024, 1, 2, 6)))
+    assert utils.split_by_day(batch) == {
+        (date(2024, 1, 1), 2, "work"): timedelta(hours=2),
+        (date(2024, 1, 2), 2, "work"): timedelta(hours=6),
+    }
+
+
+def test_admin_removal_stays_on_one_day():
+    batch = make_batch((dt(2000, 1, 1), dt(2000, 1, 1) - timedelta(hours=3)))
+    assert utils.split_by_day(batch) == {
+        (date(2000, 1, 1), 2, "work"): timedelta(hours=-3),
+    }
+
+
+def test_admin_addition_over_a_day_stays_on_one_day():
+    batch = make_batch((dt(2000, 1, 1), dt(2000, 1, 1) + timedelta(days=2)))
+    assert utils.split_by_day(batch) == {
+        (date(2000, 1, 1), 2, "work"): timedelta(days=2),
+    }
@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime as dt
+
+from cogs import utils
+
+from .postgres import requires_postgres, scratch_database
+
+
+pytestmark = requires_postgres
+
+
+async def clock(conn, mask: str) -> None:
+    await conn.execute(
+        """
+        INSERT INTO
+            clock_ins
+            (
+                guild_id,
+                user_id,
+                mask,
+                clock_in,
+                clock_out
+            )
+        VALUES
+            (
+                1,
+                2,
+                $1,
+                $2,
+                $3
+            )
+        """,
+        mask,
+        dt(2024, 1, 10, 9),
+        dt(2024, 1, 10, 9, 30),
+    )
+
+
+def test_snapshot_keeps_events_that_commit_out_of_order():
+
+    async def run():
+        async with scratch_database() as connect:
+            first, second = await connect(), await connect()
+
+            # The second transaction starts first, but the first's write is
+            # given the lower event ID and commits after a snapshot pass.
+            # They're on different masks so that they don't wait on the
+            # same totals
+            second_transaction = second.transaction()
+            await second_transaction.start()
+            await second.fetchval("SELECT TXID_CURRENT()")
+            first_transaction = first.transaction()
+            await first_transaction.start()
+            await clock(first, "work")
+            await clock(second, "break")
+            await second_transaction.commit()
+            after = await utils.ClockEventLog.take_snapshots(second, 0)
+            assert after > 0
+            snapshot = await second.fetchrow("SELECT * FROM clock_event_snapshots")
+            assert snapshot['event_id'] == 2
+            await first_transaction.commit()
+
+            state = await utils.ClockEventLog.get_state(second, 1, 2)
+            assert state.totals == {"work": 1_800, "break": 1_800}
+
+            # Both have settled by the next pass
+            assert await utils.ClockEventLog.take_snapshots(second, after) > after
+            snapshot = await second.fetchrow("SELECT * FROM clock_event_snapshots")
+            assert snapshot['event_id'] == 2
+            state = await utils.ClockEventLog.get_state(second, 1, 2)
+            assert state.totals == {"work": 1_800, "break": 1_800}
+
+    asyncio.run(run())
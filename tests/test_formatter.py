@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+import pytest
+
+from cogs import utils
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("8h", timedelta(hours=8)),
+    ("1d 2h 30m", timedelta(days=1, hours=2, minutes=30)),
+    ("-2h", timedelta(hours=-2)),
+    ("0s", timedelta(0)),
+])
+def test_parse_duration(value, expected):
+    assert utils.parse_duration(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", "abc", "8 hours", "5", "2h and a bit"])
+def test_parse_duration_rejects_invalid(value):
+    assert utils.parse_duration(value) is None
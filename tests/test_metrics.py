@@ -0,0 +1,73 @@
+import asyncio
+import types
+
+import pytest
+
+from cogs import utils
+
+
+class _Stats:
+
+    def __init__(self):
+        self.sent: list[tuple] = []
+        self.connections = 0
+
+    def __call__(self):
+        self.connections += 1
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        return None
+
+    def histogram(self, name, value, tags):
+        self.sent.append((name, value, tags))
+
+    def increment(self, name, tags):
+        self.sent.append((name, 1, tags))
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    stats = _Stats()
+    monkeypatch.setattr(utils.Metrics, "bot", types.SimpleNamespace(stats=stats))
+    utils.Metrics._pending.clear()
+    yield stats
+    utils.Metrics._pending.clear()
+
+
+def test_timed_calls_are_buffered_and_flushed_together(stats):
+
+    @utils.Metrics.timed("query")
+    async def query():
+        return [1, 2, 3]
+
+    async def run():
+        for _ in range(5):
+            assert await query() == [1, 2, 3]
+        assert stats.connections == 0
+        await utils.Metrics.flush()
+        assert stats.connections == 1
+        await utils.Metrics.flush()
+        assert stats.connections == 1
+
+    asyncio.run(run())
+    rows = [i for i in stats.sent if i[0] == "clocker.query.rows"]
+    assert [i[1] for i in rows] == [3] * 5
+
+
+def test_errors_are_counted(stats):
+
+    @utils.Metrics.timed("query")
+    async def query():
+        raise ValueError()
+
+    async def run():
+        with pytest.raises(ValueError):
+            await query()
+        await utils.Metrics.flush()
+
+    asyncio.run(run())
+    assert [i[0] for i in stats.sent if i[0].endswith(".errors")] == ["clocker.query.errors"]
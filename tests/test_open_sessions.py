@@ -0,0 +1,36 @@
+from datetime import datetime as dt
+
+import pytest
+
+from cogs import utils
+
+
+@pytest.fixture(autouse=True)
+def empty_index():
+    utils.OpenSessionIndex.load([])
+    yield
+    utils.OpenSessionIndex.load([])
+
+
+def test_masks_are_case_insensitive():
+    clock_in = utils.ClockIn(None, 1, 2, "Work", dt(2024, 1, 1))
+    utils.OpenSessionIndex.apply(clock_in)
+
+    latest = utils.OpenSessionIndex.get_latest(1, 2, "work")
+    assert latest is not None and latest.id == clock_in.id
+    assert [i.id for i in utils.OpenSessionIndex.get_current(1, 2)] == [clock_in.id]
+
+
+def test_changing_the_mask_moves_the_session():
+    clock_in = utils.ClockIn(None, 1, 2, "work", dt(2024, 1, 1))
+    utils.OpenSessionIndex.apply(clock_in)
+    clock_in.mask = "break"
+    utils.OpenSessionIndex.apply(clock_in)
+
+    assert utils.OpenSessionIndex.get_latest(1, 2, "work") is None
+    assert utils.OpenSessionIndex.get_latest(1, 2, "break") is not None
+    assert len(utils.OpenSessionIndex.get_current(1, 2)) == 1
+
+    clock_in.clocked_out_at = dt(2024, 1, 1, 1)
+    utils.OpenSessionIndex.apply(clock_in)
+    assert utils.OpenSessionIndex.get_current(1, 2) == []
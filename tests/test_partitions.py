@@ -0,0 +1,54 @@
+import asyncio
+from datetime import date, datetime as dt
+
+from cogs import utils
+
+from .postgres import requires_postgres, scratch_database
+
+
+pytestmark = requires_postgres
+
+
+def test_dropped_partitions_leave_the_rollups():
+
+    async def run():
+        async with scratch_database() as connect:
+            conn = await connect()
+            await conn.execute("SELECT clock_ins_create_partition($1)", date(2024, 1, 1))
+            await conn.execute(
+                """
+                INSERT INTO
+                    clock_ins
+                    (
+                        guild_id,
+                        user_id,
+                        mask,
+                        clock_in,
+                        clock_out
+                    )
+                VALUES
+                    (
+                        1,
+                        2,
+                        'work',
+                        $1,
+                        $2
+                    )
+                """,
+                dt(2024, 1, 10, 9),
+                dt(2024, 1, 10, 10),
+            )
+
+            dropped = await utils.drop_expired_partitions(conn, 1, now=dt(2024, 6, 1))
+            assert dropped == ["clock_ins_y2024m01"]
+
+            assert await conn.fetchval(
+                "SELECT COALESCE(SUM(total_seconds), 0) FROM clock_daily_totals",
+            ) == 0
+            assert await conn.fetchval(
+                "SELECT COALESCE(SUM(total_seconds), 0) FROM clock_leaderboard_totals",
+            ) == 0
+            state = await utils.ClockEventLog.get_state(conn, 1, 2)
+            assert state.totals == {"work": 0}
+
+    asyncio.run(run())
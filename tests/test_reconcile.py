@@ -0,0 +1,60 @@
+import asyncio
+from datetime import datetime as dt
+
+from cogs.utils.migrations import reconcile_daily_totals
+
+from .postgres import requires_postgres, scratch_database
+
+
+pytestmark = requires_postgres
+
+
+async def clock(conn, hour: int) -> None:
+    await conn.execute(
+        """
+        INSERT INTO
+            clock_ins
+            (
+                guild_id,
+                user_id,
+                mask,
+                clock_in,
+                clock_out
+            )
+        VALUES
+            (
+                1,
+                2,
+                'work',
+                $1,
+                $2
+            )
+        """,
+        dt(2024, 1, 10, hour),
+        dt(2024, 1, 10, hour, 30),
+    )
+
+
+def test_reconcile_waits_for_writes_in_flight():
+
+    async def run():
+        async with scratch_database() as connect:
+            writer, reconciler = await connect(), await connect()
+
+            # A second clock in on the same day is written but not committed
+            # when the reconcile starts
+            await clock(writer, 9)
+            transaction = writer.transaction()
+            await transaction.start()
+            await clock(writer, 11)
+            reconcile = asyncio.create_task(reconcile_daily_totals(reconciler, 1))
+            await asyncio.sleep(0.2)
+            await transaction.commit()
+            await reconcile
+
+            total = await writer.fetchval(
+                "SELECT SUM(total_seconds) FROM clock_daily_totals",
+            )
+            assert total == 3_600
+
+    asyncio.run(run())
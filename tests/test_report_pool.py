@@ -0,0 +1,38 @@
+import asyncio
+import os
+import pathlib
+import threading
+
+from cogs import utils
+
+
+def die_once(marker: str) -> int:
+    path = pathlib.Path(marker)
+    if not path.exists():
+        path.touch()
+        os._exit(1)
+    return os.getpid()
+
+
+def test_retries_work_when_a_worker_dies(tmp_path):
+
+    async def run():
+        utils.ReportPool.configure(enabled=True, max_workers=1)
+        try:
+            pid = await utils.ReportPool.run(die_once, str(tmp_path / "died"))
+        finally:
+            utils.ReportPool.configure(enabled=False)
+        assert pid != os.getpid()
+        assert (tmp_path / "died").exists()
+
+    asyncio.run(run())
+
+
+def test_runs_on_a_thread_when_disabled():
+
+    async def run():
+        utils.ReportPool.configure(enabled=False)
+        thread = await utils.ReportPool.run(threading.get_ident)
+        assert thread != threading.get_ident()
+
+    asyncio.run(run())
@@ -0,0 +1,289 @@
+import asyncio
+from datetime import datetime as dt
+import logging
+import types
+import uuid
+
+import pytest
+
+from benchmarks.standin import StandInDatabase
+from cogs import utils
+from cogs.cache_sync import CacheSync
+from cogs.utils import shared_cache
+from cogs.utils.models import queries
+
+from .redis_standin import StandInRedis
+
+
+OTHER_ORIGIN = uuid.uuid4().hex
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = StandInRedis()
+    clock = types.SimpleNamespace(now=1_000.0)
+    monkeypatch.setattr(shared_cache, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    monkeypatch.setattr(utils.SharedCache, "recovered_listeners", [])
+    monkeypatch.setattr(utils.ClockIn, "_write_listeners", [])
+    utils.SharedCache.setup(True, redis)
+    utils.OpenSessionIndex.load([])
+    redis.clock = clock
+    yield redis
+    utils.SharedCache.setup(False)
+    utils.SharedCache._unavailable_until = None
+    utils.MaskRegistry.invalidate_all()
+
+
+def make_bot(redis: StandInRedis):
+    async def wait_until_ready():
+        return
+
+    return types.SimpleNamespace(
+        config={"redis": {"enabled": True}},
+        loop=asyncio.get_running_loop(),
+        logger=logging.getLogger("bot"),
+        wait_until_ready=wait_until_ready,
+    )
+
+
+async def settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def make_clock_in(clocked_out_at=None) -> utils.ClockIn:
+    return utils.ClockIn(uuid.uuid4(), 1, 2, "work", dt(2024, 1, 1), clocked_out_at)
+
+
+def test_writes_reach_other_processes(redis, monkeypatch):
+
+    async def run():
+        monkeypatch.setattr(utils.SharedCache, "setup", lambda *_: None)
+        cog = CacheSync(make_bot(redis))
+        try:
+            await settle()
+            assert redis.subscribers[utils.SharedCache.CHANNEL]
+
+            # Our own writes are published, and ignored when they come back
+            clock_in = make_clock_in()
+            utils.ClockIn.written(clock_in)
+            await asyncio.gather(*utils.SharedCache._publish_tasks)
+            assert len(redis.published) == 1
+            assert redis.published[0]["origin"] == utils.SharedCache.ORIGIN
+            await settle()
+            assert utils.OpenSessionIndex.get_latest(1, 2, "work") is not None
+
+            # Another process's writes are applied, but not published again
+            other = make_clock_in()
+            other.user_id = 3
+            async with redis() as re:
+                await re.conn.publish_json(utils.SharedCache.CHANNEL, {
+                    "kind": "clock_in",
+                    "origin": OTHER_ORIGIN,
+                    "clock_in": utils.SharedCache.dump_clock_in(other),
+                })
+            await settle()
+            latest = utils.OpenSessionIndex.get_latest(1, 3, "work")
+            assert latest is not None and latest.id == other.id
+            assert len(redis.published) == 2
+
+            # And closing it elsewhere closes it here
+            other.clocked_out_at = dt(2024, 1, 1, 8)
+            utils.SharedCache.handle_message({
+                "kind": "clock_in",
+                "origin": OTHER_ORIGIN,
+                "clock_in": utils.SharedCache.dump_clock_in(other),
+            })
+            assert utils.OpenSessionIndex.get_latest(1, 3, "work") is None
+
+            # Mask writes drop the guild from the cache
+            utils.MaskRegistry._cache[1] = utils.mask_registry._GuildMasks({4: ["work"]})
+            utils.SharedCache.handle_message({"kind": "masks", "guild_id": 1, "origin": OTHER_ORIGIN})
+            assert 1 not in utils.MaskRegistry._cache
+        finally:
+            cog.cog_unload()
+            redis.close()
+
+    asyncio.run(run())
+
+
+def test_falls_back_to_postgres_while_unreachable(redis):
+    open_row = {
+        "id": uuid.uuid4(),
+        "guild_id": 1,
+        "user_id": 2,
+        "mask": "work",
+        "clock_in": dt(2024, 1, 1),
+        "clock_out": None,
+    }
+
+    def router(query: str, _) -> list:
+        if query == queries.GET_OPEN_SESSIONS_FOR_USER.sql:
+            return [open_row]
+        if query == queries.GET_GUILD_MASKS.sql:
+            return [{"role_id": 4, "mask": "work"}]
+        raise AssertionError(query)
+
+    async def run():
+        db = StandInDatabase(router)
+        redis.down = True
+        assert await utils.SharedCache.get("masks:1") is None
+        assert utils.SharedCache.degraded()
+
+        # Redis is left alone until the retry time is up
+        connections = redis.connections
+        await utils.SharedCache.set("masks:1", {}, 300)
+        await utils.SharedCache.publish({"kind": "masks", "guild_id": 1})
+        assert redis.connections == connections
+
+        # Everything is read from the database in the meantime
+        current = await utils.ClockIn.get_current(db, 1, 2)
+        assert [i.id for i in current] == [str(open_row["id"])]
+        latest = await utils.ClockIn.get_latest(db, 1, 2, "work")
+        assert latest is not None and latest.id == str(open_row["id"])
+        assert await utils.MaskRegistry.get(1, db) == {4: ["work"]}
+        assert 1 not in utils.MaskRegistry._cache
+
+        # It's tried again once the retry time is up
+        redis.clock.now += utils.SharedCache.RETRY_AFTER
+        assert utils.SharedCache.available()
+        redis.down = False
+        assert await utils.MaskRegistry.get(1, db) == {4: ["work"]}
+        assert not utils.SharedCache.degraded()
+        assert redis.expiry["clocker:masks:1"] == utils.MaskRegistry.SHARED_TTL
+
+    asyncio.run(run())
+
+
+def test_recovery_resyncs(redis, monkeypatch):
+    resynced: list[str] = []
+
+    async def hydrate(*_, force=False):
+        resynced.append(f"hydrate force={force}")
+
+    async def rebuild(*_):
+        resynced.append("rebuild")
+
+    monkeypatch.setattr(utils.ClockIn, "hydrate_open_sessions", hydrate)
+    monkeypatch.setattr(utils.AutoClockOut, "rebuild", rebuild)
+
+    async def run():
+        monkeypatch.setattr(utils.SharedCache, "setup", lambda *_: None)
+        cog = CacheSync(make_bot(redis))
+        try:
+            utils.MaskRegistry._cache[1] = utils.mask_registry._GuildMasks({4: ["work"]})
+            redis.down = True
+            assert not await utils.SharedCache.ping()
+            assert resynced == []
+
+            # Nothing happens until Redis can be reached again
+            redis.clock.now += utils.SharedCache.RETRY_AFTER
+            assert not await utils.SharedCache.ping()
+            redis.clock.now += utils.SharedCache.RETRY_AFTER
+            redis.down = False
+            assert await utils.SharedCache.ping()
+            assert cog.resync_task is not None
+            await cog.resync_task
+            assert resynced == ["hydrate force=True", "rebuild"]
+            assert 1 not in utils.MaskRegistry._cache
+
+            # And it only happens once
+            assert await utils.SharedCache.ping()
+            assert cog.resync_task.done()
+            assert resynced == ["hydrate force=True", "rebuild"]
+        finally:
+            cog.cog_unload()
+            redis.close()
+
+    asyncio.run(run())
+
+
+async def publish_from_other_process(redis: StandInRedis, clock_in: utils.ClockIn) -> None:
+    async with redis() as re:
+        await re.conn.publish_json(utils.SharedCache.CHANNEL, {
+            "kind": "clock_in",
+            "origin": OTHER_ORIGIN,
+            "clock_in": utils.SharedCache.dump_clock_in(clock_in),
+        })
+
+
+def test_resubscribes_after_losing_the_subscription(redis, monkeypatch):
+
+    async def hydrate(*_, **__):
+        return
+
+    async def rebuild(*_):
+        return
+
+    monkeypatch.setattr(utils.ClockIn, "hydrate_open_sessions", hydrate)
+    monkeypatch.setattr(utils.AutoClockOut, "rebuild", rebuild)
+
+    async def run():
+        monkeypatch.setattr(utils.SharedCache, "setup", lambda *_: None)
+        cog = CacheSync(make_bot(redis))
+        try:
+            await settle()
+            assert redis.subscribers[utils.SharedCache.CHANNEL]
+
+            # The subscription dropping means writes could go unheard
+            redis.close()
+            await settle()
+            assert cog.listen_task is not None and cog.listen_task.done()
+            assert utils.SharedCache.degraded()
+
+            # Once Redis is found again, we subscribe again
+            redis.clock.now += utils.SharedCache.RETRY_AFTER
+            assert await utils.SharedCache.ping()
+            assert cog.resync_task is not None
+            await cog.resync_task
+            assert redis.subscribers[utils.SharedCache.CHANNEL]
+
+            # And hear about writes made after that
+            other = make_clock_in()
+            await publish_from_other_process(redis, other)
+            await settle()
+            latest = utils.OpenSessionIndex.get_latest(1, 2, "work")
+            assert latest is not None and latest.id == other.id
+        finally:
+            cog.cog_unload()
+            redis.close()
+
+    asyncio.run(run())
+
+
+def test_subscribes_once_redis_comes_up(redis, monkeypatch):
+
+    async def hydrate(*_, **__):
+        return
+
+    async def rebuild(*_):
+        return
+
+    monkeypatch.setattr(utils.ClockIn, "hydrate_open_sessions", hydrate)
+    monkeypatch.setattr(utils.AutoClockOut, "rebuild", rebuild)
+
+    async def run():
+        monkeypatch.setattr(utils.SharedCache, "setup", lambda *_: None)
+        redis.down = True
+        cog = CacheSync(make_bot(redis))
+        try:
+            await settle()
+            assert not redis.subscribers
+            assert utils.SharedCache.degraded()
+
+            # Redis coming up subscribes, and writes are heard from then on
+            redis.clock.now += utils.SharedCache.RETRY_AFTER
+            redis.down = False
+            assert await utils.SharedCache.ping()
+            assert cog.resync_task is not None
+            await cog.resync_task
+            other = make_clock_in()
+            await publish_from_other_process(redis, other)
+            await settle()
+            latest = utils.OpenSessionIndex.get_latest(1, 2, "work")
+            assert latest is not None and latest.id == other.id
+        finally:
+            cog.cog_unload()
+            redis.close()
+
+    asyncio.run(run())
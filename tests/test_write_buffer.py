@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime as dt
+import uuid
+
+import pytest
+
+from cogs import utils
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+    written: list[list[str]] = []
+    failing: set[str] = set()
+
+    async def upsert(clock_ins):
+        if any(i.id in failing for i in clock_ins):
+            raise ValueError("Failed to write")
+        written.append([i.id for i in clock_ins])
+
+    async def hydrate(*_, **__):
+        utils.OpenSessionIndex.load([])
+
+    monkeypatch.setattr(utils.ClockInWriteBuffer, "_upsert", staticmethod(upsert))
+    monkeypatch.setattr(utils.ClockIn, "hydrate_open_sessions", hydrate)
+    utils.ClockInWriteBuffer.configure(enabled=True, max_delay=0.01)
+    utils.OpenSessionIndex.load([])
+    yield written, failing
+    utils.ClockInWriteBuffer.configure(enabled=False)
+
+
+def make_clock_in(user_id: int) -> utils.ClockIn:
+    return utils.ClockIn(None, 1, user_id, "work", dt(2024, 1, 1))
+
+
+def test_listeners_are_told_after_commit(buffer):
+    written, _ = buffer
+    heard: list[str] = []
+
+    async def run():
+        clock_in = make_clock_in(2)
+        task = asyncio.create_task(utils.ClockInWriteBuffer.write(clock_in))
+        await asyncio.sleep(0)
+        assert utils.OpenSessionIndex.get_latest(1, 2, "work") is not None
+        assert heard == []
+        await task
+        assert written == [[clock_in.id]]
+        assert heard == [clock_in.id]
+
+    utils.ClockIn.add_write_listener(lambda i: heard.append(i.id))
+    try:
+        asyncio.run(run())
+    finally:
+        utils.ClockIn._write_listeners.clear()
+
+
+def test_failed_writes_are_not_told(buffer):
+    _, failing = buffer
+    heard: list[str] = []
+
+    async def run():
+        good, bad = make_clock_in(2), make_clock_in(3)
+        failing.add(bad.id)
+        results = await asyncio.gather(
+            utils.ClockInWriteBuffer.write(good),
+            utils.ClockInWriteBuffer.write(bad),
+            return_exceptions=True,
+        )
+        assert results[0] is None
+        assert isinstance(results[1], ValueError)
+        assert heard == [good.id]
+        assert utils.OpenSessionIndex.get_latest(1, 3, "work") is None
+
+    utils.ClockIn.add_write_listener(lambda i: heard.append(i.id))
+    try:
+        asyncio.run(run())
+    finally:
+        utils.ClockIn._write_listeners.clear()
+
+
+def test_clock_in_after_pending_clock_out(buffer, monkeypatch):
+    written, _ = buffer
+    old_id, new_id = str(uuid.uuid4()), str(uuid.uuid4())
+    open_keys = {(1, 2, "work")}
+    order: list[str] = []
+
+    async def upsert(clock_ins):
+        order.append("upsert")
+        written.append([i.id for i in clock_ins])
+        for i in clock_ins:
+            if i.clocked_out_at is not None:
+                open_keys.discard((i.guild_id, i.user_id, i.mask))
+
+    async def open_(opens):
+        order.append("open")
+        rows = []
+        for i in opens:
+            key = (i.guild_id, i.user_id, i.mask)
+            created = key not in open_keys
+            open_keys.add(key)
+            rows.append({
+                "allowed": True,
+                "id": new_id if created else None,
+                "guild_id": i.guild_id,
+                "user_id": i.user_id,
+                "mask": i.mask,
+                "clock_in": i.clocked_in_at,
+                "clock_out": None,
+            })
+        return rows
+
+    monkeypatch.setattr(utils.ClockInWriteBuffer, "_upsert", staticmethod(upsert))
+    monkeypatch.setattr(utils.ClockInWriteBuffer, "_open", staticmethod(open_))
+
+    async def run():
+        current = make_clock_in(2)
+        current.id = old_id
+        utils.OpenSessionIndex.apply(current)
+
+        # Clock out and straight back in, within the same flush window
+        closing = make_clock_in(2)
+        closing.id = old_id
+        closing.clocked_out_at = dt(2024, 1, 1, 9)
+        close = asyncio.create_task(utils.ClockInWriteBuffer.write(closing))
+        await asyncio.sleep(0)
+        assert utils.OpenSessionIndex.get_latest(1, 2, "work") is None
+        allowed, clock_in = await utils.ClockInWriteBuffer.open_session(
+            1, 2, [4], "work", dt(2024, 1, 1, 10),
+        )
+        await close
+
+        assert order == ["upsert", "open"]
+        assert allowed and clock_in is not None and clock_in.id == new_id
+        latest = utils.OpenSessionIndex.get_latest(1, 2, "work")
+        assert latest is not None and latest.id == new_id
+
+    asyncio.run(run())
@@ -0,0 +1,60 @@
+import asyncio
+import contextlib
+from datetime import datetime as dt
+
+import pytest
+
+from cogs import utils
+from cogs.utils.models import queries
+
+from .postgres import requires_postgres, scratch_database
+
+
+pytestmark = requires_postgres
+
+
+@pytest.fixture
+def buffer():
+    utils.ClockInWriteBuffer.configure(enabled=True, max_delay=0.05)
+    utils.OpenSessionIndex.load([])
+    yield
+    utils.ClockInWriteBuffer.configure(enabled=False)
+    utils.OpenSessionIndex.load([])
+
+
+def test_clock_in_after_pending_clock_out(buffer, monkeypatch):
+
+    async def run():
+        async with scratch_database() as connect:
+            conn = await connect()
+
+            @contextlib.asynccontextmanager
+            async def acquire(db=None):
+                yield db or conn
+
+            monkeypatch.setattr(queries, "acquire", acquire)
+            await conn.execute(
+                "INSERT INTO clock_masks (guild_id, role_id, mask) VALUES (1, 4, 'work')",
+            )
+            allowed, first = await utils.ClockIn.open_session(
+                conn, 1, 2, [4], "work", dt(2024, 1, 1, 9),
+            )
+            assert allowed and first is not None
+
+            # Clock out and straight back in, within the same flush window
+            closed, (allowed, second) = await asyncio.gather(
+                utils.ClockIn.close_session(conn, 1, 2, "work", dt(2024, 1, 1, 10)),
+                utils.ClockIn.open_session(conn, 1, 2, [4], "work", dt(2024, 1, 1, 11)),
+            )
+            assert closed is not None and closed.id == first.id
+            assert allowed and second is not None and second.id != first.id
+
+            # And clocking in again while clocked in is still turned away
+            allowed, third = await utils.ClockIn.open_session(
+                conn, 1, 2, [4], "work", dt(2024, 1, 1, 12),
+            )
+            assert allowed and third is None
+            rows = await conn.fetch("SELECT id FROM clock_ins_open_sessions")
+            assert [str(i['id']) for i in rows] == [second.id]
+
+    asyncio.run(run())